@@ -23,11 +23,17 @@
     'data' : [
         'views/views.xml',
         'views/views_bind_unbind.xml',
+        'views/views_bind_import.xml',
+        'views/views_binding.xml',
         'views/views_esl_template.xml',
+        'views/views_sync_run.xml',
+        'views/views_job.xml',
+        'views/views_api_metric.xml',
         'views/views_menu.xml',
         'data/ir_cron.xml',
         'data/esl_data.xml',
         'security/ir.model.access.csv',
+        'security/esl_security.xml',
    ],
 
     # ✅ Hooks
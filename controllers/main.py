@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+from odoo import http, fields
+from odoo.http import request
+from odoo.tools import config
+from datetime import datetime, timedelta
+import csv
+import io
+import os
+import re
+import zlib
+import logging
+_logger = logging.getLogger(__name__)
+
+# Préfixe des lignes de log émises par le module
+ESL_LOG_TAG = b"[Hpharma ESL]"
+# Taille maximale lue depuis la fin du fichier, en octets
+LOG_MAX_TAIL = 200 * 1024 * 1024
+LOG_DEFAULT_TAIL = 20 * 1024 * 1024
+# Taille des blocs lus et envoyés au navigateur
+LOG_CHUNK = 64 * 1024
+# Colonnes de l'export des métriques API
+METRIC_EXPORT_FIELDS = [
+    "period", "endpoint", "calls", "errors", "avg_ms", "max_ms", "total_ms", "bytes_sent", "items", "last_status",
+]
+# Horodatage en début de ligne d'un log Odoo : "2025-01-31 12:34:56,789"
+LOG_TIMESTAMP = re.compile(rb"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}")
+
+
+def iter_log_lines(log_path, tail, since=None, esl_only=True):
+    """
+    Générateur des lignes des `tail` derniers octets du fichier de log.
+
+    Les lignes sans horodatage (traceback, suite d'un message) suivent le
+    sort de la ligne horodatée qui les précède.
+
+    Paramètres:
+        log_path (str): chemin du fichier de log
+        tail (int): nombre d'octets lus depuis la fin du fichier
+        since (datetime): ignore les lignes antérieures (heure locale du serveur)
+        esl_only (bool): ne garde que les lignes du module ([Hpharma ESL])
+
+    Retour:
+        generator: lignes (bytes)
+    """
+    cutoff = since.strftime("%Y-%m-%d %H:%M:%S").encode() if since else None
+    with open(log_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        start = max(0, size - tail)
+        f.seek(start)
+        if start:
+            f.readline()  # première ligne tronquée
+        keep = False
+        for line in f:
+            if f.tell() > size:
+                # Lignes écrites pendant le téléchargement : hors de la fenêtre demandée
+                break
+            if LOG_TIMESTAMP.match(line):
+                keep = (cutoff is None or line[:19] >= cutoff) and (not esl_only or ESL_LOG_TAG in line)
+            if keep:
+                yield line
+
+
+def iter_chunks(lines, compress=True):
+    """Regroupe les lignes en blocs de LOG_CHUNK octets, compressés en gzip si demandé."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer, buffered = [], 0
+    for line in lines:
+        buffer.append(line)
+        buffered += len(line)
+        if buffered >= LOG_CHUNK:
+            data = b"".join(buffer)
+            buffer, buffered = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = b"".join(buffer)
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+class EslController(http.Controller):
+
+    @http.route("/hpharma_esl/log", type="http", auth="user", methods=["GET"])
+    def download_log(self, tail=None, hours=None, esl_only="1", gzip="1", **kwargs):
+        """
+        Télécharge la fin du fichier odoo.log, en flux, sans le charger en mémoire.
+
+        Paramètres (URL):
+            tail: nombre d'octets lus depuis la fin du fichier (défaut 20 Mo, max 200 Mo)
+            hours: ne garde que les lignes des N dernières heures
+            esl_only: "1" pour ne garder que les lignes [Hpharma ESL] (défaut)
+            gzip: "1" pour une réponse compressée (défaut)
+        """
+        if not request.env.user.has_group("base.group_system"):
+            return request.not_found()
+        log_path = config["logfile"]
+        if not log_path or not os.path.isfile(log_path):
+            return request.not_found()
+
+        try:
+            tail = min(max(int(tail), 1), LOG_MAX_TAIL) if tail else LOG_DEFAULT_TAIL
+            since = datetime.now() - timedelta(hours=float(hours)) if hours else None
+        except ValueError:
+            return request.make_response("Paramètres invalides.", status=400)
+        esl_only = esl_only == "1"
+        compress = gzip == "1"
+
+        filename = "odoo_esl.log" if esl_only else "odoo.log"
+        headers = [
+            ("Content-Type", "application/gzip" if compress else "text/plain; charset=utf-8"),
+            ("Content-Disposition", f'attachment; filename="{filename}{".gz" if compress else ""}"'),
+            ("Cache-Control", "no-store"),
+        ]
+        _logger.info(
+            "[Hpharma ESL] Téléchargement du log par %s (%d octets, %s h, filtre ESL : %s).",
+            request.env.user.login, tail, hours or "-", esl_only,
+        )
+        lines = iter_log_lines(log_path, tail, since=since, esl_only=esl_only)
+        return request.make_response(iter_chunks(lines, compress), headers=headers)
+
+    @http.route("/hpharma_esl/metrics.csv", type="http", auth="user", methods=["GET"])
+    def export_metrics(self, days="30", esl_id=None, **kwargs):
+        """
+        Exporte les métriques de l'API ESL au format CSV (une ligne par endpoint et par heure).
+
+        Paramètres (URL):
+            days: nombre de jours exportés (défaut 30)
+            esl_id: limite l'export à une connexion ESL
+        """
+        try:
+            since = fields.Datetime.now() - timedelta(days=int(days))
+            domain = [("period", ">=", since)]
+            if esl_id:
+                domain.append(("esl_id", "=", int(esl_id)))
+        except ValueError:
+            return request.make_response("Paramètres invalides.", status=400)
+        # Contrôle d'accès standard (ACL et règles) sur esl.api.metric. Les lignes
+        # étant agrégées par heure, l'export tient en mémoire : il est construit
+        # avant de rendre la main (le curseur de la requête est fermé ensuite).
+        metrics = request.env["esl.api.metric"].search(domain, order="period, endpoint")
+        output = io.StringIO()
+        writer = csv.writer(output, delimiter=";")
+        writer.writerow(["connexion"] + METRIC_EXPORT_FIELDS)
+        for metric in metrics:
+            writer.writerow([metric.esl_id.display_name] + [metric[f] for f in METRIC_EXPORT_FIELDS])
+
+        headers = [
+            ("Content-Type", "text/csv; charset=utf-8"),
+            ("Content-Disposition", 'attachment; filename="esl_api_metrics.csv"'),
+            ("Cache-Control", "no-store"),
+        ]
+        return request.make_response(output.getvalue().encode("utf-8-sig"), headers=headers)
@@ -1,4 +1,14 @@
 from . import esl
 from . import esl_transient
 from . import esl_template
+from . import esl_product_sync
+from . import esl_outbox
+from . import esl_sync_run
+from . import esl_store
+from . import esl_bind_import
+from . import esl_binding
+from . import esl_job
+from . import esl_api_metric
+from . import esl_token
+from . import product
 from . import hooks
\ No newline at end of file
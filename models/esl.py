@@ -1,18 +1,53 @@
 from odoo import models, fields, api
-import requests, base64, json, http, os
-from odoo.exceptions import ValidationError
-from odoo.exceptions import UserError
+import base64, json, os, hashlib, math, threading, time
+from functools import lru_cache
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from odoo.exceptions import UserError, ValidationError
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives.asymmetric import padding
-from odoo.tools import config
-from datetime import timedelta
-# --------------------------
-# Cache global des stores test git
-# --------------------------
+from odoo.tools import config, split_every
+from odoo.tools.safe_eval import safe_eval, datetime as safe_datetime, dateutil, time as safe_time
+from datetime import datetime, timedelta, timezone
+from . import esl_api
+from .esl_batching import AdaptiveBatchSizer, FixedBatchSizer, DEFAULT_MAX_BYTES, DEFAULT_TARGET_LATENCY
 import logging
 _logger = logging.getLogger(__name__)
-_cached_stores_global = []
+
+# Champs produit lus pour construire les articles ESL
+ESL_PRODUCT_FIELDS = ["barcode", "default_code", "name", "list_price"]
+# Nombre de produits lus (et gardés en cache ORM) à la fois
+ESL_PRODUCT_CHUNK = 1000
+# Attributs toujours envoyés en mode compact, même vides : l'étiquette doit
+# pouvoir effacer une valeur affichée précédemment (fin de promotion)
+ESL_CLEARABLE_ATTRIBUTES = {"barCode", "promotionText"}
+# Plafond du nombre de batches envoyés simultanément, pour protéger l'API
+MAX_UPLOAD_WORKERS = 8
+# Nombre maximal de produits de la file d'attente traités par passage
+ESL_OUTBOX_LIMIT = 5000
+# Attente maximale d'un appel interactif (liaison, scan) sur la limite de débit, en secondes
+INTERACTIVE_RATE_MAX_WAIT = 10
+# Durée de validité d'un token ESL et marge de renouvellement anticipé
+TOKEN_LIFETIME = timedelta(hours=2)
+TOKEN_REFRESH_MARGIN = timedelta(minutes=10)
+# Un seul renouvellement de token à la fois par connexion dans le processus : (base, id) → verrou
+_token_locks = {}
+# Tokens renouvelés par ce processus : (base, id connexion) → (token, expiration). Une
+# transaction ouverte avant le renouvellement (validé à part) lit encore l'ancien token
+_refreshed_tokens = {}
+
+
+def _token_fresh(token, expiration):
+    """Vrai si le token est présent et valide au-delà de la marge de renouvellement."""
+    return bool(token and expiration and expiration - TOKEN_REFRESH_MARGIN > fields.Datetime.now())
+
+
+@lru_cache(maxsize=8)
+def _load_public_key(pem):
+    """Charge (une seule fois par processus) la clé publique PEM de l'API."""
+    return serialization.load_pem_public_key(pem.encode("utf-8"), backend=default_backend())
+
 
 class Esl(models.Model):
     """
@@ -26,7 +61,10 @@ class Esl(models.Model):
     """
     _name = "esl.esl"
     _description = "Hpharma ESL Connection"
-    name = fields.Char(default="Paramètres ESL")
+    name = fields.Char("Nom", default="Paramètres ESL", required=True,
+                       help="Nom de la configuration (pharmacie / store), affiché dans les assistants.")
+    active = fields.Boolean(default=True)
+    company_id = fields.Many2one("res.company", string="Société", default=lambda self: self.env.company)
     user_lang = fields.Char("Langue utilisateur", readonly=True)
 
     login = fields.Char("Login", required=True)
@@ -59,46 +97,119 @@ class Esl(models.Model):
         ('days', 'Jours'),
     ], string="Type d'intervalle", default='hours')
     cron_active = fields.Boolean("Activer la planification", default=False)
+    next_send_date = fields.Datetime(
+        "Prochain envoi automatique", readonly=True,
+        help="Le cron d'envoi automatique met en file l'envoi de cette configuration à partir de cette date.")
     product_batch = fields.Integer("lots de produits envoyées", default=10)
+    batch_mode = fields.Selection([
+        ('count', 'Nombre fixe'),
+        ('adaptive', 'Adaptatif'),
+    ], string="Taille des lots", default='count', required=True,
+        help="Adaptatif : chaque lot est plafonné en octets et sa taille (au plus product_batch) "
+             "est ajustée selon les temps de réponse et les erreurs de l'API.")
+    batch_max_bytes = fields.Integer("Taille maximale d'une requête (octets)", default=DEFAULT_MAX_BYTES)
+    batch_target_latency = fields.Float("Temps de réponse visé (s)", default=DEFAULT_TARGET_LATENCY)
+    adaptive_batch_size = fields.Integer(
+        "Taille de lot retenue", readonly=True,
+        help="Dernière taille de lot retenue en mode adaptatif, point de départ du prochain envoi.")
+    partition_size = fields.Integer(
+        "Taille des partitions", default=0,
+        help="Envoi du catalogue complet réparti en partitions de ce nombre de produits, envoyées "
+             "en parallèle par les workers du cron des partitions (0 = envoi séquentiel).")
+    upload_workers = fields.Integer(
+        "Envois simultanés", default=1,
+        help="Nombre de batches envoyés en parallèle vers l'API (plafonné à %d)." % MAX_UPLOAD_WORKERS)
     url_sendItem = fields.Char("url send items")
+    product_domain = fields.Char(
+        "Filtre produits", default="[]",
+        help="Domaine des produits envoyés par cette configuration (en plus de la société et du périmètre).")
+    product_scope = fields.Selection([
+        ('all', 'Tout le catalogue'),
+        ('bound', 'Produits étiquetés'),
+    ], string="Produits envoyés", default='all', required=True,
+        help="Produits étiquetés : seuls les produits liés à une étiquette (esl.binding) sont envoyés.")
+    sync_mode = fields.Selection([
+        ('delta', 'Différentiel'),
+        ('full', 'Complet'),
+    ], string="Mode d'envoi", default='delta', required=True,
+        help="Différentiel : seuls les produits nouveaux ou modifiés depuis le dernier envoi réussi sont envoyés.")
+    pricelist_id = fields.Many2one(
+        "product.pricelist", string="Liste de prix",
+        help="Prix normal affiché sur les étiquettes (vide = prix de vente du produit).")
+    promo_pricelist_id = fields.Many2one(
+        "product.pricelist", string="Liste de prix promotionnelle",
+        help="Si elle donne un prix inférieur au prix normal, celui-ci est barré (originalPrice) "
+             "et la remise est indiquée dans promotionText.")
+    payload_mode = fields.Selection([
+        ('full', 'Tous les attributs'),
+        ('compact', 'Compact'),
+    ], string="Format des articles", default='full', required=True,
+        help="Compact : seuls les attributs renseignés (ou ceux listés ci-dessous) sont envoyés.")
+    payload_attributes = fields.Char(
+        "Attributs envoyés",
+        help="Mode compact : attributs utilisés par les templates, séparés par des virgules "
+             "(ex. itemTitle,price,originalPrice,promotionText,stock1). Vide = attributs non vides.")
+    payload_gzip = fields.Boolean(
+        "Compresser les envois (gzip)",
+        help="Envoie le corps des requêtes ZK_sendItem compressé (Content-Encoding: gzip).")
+    # Réservé aux administrateurs : l'URL reçoit les identifiants et le token de la connexion
+    api_base_url = fields.Char(
+        "URL de l'API ESL", default=esl_api.DEFAULT_BASE_URL, required=True, groups="base.group_system")
+    api_connect_timeout = fields.Integer("Délai de connexion API (s)", default=esl_api.DEFAULT_CONNECT_TIMEOUT)
+    api_read_timeout = fields.Integer("Délai de réponse API (s)", default=esl_api.DEFAULT_READ_TIMEOUT)
+    api_max_retries = fields.Integer(
+        "Nouvelles tentatives API", default=esl_api.DEFAULT_MAX_RETRIES,
+        help="Nombre de nouvelles tentatives d'un batch en cas d'erreur transitoire (délai dépassé, 429, 5xx).")
+    api_retry_backoff = fields.Float(
+        "Délai initial entre tentatives (s)", default=esl_api.DEFAULT_RETRY_BACKOFF,
+        help="Doublé à chaque nouvelle tentative.")
+    rate_limit_bulk = fields.Float(
+        "Débit max des envois en masse (req/s)", default=5.0,
+        help="Envois de produits et imports de liaisons, tous workers confondus (0 = illimité). "
+             "Les envois attendent leur tour plutôt que de déclencher la limitation du fournisseur.")
+    rate_limit_interactive = fields.Float(
+        "Débit max des appels interactifs (req/s)", default=10.0,
+        help="Liaisons / déliaisons, connexion, templates : budget séparé pour rester réactif "
+             "pendant un envoi en masse (0 = illimité).")
+    breaker_threshold = fields.Integer(
+        "Échecs avant coupure", default=esl_api.DEFAULT_BREAKER_THRESHOLD,
+        help="Nombre d'échecs consécutifs (délai dépassé, connexion impossible, 5xx) "
+             "après lesquels les appels à l'API sont suspendus.")
+    breaker_cooldown = fields.Integer(
+        "Durée de coupure (s)", default=esl_api.DEFAULT_BREAKER_COOLDOWN,
+        help="Durée pendant laquelle les appels échouent immédiatement avant un appel de test.")
+    api_health = fields.Selection([
+        ('ok', 'Disponible'),
+        ('down', 'Indisponible'),
+    ], string="État de l'API", default='ok', readonly=True)
+    api_health_date = fields.Datetime("État de l'API depuis", readonly=True)
+    api_retry_at = fields.Datetime("Prochain essai de l'API", readonly=True)
     StoreId = fields.Selection(selection=lambda self: self._get_store_selection(), string="Store ID")
+    store_ids = fields.One2many("esl.store", "esl_id", string="Stores")
+    store_refresh_hours = fields.Integer(
+        "Rafraîchissement des stores (h)", default=24,
+        help="Durée après laquelle le cron récupère à nouveau la liste des stores (0 = jamais).")
+    store_ref_id = fields.Many2one(
+        "esl.store", string="Store", compute="_compute_store_ref_id", inverse="_inverse_store_ref_id",
+        domain="[('esl_id', '=', id)]", help="Store de cette configuration utilisé pour les envois (StoreId).")
+    stores_refreshed_at = fields.Datetime("Stores récupérés le", readonly=True)
+    # Incrémentée à chaque modification des stores : clé du cache de sélection des stores
+    stores_version = fields.Integer("Version des stores", readonly=True)
 
     # -------------------------------------------------------------
     #                      MÉTHODES DE BASE
     # -------------------------------------------------------------
 
-    @api.model
-    def create(self, vals):
-        # Si vals est une liste (création multiple depuis XML), itérer dessus
-        if isinstance(vals, list):
-            records = super().create(vals)
-            for val in vals:
-                cron = self.env.ref('module_HpharmaESLSystem.ir_cron_auto_send_products', raise_if_not_found=False)
-                if cron:
-                    cron.write({
-                        'interval_number': val.get('interval_number', 1),
-                        'interval_type': val.get('interval_type', 'hours'),
-                    })
-            return records
-
-        # Sinon, création simple
-        if self.search_count([]) >= 1:
-            raise ValidationError("Une seule instance de connexion est autorisée.")
-        
-        record = super().create(vals)
-        cron = self.env.ref('module_HpharmaESLSystem.ir_cron_auto_send_products', raise_if_not_found=False)
-        if cron:
-            cron.write({
-                'interval_number': vals.get('interval_number', 1),
-                'interval_type': vals.get('interval_type', 'hours'),
-            })
-        return record
-
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records.update_cron_schedule()
+        return records
 
     def write(self, vals):
         """
         Surcharge de la mise à jour d'un ESL.
-        Met à jour le cron si l'intervalle change.
+        Replanifie l'envoi automatique si la planification change.
 
         Paramètres:
             vals (dict): valeurs à mettre à jour
@@ -109,10 +220,21 @@ class Esl(models.Model):
         vals['user_lang'] = self.env.user.lang
 
         res = super().write(vals)
-        if 'interval_number' in vals or 'interval_type' in vals:
+        if 'interval_number' in vals or 'interval_type' in vals or 'cron_active' in vals:
             self.update_cron_schedule()
         return res
 
+    @api.model
+    def _default_config(self):
+        """
+        Configuration ESL proposée par défaut (assistants de liaison, templates) :
+        la première configuration active de la société courante.
+
+        Retour:
+            recordset: configuration ESL (esl.esl), vide si aucune
+        """
+        return self.search([("company_id", "in", (self.env.company.id, False))], order="id", limit=1)
+
     @staticmethod
     def format_price(value):
         """
@@ -132,9 +254,333 @@ class Esl(models.Model):
     # -------------------------------------------------------------
     #                   CONSTRUCTION DES PRODUITS
     # -------------------------------------------------------------
+    def _prepare_esl_item(self, vals):
+        """
+        Construit l'article ESL d'un produit.
+
+        Paramètres:
+            vals (dict): valeurs du produit lues via ESL_PRODUCT_FIELDS,
+                         complétées du stock du store (qty_available) et
+                         des prix des listes de prix (original_price, price)
+
+        Retour:
+            dict: article au format ZK_sendItem
+        """
+        barcode_value = vals["barcode"] or str(vals["default_code"])
+        original_price = self.format_price(vals.get("original_price", vals["list_price"]))
+        price = self.format_price(vals.get("price", vals["list_price"]))
+        promotion_text = ""
+        if original_price and price < original_price:
+            promotion_text = f"-{round(100 * (original_price - price) / original_price)}%"
+        else:
+            price = original_price
+        return {
+            "attrCategory": "default",
+            "attrName": "default",
+            "barCode": barcode_value,
+            "itemTitle": vals["name"] or "",
+            "shortTitle": "",
+            "classLevel": "",
+            "originalPrice": original_price,
+            "price": price,
+            "qrCode": "",
+            "nfcUrl": "",
+            "productArea": "",
+            "productCode": vals["default_code"] or "",
+            "productSku": "",
+            "promotionText": promotion_text,
+            "label": "",
+            "stock1": vals.get("qty_available", 0.0),
+            "stock2": 0,
+            "stock3": 0,
+            **{f"custFeature{i}": "" for i in range(1, 21)},
+        }
+
+    def _payload_fingerprint(self):
+        """
+        Empreinte des réglages de la connexion qui changent ce qui est envoyé
+        sans changer les produits (format, attributs, store) : incluse dans
+        l'empreinte de chaque article, elle fait renvoyer toutes les
+        étiquettes en mode différentiel quand ces réglages changent.
+        """
+        self.ensure_one()
+        return f"{self.payload_mode}|{self.payload_attributes or ''}|{self.StoreId or ''}|".encode("utf-8")
+
+    @staticmethod
+    def _item_hash(fragment, fingerprint=b""):
+        """
+        Empreinte d'un article, utilisée par le mode différentiel.
+
+        Calculée sur le fragment déjà sérialisé pour l'envoi (_item_fragment,
+        ordre des clés fixé par _prepare_esl_item) : chaque article n'est
+        sérialisé qu'une fois par envoi, qu'il soit envoyé ou écarté.
+
+        Paramètres:
+            fragment (bytes): article encodé par _item_fragment
+            fingerprint (bytes): empreinte des réglages (_payload_fingerprint)
+
+        Retour:
+            str: empreinte SHA-1 hexadécimale
+        """
+        return hashlib.sha1(fingerprint + fragment).hexdigest()
+
+    def _item_entries(self, chunk, fingerprint):
+        """
+        Entrées d'envoi d'un paquet d'articles.
+
+        Paramètres:
+            chunk (list): tuples (product_id, article)
+            fingerprint (bytes): empreinte des réglages (_payload_fingerprint)
+
+        Retour:
+            list: tuples (product_id, fragment JSON, empreinte)
+        """
+        entries = []
+        for pid, item in chunk:
+            fragment = self._item_fragment(item)
+            entries.append((pid, fragment, self._item_hash(fragment, fingerprint)))
+        return entries
+
+    def _item_fragment(self, item):
+        """
+        Sérialise un article une seule fois, au format choisi (payload_mode).
+
+        Les batches sont ensuite assemblés par concaténation de ces
+        fragments (_batch_payload), sans nouvelle sérialisation.
+
+        Paramètres:
+            item (dict): article au format ZK_sendItem
+
+        Retour:
+            bytes: article encodé en JSON (UTF-8)
+        """
+        if self.payload_mode == 'compact':
+            attributes = {a.strip() for a in (self.payload_attributes or "").split(",") if a.strip()}
+            if attributes:
+                item = {k: v for k, v in item.items() if k in attributes or k in ESL_CLEARABLE_ATTRIBUTES}
+            else:
+                item = {k: v for k, v in item.items() if v not in ("", None) or k in ESL_CLEARABLE_ATTRIBUTES}
+        return json.dumps(item, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    @staticmethod
+    def _batch_payload(header, entries):
+        """
+        Assemble le corps d'une requête ZK_sendItem à partir des fragments.
+
+        Paramètres:
+            header (dict): champs communs de la requête (uniqueId, token...)
+            entries (list): tuples (product_id, fragment, empreinte)
+
+        Retour:
+            bytes: corps JSON de la requête
+        """
+        prefix = json.dumps(header, separators=(",", ":"))[:-1].encode("utf-8")
+        return b"".join((prefix, b',"itemList":[', b",".join(e[1] for e in entries), b"]}"))
+
+    def _iter_item_chunks(self, product_ids=None, chunk_size=ESL_PRODUCT_CHUNK):
+        """
+        Générateur des articles ESL, lus par paquets de produits.
+
+        Seuls les champs utiles sont lus, le prefetch est limité au paquet
+        courant et le cache ORM est vidé entre deux paquets : la mémoire
+        reste bornée quelle que soit la taille du catalogue. Le stock et
+        les prix sont calculés pour tout le paquet à la fois
+        (_stock_quantities, _pricelist_prices).
+
+        Paramètres:
+            product_ids (list): ids des produits (par défaut tout le catalogue)
+            chunk_size (int): nombre de produits lus à la fois
+
+        Retour:
+            generator: listes de tuples (product_id, article)
+        """
+        Product = self.env['product.product']
+        if product_ids is None:
+            product_ids = Product.search(self._product_scope_domain(), order="id").ids
+        location = self._stock_location()
+        for chunk_ids in split_every(chunk_size, product_ids):
+            rows = Product.browse(chunk_ids).read(ESL_PRODUCT_FIELDS, load=False)
+            stock = self._stock_quantities(chunk_ids, location)
+            prices = self._pricelist_prices(chunk_ids)
+            for row in rows:
+                row["qty_available"] = stock.get(row["id"], 0.0)
+                row.update(prices.get(row["id"], {}))
+            yield [(row["id"], self._prepare_esl_item(row)) for row in rows]
+            Product.invalidate_model()
+            self.env['product.template'].invalidate_model()
+
+    def _stock_location(self):
+        """Emplacement de stock configuré pour le store ESL sélectionné (peut être vide)."""
+        self.ensure_one()
+        store = self.store_ids.filtered(lambda s: s.store_id == self.StoreId)[:1]
+        return store.location_id
+
+    def _stock_quantities(self, product_ids, location=None):
+        """
+        Stock en main des produits, en une seule requête groupée sur stock.quant.
+
+        Remplace le champ calculé qty_available, évalué produit par produit
+        sur tous les entrepôts.
+
+        Paramètres:
+            product_ids (list): ids des produits
+            location (recordset): emplacement du store, enfants compris
+                                  (par défaut tous les emplacements internes)
+
+        Retour:
+            dict: {product_id: quantité}
+        """
+        domain = [("product_id", "in", list(product_ids))]
+        if location:
+            domain.append(("location_id", "child_of", location.id))
+        else:
+            companies = self.company_id or self.env.companies
+            domain += [("location_id.usage", "=", "internal"), ("company_id", "in", companies.ids)]
+        groups = self.env['stock.quant'].sudo()._read_group(domain, ["product_id"], ["quantity:sum"])
+        return {product.id: quantity for product, quantity in groups}
+
+    def _esl_pricelists(self):
+        """
+        Listes de prix affichées par les configurations ESL (celles de self,
+        toutes si self est vide), y compris celles dont elles dérivent (règles
+        basées sur une autre liste de prix).
+
+        Retour:
+            recordset: listes de prix (product.pricelist)
+        """
+        configs = self or self.search([])
+        pricelists = todo = configs.pricelist_id | configs.promo_pricelist_id
+        while todo:
+            todo = todo.item_ids.filtered(lambda item: item.base == 'pricelist').base_pricelist_id - pricelists
+            pricelists |= todo
+        return pricelists
+
+    def _pricelist_prices(self, product_ids):
+        """
+        Prix normal et promotionnel des produits, calculés en une passe par liste de prix.
+
+        _get_products_price évalue les règles de la liste de prix pour tout
+        le paquet de produits à la fois au lieu d'un appel par produit.
+
+        Paramètres:
+            product_ids (list): ids des produits
+
+        Retour:
+            dict: {product_id: {"original_price": prix normal, "price": prix promotionnel}}
+                  (vide si aucune liste de prix n'est configurée)
+        """
+        self.ensure_one()
+        if not self.pricelist_id and not self.promo_pricelist_id:
+            return {}
+        products = self.env['product.product'].browse(product_ids)
+        if self.pricelist_id:
+            regular = self.pricelist_id._get_products_price(products, 1.0)
+        else:
+            regular = {p.id: p.list_price for p in products}
+        promo = self.promo_pricelist_id._get_products_price(products, 1.0) if self.promo_pricelist_id else regular
+        return {
+            pid: {"original_price": price, "price": promo.get(pid, price)}
+            for pid, price in regular.items()
+        }
+
+    def _product_domain_eval_context(self):
+        """Contexte d'évaluation de product_domain : celui des domaines enregistrés par le widget domain."""
+        return {
+            "uid": self.env.uid,
+            "user": self.env.user,
+            "time": safe_time,
+            "datetime": safe_datetime,
+            "relativedelta": dateutil.relativedelta.relativedelta,
+            "context_today": lambda: fields.Date.context_today(self),
+            "company_id": self.company_id.id or self.env.company.id,
+            "company_ids": self.env.companies.ids,
+        }
+
+    def _product_domain(self):
+        """Domaine saisi dans product_domain, évalué (valeurs relatives : uid, context_today()...)."""
+        self.ensure_one()
+        return list(safe_eval(self.product_domain or "[]", self._product_domain_eval_context()))
+
+    @api.constrains("product_domain")
+    def _check_product_domain(self):
+        for record in self:
+            try:
+                domain = record._product_domain()
+                self.env['product.product']._search(domain)
+            except Exception as e:
+                raise ValidationError(f"Filtre des produits invalide : {e}")
+
+    def _product_scope_domain(self):
+        """Domaine des produits à envoyer selon la société, product_domain et product_scope."""
+        self.ensure_one()
+        domain = self._product_domain()
+        if self.company_id:
+            domain += [('company_id', 'in', [False, self.company_id.id])]
+        if self.product_scope == 'bound':
+            domain += [('id', 'in', self.env['esl.binding'].sudo()._bound_product_ids(self))]
+        return domain
+
+    def _iter_batches(self, sizer, full=False, product_ids=None):
+        """
+        Générateur des batches à envoyer, produits au fil de la lecture du catalogue.
+
+        En mode différentiel, les articles dont l'empreinte n'a pas changé
+        depuis le dernier envoi réussi sont écartés. La taille de chaque
+        batch est relue sur `sizer` au moment de le fermer : en mode
+        adaptatif, elle suit les réponses déjà reçues.
+
+        Paramètres:
+            sizer (FixedBatchSizer | AdaptiveBatchSizer): taille des batches
+            full (bool): envoie tous les articles, sans comparer les empreintes
+            product_ids (list): ids des produits (par défaut tout le catalogue)
+
+        Retour:
+            generator: listes de tuples (product_id, fragment JSON, empreinte)
+        """
+        Sync = self.env['esl.product.sync']
+        fingerprint = self._payload_fingerprint()
+        pending = []
+        pending_bytes = 0
+        for chunk in self._iter_item_chunks(product_ids):
+            entries = self._item_entries(chunk, fingerprint)
+            if not full:
+                known = Sync._get_hashes(self, [pid for pid, _f, _h in entries])
+                entries = [e for e in entries if known.get(e[0]) != e[2]]
+            for entry in entries:
+                size = len(entry[1]) + 1
+                if pending and (
+                    len(pending) >= sizer.size
+                    or (sizer.max_bytes and pending_bytes + size > sizer.max_bytes)
+                ):
+                    yield pending
+                    pending, pending_bytes = [], 0
+                pending.append(entry)
+                pending_bytes += size
+        if pending:
+            yield pending
+
+    def _batch_sizer(self):
+        """
+        Retourne l'objet qui fixe la taille des batches selon batch_mode.
+
+        En mode adaptatif, l'envoi repart de la dernière taille retenue.
+        """
+        batch_size = self.product_batch or 19999
+        if self.batch_mode != 'adaptive':
+            return FixedBatchSizer(batch_size)
+        return AdaptiveBatchSizer(
+            self.adaptive_batch_size or min(batch_size, 500),
+            max_size=batch_size,
+            max_bytes=self.batch_max_bytes,
+            target_latency=self.batch_target_latency,
+        )
+
     def build_product_json(self, logs):
         """
-        Construit la structure JSON des produits pour l'envoi à l'ESL.
+        Construit la structure JSON de tout le catalogue pour l'envoi à l'ESL.
+
+        Conservé pour compatibilité : l'envoi utilise _iter_batches, qui ne
+        garde jamais tout le catalogue en mémoire.
 
         Paramètres:
             logs (list): liste pour collecter les logs d'exécution
@@ -142,33 +588,7 @@ class Esl(models.Model):
         Retour:
             dict: structure JSON complète pour l'envoi
         """
-        products = self.env['product.product'].search([])
-        item_list = []
-
-        for p in products:
-            barcode_value = p.barcode or str(p.default_code)
-            item = {
-                "attrCategory": "default",
-                "attrName": "default",
-                "barCode": barcode_value,
-                "itemTitle": p.name or "",
-                "shortTitle": "",
-                "classLevel": "",
-                "originalPrice": self.format_price(p.list_price),
-                "price": self.format_price(p.list_price),
-                "qrCode": "",
-                "nfcUrl": "",
-                "productArea": "",
-                "productCode": p.default_code or "",
-                "productSku": "",
-                "promotionText": "",
-                "label": "",
-                "stock1": getattr(p, "qty_available", 0.0),
-                "stock2": 0,
-                "stock3": 0,
-                **{f"custFeature{i}": "" for i in range(1, 21)},
-            }
-            item_list.append(item)
+        item_list = [item for chunk in self._iter_item_chunks() for _pid, item in chunk]
 
         return {
             "uniqueId": self.unique_id,
@@ -180,186 +600,708 @@ class Esl(models.Model):
     # -------------------------------------------------------------
     #               GESTION ET RAFRAÎCHHISSEMENT TOKEN
     # -------------------------------------------------------------
+    def _current_token(self):
+        """
+        Retourne (token, expiration) : celui de l'enregistrement, ou celui
+        renouvelé par ce processus s'il est plus récent que l'instantané de
+        la transaction courante.
+        """
+        self.ensure_one()
+        token, expiration = self.token, self.token_expiration
+        refreshed = _refreshed_tokens.get((self.env.cr.dbname, self.id))
+        if refreshed and (not expiration or refreshed[1] > expiration):
+            return refreshed
+        return token, expiration
+
+    def _token_is_fresh(self):
+        """Vrai si le token est présent et valide au-delà de la marge de renouvellement."""
+        return _token_fresh(*self._current_token())
+
     def check_and_refresh_token(self):
-        now = fields.Datetime.now()
-        # Si pas de token ou pas d'expiration → on reconnecte
-        if not self.token or not self.token_expiration:
-            self.connectesl()
-            _logger.info("[Hpharma ESL] Token absent, connexion effectuée.")
-            return self.token
+        """
+        Retourne un token valide, en ne se reconnectant que si nécessaire.
+
+        Le token est renouvelé avant son expiration (TOKEN_REFRESH_MARGIN),
+        dans sa propre transaction courte, validée aussitôt : il est stocké
+        dans esl.token, dont la ligne verrouillée garantit qu'un seul worker
+        se reconnecte. La ligne esl_esl n'est ni verrouillée ni écrite, la
+        transaction appelante peut donc l'écrire ensuite sans conflit. Les
+        renouvellements de connexions différentes ne s'attendent pas.
+
+        Retour:
+            str: token ESL (vide si la connexion a échoué)
+        """
+        self.ensure_one()
+        if self._token_is_fresh():
+            return self._current_token()[0]
+
+        key = (self.env.cr.dbname, self.id)
+        with _token_locks.setdefault(key, threading.Lock()):
+            if self._token_is_fresh():
+                return self._current_token()[0]
+            with self.env.registry.cursor() as cr:
+                esl = self.with_env(self.env(cr=cr))
+                Token = esl.env['esl.token'].sudo()
+                token, expiration = Token._lock(esl)
+                if not _token_fresh(token, expiration):
+                    _logger.info("[Hpharma ESL] Token absent ou bientôt expiré, reconnexion en cours.")
+                    try:
+                        try:
+                            vals = esl._login(refresh_key=False, update_health=False)
+                        except UserError:
+                            # La clé publique mémorisée a pu changer côté API
+                            vals = esl._login(update_health=False)
+                        token, expiration = vals["token"], vals["token_expiration"]
+                        Token._store(esl, token, expiration)
+                    except Exception as e:
+                        _logger.error("[Hpharma ESL] Renouvellement du token impossible : %s", str(e))
+            if _token_fresh(token, expiration):
+                _refreshed_tokens[key] = (token, expiration)
+        return self._current_token()[0] if self._token_is_fresh() else ""
+
+    # -------------------------------------------------------------
+    #                      TRANSPORT API ESL
+    # -------------------------------------------------------------
+    def _esl_api_params(self, budget='interactive'):
+        """
+        Paramètres de transport de cette connexion, utilisables hors ORM (threads).
 
-        # Token expiré ?
-        if self.token_expiration < now:
-            _logger.info("[Hpharma ESL] Token expiré, reconnexion en cours.")
-            return self.connectesl()
+        Paramètres:
+            budget (str): budget de débit des appels, 'interactive' ou 'bulk'
+
+        Retour:
+            dict: base_url, timeout (connexion, lecture), token, nouvelles
+                  tentatives, disjoncteur et limite de débit
+        """
+        self.ensure_one()
+        bulk = budget == 'bulk'
+        return {
+            "base_url": self.sudo().api_base_url or esl_api.DEFAULT_BASE_URL,
+            "timeout": (
+                self.api_connect_timeout or esl_api.DEFAULT_CONNECT_TIMEOUT,
+                self.api_read_timeout or esl_api.DEFAULT_READ_TIMEOUT,
+            ),
+            "token": self._current_token()[0] or "",
+            "max_retries": max(self.api_max_retries, 0),
+            "retry_backoff": self.api_retry_backoff or esl_api.DEFAULT_RETRY_BACKOFF,
+            "breaker_threshold": self.breaker_threshold,
+            "breaker_cooldown": self.breaker_cooldown,
+            "rate_budget": budget,
+            "rate_limit": self.rate_limit_bulk if bulk else self.rate_limit_interactive,
+            "rate_max_wait": None if bulk else INTERACTIVE_RATE_MAX_WAIT,
+            "rate_dir": os.path.join(config['data_dir'], "hpharma_esl"),
+        }
+
+    def _api_breaker(self):
+        """Disjoncteur de l'API de cette connexion, pour le processus courant."""
+        return esl_api.get_breaker(
+            self.sudo().api_base_url or esl_api.DEFAULT_BASE_URL, self.breaker_threshold, self.breaker_cooldown,
+        )
+
+    def _api_available(self):
+        """
+        Faux si l'API a été déclarée indisponible (par ce worker ou un autre)
+        et que le délai avant le prochain essai n'est pas écoulé.
+        """
+        self.ensure_one()
+        if self.api_health != 'down':
+            return True
+        return bool(self.api_retry_at and self.api_retry_at <= fields.Datetime.now())
+
+    def _check_api_available(self, endpoint):
+        """Lève esl_api.CircuitOpenError si l'API est indisponible, sans appel réseau."""
+        if self.api_health != 'down':
+            return
+        breaker = self._api_breaker()
+        if not breaker.is_open:
+            # Coupure constatée par un autre worker : le disjoncteur local la reprend,
+            # le premier appel après api_retry_at sert de test
+            breaker.trip(self.api_retry_at.replace(tzinfo=timezone.utc).timestamp() if self.api_retry_at else 0.0)
+        if not self._api_available():
+            raise esl_api.CircuitOpenError(
+                f"API ESL indisponible ({endpoint} non appelé), nouvel essai après "
+                f"{fields.Datetime.to_string(self.api_retry_at)} UTC."
+            )
 
+    def _update_api_health(self):
+        """
+        Reporte l'état du disjoncteur du processus dans api_health, partagé
+        avec les autres workers (écriture uniquement en cas de changement).
+        """
+        self.ensure_one()
+        breaker = self._api_breaker()
+        health = 'down' if breaker.is_open else 'ok'
+        if health == 'down':
+            retry_at = datetime.fromtimestamp(breaker.open_until, timezone.utc).replace(tzinfo=None, microsecond=0)
+            if self.api_health != 'down' or self.api_retry_at != retry_at:
+                self.write({
+                    "api_health": 'down',
+                    "api_health_date": self.api_health_date if self.api_health == 'down' else fields.Datetime.now(),
+                    "api_retry_at": retry_at,
+                })
+        elif self.api_health != 'ok':
+            self.write({"api_health": 'ok', "api_health_date": fields.Datetime.now(), "api_retry_at": False})
+
+    def action_reset_api_health(self):
+        """Referme le disjoncteur : le prochain appel est fait normalement."""
+        for record in self:
+            record._api_breaker().reset()
+            record.write({"api_health": 'ok', "api_health_date": fields.Datetime.now(), "api_retry_at": False})
+
+    def _esl_request(self, endpoint, payload=None, method="POST", auth=True, update_health=True):
+        """
+        Appelle un endpoint de l'API ESL via la session keep-alive partagée
+        et enregistre l'appel dans les métriques (esl.api.metric).
+
+        Paramètres:
+            endpoint (str): nom de l'endpoint (ex. "ZK_sendItem")
+            payload (dict | str): corps de la requête
+            method (str): méthode HTTP
+            auth (bool): envoie le token dans l'en-tête Authorization
+            update_health (bool): reporte l'état du disjoncteur dans api_health
+                (écriture de la connexion)
+
+        Retour:
+            requests.Response: réponse HTTP
+        """
+        self._check_api_available(endpoint)
+        params = self._esl_api_params()
+        if isinstance(payload, (dict, list)):
+            payload = json.dumps(payload)
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        payload_bytes = len(payload) if payload else 0
+        Metric = self.env['esl.api.metric']
+        start = time.monotonic()
+        try:
+            res = esl_api.call(params, endpoint, payload, method=method, auth=auth)
+        except esl_api.CircuitOpenError:
+            if update_health:
+                self._update_api_health()
+            raise
+        except Exception:
+            Metric._record(self, endpoint, time.monotonic() - start, None, payload_bytes)
+            if update_health:
+                self._update_api_health()
+            raise
+        Metric._record_response(self, endpoint, res, payload_bytes)
+        if update_health:
+            self._update_api_health()
+        return res
 
     # -------------------------------------------------------------
     #                      CONNEXION ESL
     # -------------------------------------------------------------
-    def connectesl(self):
+    def connectesl(self, refresh_key=True):
         """
         Connecte à l'ESL Hpharma et récupère le token, agency_id et merchant_id.
 
+        Paramètres:
+            refresh_key (bool): récupère la clé publique auprès de l'API ; sinon
+                la clé mémorisée dans publickey est réutilisée si elle existe
+
         Retour:
             dict: notification Odoo pour informer du succès ou de l'erreur
         """
         self.ensure_one()
         self.token = ""
-        logs = []
+        try:
+            vals = self._login(refresh_key)
+        except UserError as e:
+            self.state = "error"
+            return self._notify(str(e))
+        self.write(dict(vals, state="connected"))
+        _logger.info("[Hpharma ESL] Connexion ESL réussie pour %s", self.login)
+        return self._notify("✅ Connexion ESL Hpharma réussie.")
 
+    def _login(self, refresh_key=True, update_health=True):
+        """
+        Demande un nouveau token à l'API (clé publique puis getToken), sans
+        rien écrire sur la connexion.
+
+        Paramètres:
+            refresh_key (bool): récupère la clé publique auprès de l'API ; sinon
+                la clé mémorisée dans publickey est réutilisée si elle existe
+            update_health (bool): reporte l'état du disjoncteur dans api_health
+
+        Retour:
+            dict: valeurs de la connexion (token, token_expiration, agency_id,
+                  merchant_id, publickey)
+
+        Lève:
+            UserError: échec de la connexion (message affichable)
+        """
+        self.ensure_one()
         # Étape 1 : clé publique
-        try:
-            response = requests.get("https://blev29.kalanda.info/api-esl/getPublicKey", timeout=10)
+        content = self.publickey
+        if refresh_key or not content or "-----BEGIN" not in content:
+            try:
+                response = self._esl_request("getPublicKey", method="GET", auth=False, update_health=update_health)
+            except Exception as e:
+                raise UserError(f"❌ Exception clé publique : {str(e)}")
             if response.status_code != 200:
-                self.state = "error"
-                return self._notify(f"❌ Erreur récupération clé publique (HTTP {response.status_code})")
+                raise UserError(f"❌ Erreur récupération clé publique (HTTP {response.status_code})")
             content = response.text.strip()
-            self.publickey = content
-        except Exception as e:
-            self.state = "error"
-            return self._notify(f"❌ Exception clé publique : {str(e)}")
 
         if not content or "-----BEGIN" not in content:
-            self.state = "error"
-            return self._notify("❌ Clé publique invalide reçue.")
+            raise UserError("❌ Clé publique invalide reçue.")
 
         if not self.login or not self.password:
-            self.state = "error"
-            return self._notify("❌ Identifiants ESL manquants.")
+            raise UserError("❌ Identifiants ESL manquants.")
 
         # Étape 2 : demande de token
         try:
-            public_key = serialization.load_pem_public_key(content.encode("utf-8"), backend=default_backend())
+            public_key = _load_public_key(content)
             encrypted = public_key.encrypt(self.password.encode("utf-8"), padding.PKCS1v15())
             encrypted_b64 = base64.b64encode(encrypted).decode("utf-8")
 
             payload = {"mode": "CLOUD", "username": self.login, "password": encrypted_b64, "UniqueId": self.unique_id , "enableZkong": True}
-            response_token = requests.post("https://blev29.kalanda.info/api-esl/getToken", json=payload, timeout=30)
+            response_token = self._esl_request("getToken", payload, auth=False, update_health=update_health)
             _logger.info("[Hpharma ESL] Response getToken: %s", response_token.text)
             if response_token.status_code != 200:
-                self.state = "error"
-                return self._notify(f"❌ Erreur token (HTTP {response_token.status_code})")
-            
-            token_json = response_token.json()
-            self.token = token_json.get("data", {}).get("token", "")
-            self.agency_id = token_json.get("data", {}).get("agencyId", "NA")
-            self.merchant_id = token_json.get("data", {}).get("merchantId", "NA")
-            self.token_expiration = fields.Datetime.now() + timedelta(hours=2)
-
+                raise UserError(f"❌ Erreur token (HTTP {response_token.status_code})")
+            data = response_token.json().get("data", {})
+        except UserError:
+            raise
         except Exception as e:
-            self.state = "error"
             _logger.error("[Hpharma ESL] Erreur getToken: %s", str(e))
-            return self._notify(f"❌ Erreur getToken : {str(e)}")
+            raise UserError(f"❌ Erreur getToken : {str(e)}")
 
-        self.state = "connected"
-        _logger.info("[Hpharma ESL] Connexion ESL réussie pour %s", self.login)
-        return self._notify("✅ Connexion ESL Hpharma réussie.")
+        return {
+            "publickey": content,
+            "token": data.get("token", ""),
+            "token_expiration": fields.Datetime.now() + TOKEN_LIFETIME,
+            "agency_id": data.get("agencyId", "NA"),
+            "merchant_id": data.get("merchantId", "NA"),
+        }
 
     # -------------------------------------------------------------
     #                  ENVOI DES PRODUITS
     # -------------------------------------------------------------
-    def importesl(self):
+    def importesl(self, full=None):
         """
         Envoie les produits batch par batch vers l'ESL.
 
+        En mode différentiel, seuls les produits dont l'article a changé
+        depuis le dernier envoi réussi sont envoyés. Jusqu'à upload_workers
+        batches peuvent être en cours d'envoi simultanément.
+
+        Paramètres:
+            full (bool): force l'envoi de tout le catalogue (par défaut selon sync_mode)
+
         Retour:
             dict: notification Odoo avec le nombre de produits envoyés
         """
         self.ensure_one()
-        logs = []
-        all_products_payload = self.build_product_json(logs)
-        all_items = all_products_payload.get("itemList", [])
+        if full is None:
+            full = self.sync_mode == 'full'
+        stats = self._send_products(full=full)
+
+        if stats.get("partitions"):
+            return self._notify(
+                f"⏳ Envoi réparti en {stats['partitions']} partitions, "
+                f"traitées par les workers du cron (suivi dans l'historique des envois)."
+            )
+        if not stats["batches"]:
+            if full:
+                return self._notify("⚠️ Aucun produit à envoyer.")
+            return self._notify("✅ Aucun produit modifié depuis le dernier envoi.")
+        if stats["errors"]:
+            return self._notify(
+                f"⚠️ Produits envoyés : {stats['sent']} — en échec : {stats['failed']}\n"
+                f"Réponse : {stats['message']}"
+            )
+        return self._notify(
+            f"✅ Produits envoyés : {stats['sent']}\n"
+            f"Réponse : {stats['message']}"
+        )
 
-        if not all_items:
-            return self._notify("⚠️ Aucun produit à envoyer.")
+    def _send_products(self, product_ids=None, full=False):
+        """
+        Construit et envoie les articles via ZK_sendItem, puis met à jour state et doi.
 
-        batch_size = self.product_batch or 19999
-        total_sent = 0
-        response_data = ""
-        response_json = {}
-
-        for i in range(0, len(all_items), batch_size):
-            batch_items = all_items[i:i + batch_size]
-
-            payload_dict = {
-                "uniqueId": self.unique_id,
-                "agencyId": self.agency_id,
-                "merchantId": self.merchant_id,
-                "itemList": batch_items,
-                "token": self.token
-            }
-            payload = json.dumps(payload_dict)
+        L'envoi est suivi dans un esl.sync.run : chaque batch y est enregistré
+        avec son statut, ce qui permet de le reprendre (action_resume).
 
-            headers = {
-                'Authorization': self.token,
-                'Content-Type': 'application/json'
-            }
+        Paramètres:
+            product_ids (list): ids des produits à envoyer (par défaut tout le catalogue)
+            full (bool): ignore les empreintes du mode différentiel
 
-            try:
-                conn = http.client.HTTPSConnection("blev29.kalanda.info")
-                conn.request("POST", "/api-esl/ZK_sendItem", payload, headers)
-                res = conn.getresponse()
-                response_data = res.read().decode("utf-8")
-
-                try:
-                    response_json = json.loads(response_data)
-                except Exception:
-                    _logger.error("[Hpharma ESL] Erreur parsing JSON response: %s", response_data)
-                    response_json = {}
-                _logger.info("[Hpharma ESL] Response sendItem: %s", response_data)
-                if res.status == 200:
-                    self.state = "connected"
-                    self.doi = fields.Datetime.now()
-                    _logger.info("[Hpharma ESL] Batch de %d produits envoyé avec succès.", len(batch_items))
-                else:
-                    self.state = "error"
-                    _logger.error("[Hpharma ESL] Erreur API sendItem (HTTP %d): %s", res.status, response_data)
+        Retour:
+            dict: compteurs de l'envoi (sent, failed, batches, errors, message)
+        """
+        self.ensure_one()
+        self._check_api_available("ZK_sendItem")
+        if product_ids is None and self.partition_size > 0:
+            return self._start_partitioned_run(full)
+        run = self.env['esl.sync.run'].create({
+            "esl_id": self.id,
+            "full": full,
+            "scope": 'catalog' if product_ids is None else 'selection',
+        })
+        if product_ids is None:
+            product_ids = self.env['product.product'].search(self._product_scope_domain(), order="id").ids
+        sizer = self._batch_sizer()
+        job = self._current_job()
+        if job:
+            # Estimation haute : en mode différentiel, les produits inchangés ne sont pas envoyés
+            job.write({"batches_total": math.ceil(len(product_ids) / sizer.size), "sync_run_id": run.id})
+
+        def iter_batches():
+            for entries in self._iter_batches(sizer, full=full, product_ids=product_ids):
+                yield run._add_batch(entries), entries
+            # Atteint seulement si le parcours est complet : un envoi interrompu
+            # (annulation, API indisponible, fin de tranche) reste à reprendre
+            run.catalog_done = True
+
+        stats = self._upload_batches(iter_batches(), sizer)
+        if not stats["batches"] and run.catalog_done:
+            run.unlink()
+            return stats
+        if not stats.get("yielded"):
+            # Tâche remise en file : l'envoi reste en cours et sera repris par _execute_job
+            run._finish(stats)
+        return stats
+
+    def _start_partitioned_run(self, full=False):
+        """
+        Découpe le catalogue en partitions (plages d'ids contiguës) et les met
+        en file : les workers du cron des partitions les réservent (SKIP
+        LOCKED), les construisent et les envoient en parallèle ; l'envoi
+        (esl.sync.run) est clôturé par le dernier worker qui termine.
 
-            except Exception as e:
-                self.state = "error"
-                response_data = str(e)
-                response_json = {}
-                _logger.error("[Hpharma ESL] Exception envoi produits: %s", response_data)
-
-            total_sent += len(batch_items)
-
-            # 🔒 Masquer les tokens si ajout au log
-            safe_payload_dict = dict(payload_dict)
-            safe_payload_dict["token"] = "****"
-            safe_payload_dict["zk"] = "****"
-            logs.append(json.dumps(safe_payload_dict, indent=4, ensure_ascii=False))
-        return self._notify(
-            f"✅ Produits envoyés : {total_sent}\n"
-            f"Réponse : {response_json.get('message', response_data)}"
+        Paramètres:
+            full (bool): ignore les empreintes du mode différentiel
+
+        Retour:
+            dict: compteurs de l'envoi, avec le nombre de partitions créées (partitions)
+        """
+        self.ensure_one()
+        stats = {"sent": 0, "failed": 0, "batches": 0, "errors": 0, "message": "", "partitions": 0}
+        product_ids = self.env['product.product'].search(self._product_scope_domain(), order="id").ids
+        if not product_ids:
+            return stats
+        run = self.env['esl.sync.run'].create({
+            "esl_id": self.id,
+            "full": full,
+            "scope": 'catalog',
+            "partitioned": True,
+            "last_product_id": product_ids[-1],
+        })
+        stats["partitions"] = len(run._create_partitions(product_ids, self.partition_size))
+        _logger.info("[Hpharma ESL] Envoi réparti en %d partitions (%d produits).", stats["partitions"], len(product_ids))
+        return stats
+
+    def _resume_run(self, run):
+        """
+        Reprend un envoi : renvoie ses batches en échec ou en attente, puis
+        le reste du catalogue si son parcours avait été interrompu.
+
+        Paramètres:
+            run (recordset): envoi à reprendre (esl.sync.run)
+
+        Retour:
+            dict: compteurs de l'envoi
+        """
+        self.ensure_one()
+        self._check_api_available("ZK_sendItem")
+        run.state = 'running'
+        sizer = self._batch_sizer()
+
+        fingerprint = self._payload_fingerprint()
+
+        def iter_batches():
+            for batch in run.batch_ids.filtered(lambda b: b.state != 'done'):
+                entries = [
+                    entry
+                    for chunk in self._iter_item_chunks(
+                        self.env['product.product'].browse(batch._product_ids()).exists().ids)
+                    for entry in self._item_entries(chunk, fingerprint)
+                ]
+                if entries:
+                    yield batch, entries
+            if run.scope == 'catalog' and not run.catalog_done:
+                remaining = self.env['product.product'].search(
+                    [('id', '>', run.last_product_id)] + self._product_scope_domain(), order="id").ids
+                for entries in self._iter_batches(sizer, full=run.full, product_ids=remaining):
+                    yield run._add_batch(entries), entries
+                run.catalog_done = True
+
+        stats = self._upload_batches(iter_batches(), sizer)
+        if not stats.get("yielded"):
+            run._finish(stats)
+        return stats
+
+    def _upload_batches(self, batches, sizer, update_connection=True):
+        """
+        Envoie des batches via ZK_sendItem, au plus upload_workers à la fois.
+
+        La construction des batches (ORM) reste dans le thread courant ;
+        seuls les appels HTTP, avec leurs nouvelles tentatives (et la
+        compression gzip éventuelle), sont confiés au pool. state et doi ne sont mis à jour qu'une fois tous les
+        batches terminés.
+
+        Paramètres:
+            batches (iterable): tuples (esl.sync.batch, entrées du batch)
+            sizer (FixedBatchSizer | AdaptiveBatchSizer): reçoit le résultat de chaque batch
+            update_connection (bool): met à jour state, doi et la taille de lot de la
+                connexion (désactivé pour les partitions, envoyées en parallèle par
+                plusieurs workers : seul le coordinateur écrit sur la connexion)
+
+        Retour:
+            dict: compteurs de l'envoi (sent, failed, batches, errors, message)
+        """
+        workers = max(1, min(self.upload_workers or 1, MAX_UPLOAD_WORKERS))
+        params = self._esl_api_params('bulk')
+        breaker = self._api_breaker()
+        header = {
+            "uniqueId": self.unique_id,
+            "agencyId": self.agency_id,
+            "merchantId": self.merchant_id,
+            "token": params["token"],
+        }
+        stats = {"sent": 0, "failed": 0, "batches": 0, "errors": 0, "message": ""}
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="esl_upload") as executor:
+            in_flight = deque()
+            for batch, entries in batches:
+                if self._job_cancel_requested():
+                    stats["cancelled"] = True
+                    _logger.info("[Hpharma ESL] Envoi annulé à la demande de l'utilisateur.")
+                    break
+                if self._job_should_yield():
+                    stats["yielded"] = True
+                    _logger.info("[Hpharma ESL] Tranche de temps écoulée, l'envoi cède la place aux autres stores.")
+                    break
+                if not breaker.allows_call():
+                    # Appel de test en cours : attendre son résultat avant de poursuivre
+                    while in_flight:
+                        self._collect_batch(*in_flight.popleft(), stats, sizer)
+                if not breaker.allows_call():
+                    # Inutile de construire et d'envoyer la suite : l'envoi reste à reprendre
+                    stats["errors"] += 1
+                    stats["message"] = "API ESL indisponible, envoi interrompu."
+                    _logger.warning("[Hpharma ESL] API indisponible, envoi interrompu.")
+                    break
+                payload = self._batch_payload(header, entries)
+                attempts_log = []
+                future = executor.submit(
+                    esl_api.call_with_retry, params, "ZK_sendItem", payload,
+                    compress=self.payload_gzip, attempts_log=attempts_log)
+                in_flight.append((batch, entries, len(payload), attempts_log, future))
+                while len(in_flight) >= workers:
+                    self._collect_batch(*in_flight.popleft(), stats, sizer)
+            while in_flight:
+                self._collect_batch(*in_flight.popleft(), stats, sizer)
+
+        self._update_api_health()
+        if not stats["batches"] or not update_connection:
+            return stats
+        if isinstance(sizer, AdaptiveBatchSizer):
+            self.adaptive_batch_size = sizer.size
+
+        if stats["errors"]:
+            self.state = "error"
+        else:
+            self.state = "connected"
+        if stats["sent"]:
+            self.doi = fields.Datetime.now()
+        _logger.info(
+            "[Hpharma ESL] Envoi terminé : %d produits envoyés, %d en échec (%d batches).",
+            stats["sent"], stats["failed"], stats["batches"],
         )
+        return stats
+
+    def _collect_batch(self, batch, entries, payload_bytes, attempts_log, future, stats, sizer):
+        """
+        Traite le résultat d'un batch envoyé (dans l'ordre d'envoi).
+
+        Enregistre le statut du batch et, s'il a été accepté, les empreintes
+        des produits.
+
+        Paramètres:
+            batch (recordset): batch suivi (esl.sync.batch)
+            entries (list): tuples (product_id, fragment JSON, empreinte) du batch
+            payload_bytes (int): taille du corps de la requête (avant compression)
+            attempts_log (list): tentatives de l'appel (code HTTP, durée), complétées par le thread
+            future (Future): appel HTTP en cours
+            stats (dict): compteurs agrégés de l'envoi
+            sizer (FixedBatchSizer | AdaptiveBatchSizer): reçoit le résultat du batch
+        """
+        stats["batches"] += 1
+        vals = {"date_sent": fields.Datetime.now(), "attempts": batch.attempts, "payload_bytes": payload_bytes}
+        Metric = self.env['esl.api.metric']
+        try:
+            res, attempts = future.result()
+            Metric._record_attempts(self, "ZK_sendItem", attempts_log, payload_bytes, len(entries))
+            response_data = res.text
+            latency = res.elapsed.total_seconds()
+            sizer.feedback(len(entries), latency, res.status_code)
+            vals.update(attempts=batch.attempts + attempts, http_status=res.status_code, duration=latency)
+            try:
+                stats["message"] = json.loads(response_data).get("message", response_data)
+            except Exception:
+                _logger.error("[Hpharma ESL] Erreur parsing JSON response: %s", response_data)
+                stats["message"] = response_data
+            _logger.info("[Hpharma ESL] Response sendItem: %s", response_data)
+            if res.status_code == 200:
+                self.env['esl.product.sync']._record_hashes(self, {pid: h for pid, _fragment, h in entries})
+                batch.write(dict(vals, state='done', error=False))
+                stats["sent"] += len(entries)
+                _logger.info("[Hpharma ESL] Batch de %d produits envoyé avec succès.", len(entries))
+                self._checkpoint(stats)
+                return
+            vals["error"] = response_data
+            _logger.error("[Hpharma ESL] Erreur API sendItem (HTTP %d): %s", res.status_code, response_data)
+        except Exception as e:
+            sizer.feedback(len(entries), None, None)
+            Metric._record_attempts(self, "ZK_sendItem", attempts_log, payload_bytes, len(entries))
+            stats["message"] = vals["error"] = str(e)
+            _logger.error("[Hpharma ESL] Exception envoi produits: %s", str(e))
+        batch.write(dict(vals, state='failed'))
+        stats["errors"] += 1
+        stats["failed"] += len(entries)
+        self._checkpoint(stats)
+
+    def _checkpoint(self, stats=None):
+        """
+        Enregistre la progression de la tâche en cours et valide la transaction
+        si le contexte le demande (cron, tâche de fond), pour que l'avancement
+        de l'envoi survive à une interruption du worker.
+
+        Paramètres:
+            stats (dict): compteurs de l'envoi en cours
+        """
+        job = self._current_job()
+        if job and stats:
+            job._update_progress(stats)
+        if self.env.context.get("esl_commit_checkpoints"):
+            self.env.cr.commit()
+
+    # -------------------------------------------------------------
+    #                  TÂCHES EN ARRIÈRE-PLAN
+    # -------------------------------------------------------------
+    def _current_job(self):
+        """Retourne la tâche de fond en cours d'exécution (esl.job), s'il y en a une."""
+        job_id = self.env.context.get("esl_job_id")
+        return self.env['esl.job'].browse(job_id) if job_id else self.env['esl.job']
+
+    def _job_cancel_requested(self):
+        """Vrai si l'utilisateur a demandé l'annulation de la tâche en cours."""
+        job = self._current_job()
+        return bool(job) and job._is_cancel_requested()
+
+    def _job_should_yield(self):
+        """
+        Vrai si la tâche en cours a épuisé sa tranche de temps alors que
+        d'autres configurations attendent : elle est alors remise en file
+        et reprendra son envoi là où il s'est arrêté.
+        """
+        job = self._current_job()
+        if job and job._should_yield():
+            job.requeue = True
+            return True
+        return False
+
+    def _queue_job(self, job_type):
+        """
+        Met une tâche en file pour cette connexion et en informe l'utilisateur.
+
+        Retour:
+            dict: notification Odoo
+        """
+        self.ensure_one()
+        self.env['esl.job']._enqueue(self, job_type)
+        return self._notify("⏳ Tâche lancée en arrière-plan. Suivez sa progression dans « Tâches ESL ».")
+
+    def action_queue_import(self):
+        return self._queue_job('import')
+
+    def action_queue_full_resync(self):
+        return self._queue_job('full_resync')
+
+    def action_queue_sync_templates(self):
+        return self._queue_job('sync_templates')
+
+    def action_queue_connect(self):
+        return self._queue_job('connect')
+
+    def _execute_job(self, job_type):
+        """
+        Exécute une tâche de fond pour cette connexion (appelé par esl.job).
+
+        Paramètres:
+            job_type (str): type de la tâche
+
+        Retour:
+            dict: notification Odoo produite par l'action exécutée
+        """
+        self.ensure_one()
+        if job_type != 'connect' and not self._api_available():
+            return self._notify(
+                f"⚠️ API ESL indisponible, tâche ignorée (nouvel essai après "
+                f"{fields.Datetime.to_string(self.api_retry_at)} UTC)."
+            )
+        if job_type == 'connect':
+            result = self.connectesl()
+            if self.state == "error":
+                return result
+            self.getstoreid()
+            return self.sync_templates_from_esl()
+
+        if not self.check_and_refresh_token():
+            raise UserError("Connexion ESL impossible : vérifiez les identifiants.")
+        # Publie le token (et libère le verrou de la ligne) pour les autres workers
+        self._checkpoint()
+        if job_type == 'sync_templates':
+            return self.sync_templates_from_esl()
+        if job_type == 'bind_import':
+            return self.env['esl.bind.import']._run_import(self, self._current_job())
+        self._refresh_stores_if_stale()
+        run = self._current_job().sync_run_id
+        if run and run.state == 'running':
+            # Tâche remise en file après une tranche de temps : reprise de son envoi
+            stats = self._resume_run(run)
+            return self._notify(
+                f"Reprise terminée — produits envoyés : {stats['sent']}, en échec : {stats['failed']}"
+            )
+        if job_type == 'full_resync':
+            return self.action_full_resync()
+        return self.importesl()
+
+    def action_full_resync(self):
+        """
+        Oublie les empreintes enregistrées et renvoie tout le catalogue.
+
+        Retour:
+            dict: notification Odoo du résultat de l'envoi
+        """
+        self.ensure_one()
+        self.env['esl.product.sync']._reset(self)
+        return self.importesl(full=True)
 
     # -------------------------------------------------------------
     #                 RÉCUPÉRATION DES STORE IDS
     # -------------------------------------------------------------
     def getstoreid(self):
-        self.ensure_one()
-        global _cached_stores_global
-        _cached_stores_global = []  # on vide à chaque appel
+        """
+        Récupère la liste des stores via ZK_getStoreId et l'enregistre dans esl.store.
 
-        payload = json.dumps({
+        Retour:
+            dict: action de rechargement ou notification d'erreur
+        """
+        self.ensure_one()
+        payload = {
             "uniqueId": self.unique_id,
             "agencyId": self.agency_id,
             "merchantId": self.merchant_id,
-        })
-
-        headers = {
-            'Authorization': self.token or "",
-            'Content-Type': 'application/json'
         }
 
         try:
-            conn = http.client.HTTPSConnection("blev29.kalanda.info")
-            conn.request("POST", "/api-esl/ZK_getStoreId", payload, headers)
-            res = conn.getresponse()
-            response_data = res.read().decode("utf-8")
+            res = self._esl_request("ZK_getStoreId", payload)
+            response_data = res.text
             _logger.info("[Hpharma ESL] Response getStoreId: %s", response_data)
-            if res.status != 200:
+            if res.status_code != 200:
                 return self._notify(f"Erreur API : {response_data}")
 
             response_json = json.loads(response_data)
@@ -374,8 +1316,9 @@ class Esl(models.Model):
                 store_name = store.get("storeName", store_id)
                 stores.append((store_id, store_name))
 
-            _cached_stores_global = stores
-            if stores:
+            self.env['esl.store'].sudo()._sync_stores(self, stores)
+            self.stores_refreshed_at = fields.Datetime.now()
+            if stores and self.StoreId not in [store_id for store_id, _name in stores]:
                 self.StoreId = stores[0][0]
 
             self._notify(f"✅ {len(stores)} stores récupérés.")
@@ -388,25 +1331,111 @@ class Esl(models.Model):
     #                 OUTILS DE SÉLECTION STORE
     # -------------------------------------------------------------
     def _get_store_selection(self):
-        """Retourne la liste des stores stockés globalement."""
-        global _cached_stores_global
-        return _cached_stores_global
-    
+        """
+        Retourne les stores enregistrés (esl.store), sans appel API : ceux de
+        la configuration pour un enregistrement, ceux de toutes les
+        configurations pour le modèle (validation des valeurs du champ).
+        """
+        Store = self.env['esl.store'].sudo()
+        configs = self if len(self) == 1 else self.sudo().with_context(active_test=False).search([])
+        selection = {}
+        for config in configs:
+            selection.update(Store._get_selection(config.id, config.stores_version))
+        return list(selection.items())
+
+    @api.depends("StoreId", "store_ids.store_id")
+    def _compute_store_ref_id(self):
+        for record in self:
+            record.store_ref_id = record.store_ids.filtered(lambda s: s.store_id == record.StoreId)[:1]
+
+    def _inverse_store_ref_id(self):
+        for record in self:
+            record.StoreId = record.store_ref_id.store_id or False
+
+    def _bump_stores_version(self):
+        """Renouvelle l'entrée du cache de sélection des stores de ces configurations."""
+        if not self:
+            return
+        self.env.cr.execute(
+            "UPDATE esl_esl SET stores_version = COALESCE(stores_version, 0) + 1 WHERE id IN %s", [tuple(self.ids)])
+        self.invalidate_recordset(["stores_version"])
+
+    def _refresh_stores_if_stale(self):
+        """Récupère à nouveau les stores si la dernière récupération dépasse store_refresh_hours."""
+        self.ensure_one()
+        if not self.store_refresh_hours:
+            return
+        limit = fields.Datetime.now() - timedelta(hours=self.store_refresh_hours)
+        if not self.stores_refreshed_at or self.stores_refreshed_at < limit:
+            _logger.info("[Hpharma ESL] Liste des stores périmée, nouvelle récupération.")
+            self.getstoreid()
+
     # -------------------------------------------------------------
     #                  CRON & NOTIFICATIONS
     # -------------------------------------------------------------
     def auto_send_products(self):
+        """
+        Met en file une tâche d'envoi des produits pour chaque configuration
+        ESL dont l'envoi planifié est dû ; les tâches sont exécutées par le
+        cron des tâches de fond (esl.job), en parallèle et à tour de rôle.
+        """
         _logger.info("[Hpharma ESL] Démarrage du CRON d'envoi automatique des produits.")
-        for record in self.search([]):
+        due = self.search([
+            ('cron_active', '=', True),
+            '|', ('next_send_date', '=', False), ('next_send_date', '<=', fields.Datetime.now()),
+        ])
+        for record in due:
+            record.update_cron_schedule()
+            if not record._api_available():
+                _logger.warning("[Hpharma ESL] CRON : API indisponible, envoi ignoré pour %s.", record.display_name)
+                continue
+            self.env['esl.job']._enqueue(record, 'import')
+
+    def _cron_process_outbox(self, limit=ESL_OUTBOX_LIMIT):
+        """
+        Envoie uniquement les produits en attente dans esl.outbox.
+
+        Seules les connexions dont la planification est active sont servies,
+        chacune avec sa propre file : une connexion injoignable garde ses
+        produits en file sans retenir ceux des autres. Les produits d'une
+        connexion sont retirés de la file dans une transaction courte et
+        validée avant l'envoi (aucun verrou n'est gardé pendant les appels
+        réseau), puis remis en file si l'envoi échoue.
+
+        Paramètres:
+            limit (int): nombre maximal de produits traités par passage et par connexion
+        """
+        Outbox = self.env['esl.outbox']
+        records = self.search([('cron_active', '=', True)])
+        # Lignes des connexions désactivées entre-temps
+        Outbox.search([('esl_id', 'not in', records.ids)]).unlink()
+        self.env.cr.commit()
+        for record in records:
+            if not Outbox.search_count([('esl_id', '=', record.id)], limit=1) or not record._api_available():
+                continue
+            # Token renouvelé (et validé) avant toute écriture de la connexion par cette transaction
+            if not record.check_and_refresh_token():
+                continue
+            self.env.cr.commit()
+            queued_ids = Outbox._claim(record, limit)
+            self.env.cr.commit()
+            if not queued_ids:
+                continue
             try:
-                lang = record.user_lang or 'fr_BE'
-                record = record.with_context(lang=lang)
-                record.connectesl()
-                record.importesl()
+                record = record.with_context(lang=record.user_lang or 'fr_BE')
+                product_ids = self.env['product.product'].search(
+                    [('id', 'in', queued_ids)] + record._product_scope_domain(), order="id").ids
+                failed = bool(product_ids) and bool(record._send_products(product_ids)["errors"])
             except Exception as e:
-                record.state = "error"
-                _logger.error("[Hpharma ESL] Erreur CRON envoi automatique: %s", str(e))
-                record._notify(f"Erreur CRON envoi automatique : {str(e)}")
+                self.env.cr.rollback()
+                failed = True
+                _logger.error("[Hpharma ESL] Erreur envoi de la file d'attente: %s", str(e))
+            if failed:
+                # En mode différentiel, les produits déjà acceptés ne seront pas renvoyés
+                Outbox._enqueue(queued_ids, record)
+            else:
+                _logger.info("[Hpharma ESL] File d'attente : %d produits envoyés (%s).", len(queued_ids), record.name)
+            self.env.cr.commit()
     # -------------------------------------------------------------
     #                      NOTIFICATIONS
     # -------------------------------------------------------------
@@ -435,29 +1464,34 @@ class Esl(models.Model):
     # -------------------------------------------------------------
     def action_update_cron(self):
         self.ensure_one()
-        cron = self.env.ref('module_HpharmaESLSystem.ir_cron_auto_send_products', raise_if_not_found=False)
-        if cron:
-            cron.sudo().write({
-                'interval_number': int(self.interval_number or 1),
-                'interval_type': self.interval_type if self.interval_type in ['minutes', 'hours', 'days'] else 'hours',
-                'active': self.cron_active,
-            })
-            message = f"⏱ Intervalle de la tâche planifiée mis à jour : {self.interval_number} {self.interval_type}"
+        self.update_cron_schedule()
+        if self.cron_active:
+            message = (f"⏱ Envoi automatique toutes les {self.interval_number} {self.interval_type}, "
+                       f"prochain envoi : {fields.Datetime.to_string(self.next_send_date)} UTC")
         else:
-            message = "⚠️ CRON non trouvé"
+            message = "⏱ Envoi automatique désactivé pour cette configuration."
         return self._notify(message)
     # -------------------------------------------------------------
     #                  MISE À JOUR DU CRON
     # -------------------------------------------------------------
+    def _send_interval(self):
+        """Intervalle entre deux envois automatiques de cette configuration."""
+        number = max(int(self.interval_number or 1), 1)
+        if self.interval_type == 'days':
+            return timedelta(days=number)
+        return timedelta(hours=number)
+
     def update_cron_schedule(self):
-        self.ensure_one()
-        cron = self.env.ref('module_HpharmaESLSystem.ir_cron_auto_send_products', raise_if_not_found=False)
-        if cron:
-            cron.sudo().write({
-                'interval_number': int(self.interval_number or 1),
-                'interval_type': self.interval_type if self.interval_type in ['minutes', 'hours', 'days'] else 'hours',
-                'active': self.cron_active,
-            })
+        """
+        Replanifie l'envoi automatique de chaque configuration.
+
+        Le cron ir_cron_auto_send_products passe régulièrement et ne met en
+        file que les configurations dont next_send_date est atteinte.
+        """
+        for record in self:
+            next_send = fields.Datetime.now() + record._send_interval() if record.cron_active else False
+            super(Esl, record).write({"next_send_date": next_send})
+
     # -----------------------------------------------------------------
     #                      SYNCHRONISATION TEMPLATE ESL
     # -----------------------------------------------------------------
@@ -485,18 +1519,9 @@ class Esl(models.Model):
             "merchantId": self.merchant_id,
             "data": {"storeId": self.StoreId, "HardwareType": 3}
         }
-        headers = {
-            "Authorization": self.token or "",
-            "Content-Type": "application/json",
-        }
 
         try:
-            resp = requests.post(
-                "https://blev29.kalanda.info/api-esl/ZK_getTemplate",
-                json=payload,
-                headers=headers,
-                timeout=30
-            )
+            resp = self._esl_request("ZK_getTemplate", payload)
             resp.raise_for_status()
             _logger.info("[Hpharma ESL] Requête templates réussie: %s", resp.text)
         except Exception as e:
@@ -533,7 +1558,16 @@ class Esl(models.Model):
             return self._notify("⚠️ Pas de template reçu.")
 
         Template = self.env['esl.template'].sudo()
-        created = updated = 0
+        # Une seule requête pour les templates de cette configuration et ceux sans configuration
+        # (antérieurs au multi-configuration), indexés par (configuration, esl_id) : un template
+        # hérité et un template de la configuration portant le même esl_id ne se confondent pas.
+        existing_by_key = {
+            (t.esl_config_id.id, t.esl_id): t
+            for t in Template.search([("esl_config_id", "in", (self.id, False))])
+        }
+        to_create = []
+        to_unlink = Template
+        created = updated = unchanged = 0
 
         for tmpl in content:
             _logger.debug("[Hpharma ESL] Traitement template: %s", tmpl)
@@ -545,6 +1579,22 @@ class Esl(models.Model):
             else:
                 is_enable_value = bool(is_enable_value)
 
+            # Le template de la configuration d'abord ; sinon un template sans configuration
+            # est adopté explicitement (esl_config_id renseigné par l'écriture ci-dessous).
+            existing = existing_by_key.get((self.id, esl_id)) or existing_by_key.pop((False, esl_id), None)
+            if not is_enable_value:
+                # Si désactivé, supprimer si existe
+                if existing:
+                    to_unlink |= existing
+                    updated += 1
+                continue
+
+            json_raw = json.dumps(tmpl, ensure_ascii=False)
+            raw_hash = hashlib.sha1(json.dumps(tmpl, sort_keys=True).encode("utf-8")).hexdigest()
+            if existing and existing.raw_hash == raw_hash and existing.esl_config_id == self:
+                unchanged += 1
+                continue
+
             vals = {
                 "esl_id": esl_id,
                 "template_number": tmpl.get("templateNumber"),
@@ -555,33 +1605,38 @@ class Esl(models.Model):
                 "item_num": tmpl.get("itemNum"),
                 "temp_pic_url": tmpl.get("tempPicUrl"),
                 "is_enable": is_enable_value,
-                "json_raw": json.dumps(tmpl, ensure_ascii=False),
-                "json_product_codes": json.dumps([""] * (tmpl.get("itemNum") or 0)),
+                "json_raw": json_raw,
+                "raw_hash": raw_hash,
+                "esl_config_id": self.id,
             }
-            _logger.debug("[Hpharma ESL] Traitement template ESL ID %s, is_enable: %s", esl_id, is_enable_value)
-            existing = Template.search([("esl_id", "=", esl_id)], limit=1)
-            if not is_enable_value:
-                # Si désactivé, supprimer si existe
-                if existing:
-                    existing.unlink()
-                    updated += 1
-                continue
-            # Si activé, créer ou mettre à jour
-            _logger.debug("[Hpharma ESL] Création/Mise à jour template ESL ID %s", esl_id)
             if existing:
+                # Les codes scannés ne sont réinitialisés que si le nombre d'emplacements change
+                if existing.item_num != (tmpl.get("itemNum") or 0):
+                    vals["json_product_codes"] = json.dumps([""] * (tmpl.get("itemNum") or 0))
                 existing.write(vals)
                 updated += 1
             else:
-                Template.create(vals)
+                to_create.append(vals)
                 created += 1
 
-        return self._notify(f"Templates synchronisés ✅ Créés: {created} — Mis à jour: {updated}")
+        if to_unlink:
+            to_unlink.unlink()
+        if to_create:
+            Template.create(to_create)
+        _logger.info(
+            "[Hpharma ESL] Templates synchronisés : %d créés, %d mis à jour, %d inchangés.",
+            created, updated, unchanged,
+        )
+
+        return self._notify(
+            f"Templates synchronisés ✅ Créés: {created} — Mis à jour: {updated} — Inchangés: {unchanged}"
+        )
 
     # -------------------------------------------------------------
     #                      OUTILS DIVERS        
     # -------------------------------------------------------------
     def FirstConnectionESL(self):
-        for record in self.search([]):
+        for record in self:
             try:
                 record.connectesl()
                 record.getstoreid()
@@ -592,10 +1647,32 @@ class Esl(models.Model):
                 record._notify(f"Erreur Connexion : {str(e)}")
                 _logger.error("[Hpharma ESL] Erreur FirstConnectionESL: %s", str(e))
     # -------------------------------------------------------------
+    #                      MÉTRIQUES API
+    # -------------------------------------------------------------
+    def action_export_metrics(self):
+        """Télécharge les métriques API des 30 derniers jours de cette connexion (CSV)."""
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_url',
+            'url': f"/hpharma_esl/metrics.csv?days=30&esl_id={self.id}",
+            'target': 'self',
+        }
+
+    # -------------------------------------------------------------
     #               TÉLÉCHARGEMENT LOG ODOO
     # -------------------------------------------------------------
     def download_odoo_log(self):
-        # Chemin du fichier log depuis la configuration active
+        """
+        Télécharge la fin du fichier odoo.log filtrée sur les lignes du module.
+
+        Le fichier est lu en flux par le contrôleur /hpharma_esl/log (20 derniers
+        Mo, dernières 24 h, compressé en gzip) : rien n'est chargé en mémoire
+        ni enregistré en pièce jointe. Les paramètres tail, hours, esl_only et
+        gzip de l'URL permettent d'élargir la fenêtre.
+
+        Retour:
+            dict: action de téléchargement
+        """
         log_path = config['logfile']  # récupère directement depuis Odoo
 
         if not log_path:
@@ -604,23 +1681,11 @@ class Esl(models.Model):
         if not os.path.exists(log_path):
             raise UserError(f"Le fichier odoo.log est introuvable à : {log_path}")
 
-        # Lire le contenu
-        with open(log_path, 'rb') as f:
-            log_data = f.read()
-
-        # Créer un attachment temporaire
-        attachment = self.env['ir.attachment'].create({
-            'name': 'odoo.log',
-            'type': 'binary',
-            'datas': base64.b64encode(log_data),
-            'mimetype': 'text/plain',
-            'res_model': self._name,
-            'res_id': self.id or 0,
-        })
+        if not self.env.user.has_group('base.group_system'):
+            raise UserError("Le téléchargement du log est réservé aux administrateurs.")
 
-        # Action de téléchargement
         return {
             'type': 'ir.actions.act_url',
-            'url': f"/web/content/{attachment.id}?download=true",
+            'url': "/hpharma_esl/log?hours=24&esl_only=1&gzip=1",
             'target': 'self',
-        }
\ No newline at end of file
+        }
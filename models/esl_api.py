@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+Couche de transport commune à tous les appels de l'API ESL Hpharma.
+
+Une seule session HTTP keep-alive (pool de connexions) est partagée par
+processus worker : les appels successifs réutilisent la connexion TLS au
+lieu de refaire une poignée de main à chaque requête.
+
+Un disjoncteur (CircuitBreaker) par URL d'API et par processus coupe les
+appels après plusieurs échecs consécutifs : tant que l'API est considérée
+indisponible, les appels échouent immédiatement au lieu d'attendre les
+délais réseau, puis un seul appel de test est laissé passer.
+"""
+import gzip
+import json
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from .esl_rate_limit import TokenBucket
+import logging
+_logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://blev29.kalanda.info"
+API_PREFIX = "/api-esl/"
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 60
+# Nombre maximal de connexions gardées ouvertes par hôte et par processus
+POOL_MAXSIZE = 10
+# Codes HTTP considérés comme transitoires (nouvelle tentative possible)
+TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 1.0
+# Attente maximale entre deux tentatives, en secondes
+MAX_RETRY_DELAY = 60
+# Disjoncteur : échecs consécutifs avant ouverture et durée d'ouverture (s)
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_COOLDOWN = 60
+# Codes HTTP comptés comme des échecs par le disjoncteur (429 = API vivante mais saturée)
+BREAKER_STATUS = {500, 502, 503, 504}
+# Niveau de compression des corps de requête : bon compromis débit / CPU
+GZIP_LEVEL = 5
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+_breakers = {}
+_breakers_pid = None
+
+
+class CircuitOpenError(Exception):
+    """Levée sans appel réseau quand le disjoncteur de l'API est ouvert."""
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur d'une API : fermé (appels normaux), ouvert (échec immédiat)
+    puis semi-ouvert (un seul appel de test) une fois le délai écoulé.
+
+    Paramètres:
+        threshold (int): nombre d'échecs consécutifs avant ouverture
+        cooldown (float): durée d'ouverture en secondes
+    """
+
+    def __init__(self, threshold=DEFAULT_BREAKER_THRESHOLD, cooldown=DEFAULT_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        """Vrai tant que l'API est considérée indisponible (ouvert ou semi-ouvert)."""
+        return self.failures >= self.threshold
+
+    def allows_call(self):
+        """Vrai si un appel passerait maintenant (fermé, ou semi-ouvert sans test en cours)."""
+        return not self.is_open or (time.time() >= self.open_until and not self.probing)
+
+    def before_call(self, endpoint):
+        """Autorise l'appel ou lève CircuitOpenError."""
+        with self.lock:
+            if not self.is_open:
+                return
+            if time.time() < self.open_until or self.probing:
+                raise CircuitOpenError(
+                    f"API ESL indisponible ({endpoint} non appelé), "
+                    f"nouvel essai après {time.strftime('%H:%M:%S', time.localtime(self.open_until))}."
+                )
+            # Semi-ouvert : cet appel sert de test, les autres échouent en attendant
+            self.probing = True
+
+    def record_success(self):
+        with self.lock:
+            if self.is_open:
+                _logger.info("[Hpharma ESL] API de nouveau disponible, disjoncteur refermé.")
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.is_open:
+                self.open_until = time.time() + self.cooldown
+                _logger.warning(
+                    "[Hpharma ESL] API indisponible (%d échecs consécutifs), appels suspendus %d s.",
+                    self.failures, self.cooldown,
+                )
+
+    def trip(self, open_until):
+        """Ouvre le disjoncteur jusqu'à open_until (horodatage), p. ex. sur constat d'un autre worker."""
+        with self.lock:
+            self.failures = max(self.failures, self.threshold)
+            self.open_until = open_until
+            self.probing = False
+
+    def reset(self):
+        with self.lock:
+            self.failures = 0
+            self.probing = False
+            self.open_until = 0.0
+
+
+def get_breaker(base_url, threshold=None, cooldown=None):
+    """
+    Retourne le disjoncteur de l'URL d'API pour le processus courant.
+
+    Comme la session, les disjoncteurs sont propres à chaque processus et
+    recréés après un fork. Les seuils sont mis à jour à chaque appel.
+    """
+    global _breakers, _breakers_pid
+    pid = os.getpid()
+    with _session_lock:
+        if _breakers_pid != pid:
+            _breakers, _breakers_pid = {}, pid
+        key = base_url or DEFAULT_BASE_URL
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = _breakers[key] = CircuitBreaker()
+    breaker.threshold = max(1, threshold or DEFAULT_BREAKER_THRESHOLD)
+    breaker.cooldown = max(1, cooldown or DEFAULT_BREAKER_COOLDOWN)
+    return breaker
+
+
+def get_session():
+    """
+    Retourne la session HTTP du processus courant, créée à la demande.
+
+    La session est recréée après un fork : les connexions ouvertes ne
+    doivent jamais être partagées entre workers.
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session, _session_pid = session, pid
+                _logger.debug("[Hpharma ESL] Nouvelle session HTTP pour le processus %s.", pid)
+    return _session
+
+
+def build_url(base_url, endpoint):
+    """Construit l'URL complète d'un endpoint de l'API ESL."""
+    return (base_url or DEFAULT_BASE_URL).rstrip("/") + API_PREFIX + endpoint
+
+
+def request(method, base_url, endpoint, data=None, token=None, timeout=None, compress=False):
+    """
+    Envoie une requête à l'API ESL sur la session partagée.
+
+    Ne dépend pas de l'ORM : peut être appelée depuis un thread.
+
+    Paramètres:
+        method (str): méthode HTTP
+        base_url (str): URL de base de l'API
+        endpoint (str): nom de l'endpoint (ex. "ZK_sendItem")
+        data (dict | str | bytes): corps de la requête, sérialisé en JSON si dict/list
+        token (str): jeton envoyé dans l'en-tête Authorization (None pour ne pas l'envoyer)
+        timeout (tuple): délais (connexion, lecture) en secondes
+        compress (bool): compresse le corps en gzip (Content-Encoding: gzip)
+
+    Retour:
+        requests.Response: réponse HTTP
+    """
+    headers = {"Content-Type": "application/json"}
+    if token is not None:
+        headers["Authorization"] = token
+    if isinstance(data, (dict, list)):
+        data = json.dumps(data)
+    if compress and data:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        data = gzip.compress(data, compresslevel=GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    return get_session().request(
+        method,
+        build_url(base_url, endpoint),
+        data=data,
+        headers=headers,
+        timeout=timeout or (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT),
+    )
+
+
+def call(params, endpoint, data=None, method="POST", auth=True, compress=False):
+    """
+    Appelle un endpoint avec les paramètres de transport d'une connexion,
+    au travers du disjoncteur de son URL d'API.
+
+    Paramètres:
+        params (dict): paramètres retournés par Esl._esl_api_params()
+        endpoint (str): nom de l'endpoint
+        data (dict | str | bytes): corps de la requête
+        method (str): méthode HTTP
+        auth (bool): envoie le token dans l'en-tête Authorization
+        compress (bool): compresse le corps en gzip
+
+    Retour:
+        requests.Response: réponse HTTP
+
+    Lève:
+        CircuitOpenError: l'API est considérée indisponible, aucun appel n'est fait
+    """
+    breaker = get_breaker(params["base_url"], params.get("breaker_threshold"), params.get("breaker_cooldown"))
+    breaker.before_call(endpoint)
+    bucket = rate_limiter(params)
+    if bucket:
+        try:
+            waited = bucket.acquire(params.get("rate_max_wait"))
+        except Exception:
+            breaker.probing = False
+            raise
+        if waited > 1:
+            _logger.debug("[Hpharma ESL] %s : attente de %.1f s (limite de débit).", endpoint, waited)
+    try:
+        response = request(
+            method,
+            params["base_url"],
+            endpoint,
+            data=data,
+            token=params["token"] if auth else None,
+            timeout=params["timeout"],
+            compress=compress,
+        )
+    except (requests.Timeout, requests.ConnectionError):
+        breaker.record_failure()
+        raise
+    except Exception:
+        # Erreur locale (requête invalide...) : ne dit rien de la santé de l'API
+        breaker.probing = False
+        raise
+    if response.status_code in BREAKER_STATUS:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    if bucket and response.status_code == 429:
+        # Le fournisseur limite le débit : tous les workers ralentissent, pas seulement ce thread
+        bucket.penalize(retry_delay(0, params.get("retry_backoff", DEFAULT_RETRY_BACKOFF), response))
+    return response
+
+
+def rate_limiter(params):
+    """
+    Seau à jetons du budget de l'appel (params["rate_budget"]), partagé par
+    les workers de la machine ; None si le débit n'est pas limité.
+    """
+    rate = params.get("rate_limit")
+    if not rate or not params.get("rate_dir"):
+        return None
+    key = "%s_%s" % (params["base_url"] or DEFAULT_BASE_URL, params.get("rate_budget", "interactive"))
+    name = "".join(c if c.isalnum() else "_" for c in key)
+    return TokenBucket(os.path.join(params["rate_dir"], name + ".bucket"), rate)
+
+
+def retry_delay(attempt, backoff, response=None):
+    """
+    Délai avant la tentative suivante : backoff exponentiel avec gigue,
+    ou en-tête Retry-After de la réponse s'il est fourni.
+    """
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), MAX_RETRY_DELAY)
+    delay = backoff * (2 ** attempt)
+    return min(delay + random.uniform(0, delay / 2), MAX_RETRY_DELAY)
+
+
+def call_with_retry(params, endpoint, data=None, method="POST", auth=True, compress=False, attempts_log=None):
+    """
+    Comme call(), avec nouvelles tentatives sur erreurs transitoires.
+
+    Les délais d'attente, erreurs de connexion et codes TRANSIENT_STATUS
+    sont retentés jusqu'à params["max_retries"] fois, avec un backoff
+    exponentiel partant de params["retry_backoff"] secondes. Un disjoncteur
+    ouvert (CircuitOpenError) interrompt les tentatives immédiatement.
+
+    Paramètres:
+        attempts_log (list): complétée, pour chaque tentative ayant atteint le
+            réseau, de (code HTTP ou None si exception, durée en secondes) ;
+            permet à l'appelant d'enregistrer chaque tentative dans les métriques
+
+    Retour:
+        tuple: (requests.Response, nombre de tentatives effectuées)
+    """
+    max_retries = params.get("max_retries", DEFAULT_MAX_RETRIES)
+    backoff = params.get("retry_backoff", DEFAULT_RETRY_BACKOFF)
+    attempt = 0
+    while True:
+        attempt += 1
+        start = time.monotonic()
+        try:
+            response = call(params, endpoint, data, method=method, auth=auth, compress=compress)
+        except (requests.Timeout, requests.ConnectionError) as e:
+            if attempts_log is not None:
+                attempts_log.append((None, time.monotonic() - start))
+            if attempt > max_retries:
+                raise
+            delay = retry_delay(attempt - 1, backoff)
+            _logger.warning("[Hpharma ESL] %s : %s, nouvelle tentative dans %.1f s.", endpoint, e, delay)
+        else:
+            if attempts_log is not None:
+                attempts_log.append((response.status_code, response.elapsed.total_seconds()))
+            if response.status_code not in TRANSIENT_STATUS or attempt > max_retries:
+                return response, attempt
+            delay = retry_delay(attempt - 1, backoff, response)
+            _logger.warning(
+                "[Hpharma ESL] %s : HTTP %d, nouvelle tentative dans %.1f s.", endpoint, response.status_code, delay,
+            )
+        time.sleep(delay)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from datetime import timedelta
+import logging
+_logger = logging.getLogger(__name__)
+
+# Durée de conservation des métriques
+METRIC_RETENTION_DAYS = 400
+# Clé des métriques en attente dans les données precommit du curseur
+METRIC_BUFFER_KEY = "esl.api.metric"
+
+
+class EslApiMetric(models.Model):
+    """
+    Métriques des appels à l'API ESL, agrégées par connexion, endpoint et heure.
+
+    Chaque appel (getToken, ZK_sendItem, ZK_getStoreId, ZK_getTemplate,
+    bind/unbind...) incrémente la ligne de l'heure en cours : la table reste
+    petite quel que soit le volume d'appels.
+    """
+    _name = "esl.api.metric"
+    _description = "Métriques de l'API ESL"
+    _order = "period desc, endpoint"
+    _rec_name = "endpoint"
+
+    esl_id = fields.Many2one("esl.esl", string="Connexion ESL", required=True, ondelete="cascade", index=True)
+    endpoint = fields.Char("Endpoint", required=True, readonly=True)
+    period = fields.Datetime("Heure", required=True, readonly=True, index=True)
+    calls = fields.Integer("Appels", readonly=True)
+    errors = fields.Integer("Erreurs", readonly=True)
+    total_ms = fields.Float("Temps total (ms)", readonly=True)
+    avg_ms = fields.Float("Temps moyen (ms)", readonly=True, aggregator="avg")
+    max_ms = fields.Float("Temps max (ms)", readonly=True, aggregator="max")
+    bytes_sent = fields.Integer("Octets envoyés", readonly=True)
+    items = fields.Integer("Articles", readonly=True)
+    last_status = fields.Integer("Dernier code HTTP", readonly=True, aggregator=None)
+
+    _esl_endpoint_period_uniq = models.Constraint(
+        "UNIQUE(esl_id, endpoint, period)",
+        "Une seule ligne de métriques par connexion, endpoint et heure.",
+    )
+
+    @api.model
+    def _record(self, esl, endpoint, duration, status, payload_bytes=0, items=0):
+        """
+        Ajoute un appel aux métriques de l'heure en cours.
+
+        L'appel est agrégé en mémoire dans la transaction courante, puis
+        toutes les métriques de la transaction sont écrites en un seul upsert
+        juste avant sa validation (checkpoint d'un envoi, fin d'une tâche ou
+        d'une requête) : ni connexion ni transaction supplémentaire par appel,
+        et la ligne de l'heure, partagée par tous les workers, n'est
+        verrouillée qu'au moment de la validation. Une transaction annulée
+        emporte ses métriques.
+
+        Paramètres:
+            esl (recordset): connexion ESL
+            endpoint (str): nom de l'endpoint
+            duration (float): temps de réponse en secondes
+            status (int): code HTTP (None si l'appel a levé une exception)
+            payload_bytes (int): taille du corps de la requête
+            items (int): nombre d'articles / produits concernés
+        """
+        if not esl.id:
+            return
+        precommit = self.env.cr.precommit
+        buffer = precommit.data.get(METRIC_BUFFER_KEY)
+        if buffer is None:
+            buffer = precommit.data[METRIC_BUFFER_KEY] = {}
+            precommit.add(self._flush)
+        period = fields.Datetime.now().replace(minute=0, second=0, microsecond=0)
+        ms = (duration or 0.0) * 1000.0
+        sample = buffer.setdefault((esl.id, endpoint, period), {
+            "calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "bytes_sent": 0, "items": 0, "last_status": 0,
+        })
+        sample["calls"] += 1
+        sample["errors"] += 0 if status and status < 400 else 1
+        sample["total_ms"] += ms
+        sample["max_ms"] = max(sample["max_ms"], ms)
+        sample["bytes_sent"] += payload_bytes or 0
+        sample["items"] += items or 0
+        sample["last_status"] = status or 0
+
+    @api.model
+    def _flush(self):
+        """Écrit les métriques agrégées de la transaction courante (un seul upsert)."""
+        buffer = self.env.cr.precommit.data.pop(METRIC_BUFFER_KEY, None)
+        if not buffer:
+            return
+        now = fields.Datetime.now()
+        uid = self.env.uid
+        rows = [
+            (esl_id, endpoint, period, s["calls"], s["errors"], s["total_ms"], s["total_ms"] / s["calls"],
+             s["max_ms"], s["bytes_sent"], s["items"], s["last_status"], uid, now, uid, now)
+            for (esl_id, endpoint, period), s in buffer.items()
+        ]
+        try:
+            with self.env.cr.savepoint():
+                self.env.cr.execute(
+                    """
+                    INSERT INTO esl_api_metric
+                        (esl_id, endpoint, period, calls, errors, total_ms, avg_ms, max_ms, bytes_sent, items,
+                         last_status, create_uid, create_date, write_uid, write_date)
+                    VALUES %s
+                    ON CONFLICT (esl_id, endpoint, period) DO UPDATE
+                       SET calls = esl_api_metric.calls + EXCLUDED.calls,
+                           errors = esl_api_metric.errors + EXCLUDED.errors,
+                           total_ms = esl_api_metric.total_ms + EXCLUDED.total_ms,
+                           avg_ms = (esl_api_metric.total_ms + EXCLUDED.total_ms)
+                                    / (esl_api_metric.calls + EXCLUDED.calls),
+                           max_ms = GREATEST(esl_api_metric.max_ms, EXCLUDED.max_ms),
+                           bytes_sent = esl_api_metric.bytes_sent + EXCLUDED.bytes_sent,
+                           items = esl_api_metric.items + EXCLUDED.items,
+                           last_status = EXCLUDED.last_status,
+                           write_uid = EXCLUDED.write_uid,
+                           write_date = EXCLUDED.write_date
+                    """ % ", ".join(["%s"] * len(rows)),
+                    rows,
+                )
+        except Exception as e:
+            # Les métriques ne doivent jamais faire échouer la transaction appelante
+            _logger.warning("[Hpharma ESL] %d lignes de métriques non enregistrées : %s", len(rows), e)
+
+    @api.model
+    def _record_response(self, esl, endpoint, response, payload_bytes=0, items=0):
+        """Comme _record(), à partir d'une réponse HTTP."""
+        return self._record(
+            esl, endpoint, response.elapsed.total_seconds(), response.status_code, payload_bytes, items,
+        )
+
+    @api.model
+    def _record_attempts(self, esl, endpoint, attempts_log, payload_bytes=0, items=0):
+        """
+        Comme _record(), pour chaque tentative d'un appel avec nouvelles
+        tentatives (esl_api.call_with_retry) : les 429 / 5xx retentés et les
+        délais dépassés sont comptés avec leur durée mesurée. Les articles ne
+        sont comptés qu'une fois, sur la dernière tentative.
+
+        Paramètres:
+            attempts_log (list): tuples (code HTTP ou None, durée en secondes)
+        """
+        last = len(attempts_log) - 1
+        for index, (status, duration) in enumerate(attempts_log):
+            self._record(esl, endpoint, duration, status, payload_bytes, items if index == last else 0)
+
+    @api.autovacuum
+    def _gc_metrics(self):
+        """Supprime les métriques plus anciennes que METRIC_RETENTION_DAYS."""
+        limit = fields.Datetime.now() - timedelta(days=METRIC_RETENTION_DAYS)
+        self.search([("period", "<", limit)]).unlink()
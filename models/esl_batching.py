@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Choix de la taille des batches envoyés à ZK_sendItem.
+
+FixedBatchSizer reproduit le comportement historique (nombre fixe d'articles).
+AdaptiveBatchSizer plafonne chaque requête en octets et ajuste le nombre
+d'articles à partir des temps de réponse et des codes d'erreur observés
+(augmentation progressive, réduction franche en cas de lenteur ou d'erreur).
+"""
+import logging
+_logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 1000000
+DEFAULT_TARGET_LATENCY = 5.0
+# Codes HTTP indiquant une requête trop lourde ou une API saturée
+SHRINK_STATUS = {408, 413, 429, 500, 502, 503, 504}
+
+
+class FixedBatchSizer:
+    """Taille de batch fixe, sans plafond en octets."""
+
+    max_bytes = None
+
+    def __init__(self, size):
+        self.size = max(1, size)
+
+    def feedback(self, item_count, latency, status):
+        pass
+
+
+class AdaptiveBatchSizer:
+    """
+    Taille de batch ajustée selon les réponses de l'API.
+
+    Paramètres:
+        initial (int): nombre d'articles du premier batch
+        max_size (int): nombre maximal d'articles par batch
+        max_bytes (int): taille maximale du corps d'une requête, en octets
+        target_latency (float): temps de réponse visé, en secondes
+    """
+
+    min_size = 1
+
+    def __init__(self, initial, max_size, max_bytes=DEFAULT_MAX_BYTES, target_latency=DEFAULT_TARGET_LATENCY):
+        self.max_size = max(1, max_size)
+        self.size = min(max(self.min_size, initial), self.max_size)
+        self.max_bytes = max_bytes or DEFAULT_MAX_BYTES
+        self.target_latency = target_latency or DEFAULT_TARGET_LATENCY
+
+    def feedback(self, item_count, latency, status):
+        """
+        Ajuste la taille après la réponse d'un batch.
+
+        Paramètres:
+            item_count (int): nombre d'articles du batch
+            latency (float): temps de réponse en secondes (None si pas de réponse)
+            status (int): code HTTP (None en cas d'exception)
+        """
+        previous = self.size
+        if status is None or status in SHRINK_STATUS:
+            self.size = max(self.min_size, min(self.size, item_count) // 2)
+        elif latency is not None and latency > self.target_latency:
+            self.size = max(self.min_size, int(item_count * self.target_latency / latency))
+        elif latency is not None and latency < self.target_latency / 2 and item_count >= self.size:
+            self.size = min(self.max_size, self.size + max(1, self.size // 4))
+        if self.size != previous:
+            _logger.info(
+                "[Hpharma ESL] Taille de batch ajustée : %d → %d (HTTP %s, %.2f s).",
+                previous, self.size, status, latency or 0.0,
+            )
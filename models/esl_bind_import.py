@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import base64, csv, io, json
+from . import esl_api
+import logging
+_logger = logging.getLogger(__name__)
+
+# Plafond des appels bind/unbind simultanés, pour protéger l'API
+MAX_BIND_WORKERS = 8
+# Noms de colonnes reconnus dans l'en-tête du fichier
+PRODUCT_COLUMNS = {"product", "produit", "barcode", "code_barre", "code-barre"}
+ESL_COLUMNS = {"esl", "label", "etiquette", "étiquette"}
+TEMPLATE_COLUMNS = {"template", "template_id", "modele", "modèle"}
+
+
+class EslBindImport(models.TransientModel):
+    """
+    Liaison / déliaison en masse à partir d'un fichier CSV ou XLSX.
+
+    Chaque ligne contient (code-barres produit, code ESL[, template]).
+    L'import est exécuté en tâche de fond (esl.job) : les lignes sont
+    validées en bloc puis les appels API sont répartis sur un pool de
+    threads borné ; un rapport ligne par ligne est joint à la tâche.
+    """
+    _name = 'esl.bind.import'
+    _description = 'Import bind/unbind ESL'
+
+    name = fields.Char(default="Import bind/unbind ESL")
+    mode = fields.Selection([
+        ('bind', 'Lier'),
+        ('unbind', 'Délier'),
+    ], string="Opération", default='bind', required=True)
+    esl_config_id = fields.Many2one(
+        "esl.esl", string="Configuration ESL", required=True,
+        default=lambda self: self.env['esl.esl']._default_config())
+    file = fields.Binary("Fichier (CSV / XLSX)", required=True)
+    filename = fields.Char("Nom du fichier")
+    workers = fields.Integer("Appels simultanés", default=4)
+
+    # -------------------------------------------------------------
+    #                  LECTURE DU FICHIER
+    # -------------------------------------------------------------
+    def _read_rows(self):
+        """
+        Lit le fichier importé.
+
+        Retour:
+            list: tuples (n° de ligne, code-barres, code ESL, template)
+        """
+        self.ensure_one()
+        content = base64.b64decode(self.file or b"")
+        if (self.filename or "").lower().endswith((".xlsx", ".xlsm")):
+            raw_rows = self._read_xlsx(content)
+        else:
+            raw_rows = self._read_csv(content)
+        if not raw_rows:
+            raise UserError("Le fichier est vide.")
+
+        header = [str(c or "").strip().lower() for c in raw_rows[0]]
+        if PRODUCT_COLUMNS.intersection(header) or ESL_COLUMNS.intersection(header):
+            def column(names, default):
+                return next((i for i, h in enumerate(header) if h in names), default)
+            idx_product = column(PRODUCT_COLUMNS, None)
+            idx_esl = column(ESL_COLUMNS, None)
+            idx_template = column(TEMPLATE_COLUMNS, None)
+            start = 1
+        else:
+            idx_product, idx_esl, idx_template = 0, 1, 2
+            start = 0
+        if idx_esl is None:
+            raise UserError("Colonne ESL introuvable dans l'en-tête du fichier.")
+
+        def cell(row, idx):
+            if idx is None or idx >= len(row) or row[idx] is None:
+                return ""
+            value = row[idx]
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            return str(value).strip()
+
+        rows = []
+        for line_no, row in enumerate(raw_rows[start:], start=start + 1):
+            if not any(str(c or "").strip() for c in row):
+                continue
+            rows.append((line_no, cell(row, idx_product), cell(row, idx_esl), cell(row, idx_template)))
+        return rows
+
+    @staticmethod
+    def _read_csv(content):
+        text = content.decode("utf-8-sig", errors="replace")
+        try:
+            dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        return list(csv.reader(io.StringIO(text), dialect))
+
+    @staticmethod
+    def _read_xlsx(content):
+        try:
+            import openpyxl
+        except ImportError:
+            raise UserError("La lecture des fichiers XLSX nécessite le paquet Python openpyxl.")
+        workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        try:
+            return [list(row) for row in workbook.active.iter_rows(values_only=True)]
+        finally:
+            workbook.close()
+
+    # -------------------------------------------------------------
+    #                  VALIDATION ET ENVOI
+    # -------------------------------------------------------------
+    @api.model
+    def _prepare_calls(self, esl_record, rows, mode):
+        """
+        Valide les lignes en bloc et prépare les appels API.
+
+        Une ESL ne fait l'objet que d'un seul appel : les liaisons avec le
+        même template sont regroupées en un appel ZK_bindMultiESL, les
+        déliaisons en double sont fusionnées, et toute autre ligne qui
+        réutilise une ESL déjà présente est refusée (deux appels concurrents
+        sur la même étiquette laisseraient un résultat imprévisible).
+
+        Paramètres:
+            esl_record (recordset): configuration ESL (esl.esl)
+            rows (list): tuples (n° de ligne, code-barres, code ESL, template)
+            mode (str): 'bind' ou 'unbind'
+
+        Retour:
+            tuple: (appels [(endpoint, payload, lignes)], erreurs {n° ligne: message},
+                    produits {code-barres: product.product})
+        """
+        errors = {}
+        calls = []
+        if mode == 'unbind':
+            by_esl = {}
+            for row in rows:
+                line_no, _barcode, esl_code, _template = row
+                if not esl_code:
+                    errors[line_no] = "Code ESL manquant"
+                    continue
+                by_esl.setdefault(esl_code, []).append(row)
+            for esl_code, group in by_esl.items():
+                calls.append(("ZK_unbindESL", {
+                    "uniqueId": esl_record.unique_id,
+                    "StoreId": esl_record.StoreId,
+                    "esl": esl_code,
+                }, group))
+            return calls, errors, {}
+
+        products = self.env['product.product']._esl_resolve_barcodes([r[1] for r in rows])
+        # Code ESL -> (n° de la première ligne, template, lignes de l'appel)
+        by_esl = {}
+        for row in rows:
+            line_no, barcode, esl_code, template = row
+            if not esl_code:
+                errors[line_no] = "Code ESL manquant"
+            elif not barcode:
+                errors[line_no] = "Code-barres produit manquant"
+            elif barcode not in products:
+                errors[line_no] = f"Produit inconnu : {barcode}"
+            elif esl_code not in by_esl:
+                by_esl[esl_code] = (line_no, template, [row])
+            else:
+                first_line, first_template, group = by_esl[esl_code]
+                if template and template == first_template:
+                    group.append(row)
+                else:
+                    errors[line_no] = f"ESL {esl_code} déjà utilisée ligne {first_line}"
+        for esl_code, (_line_no, template, group) in by_esl.items():
+            if template:
+                calls.append(("ZK_bindMultiESL", {
+                    "uniqueId": esl_record.unique_id,
+                    "storeId": esl_record.StoreId,
+                    "templateId": template,
+                    "esl": esl_code,
+                    "data": {"products": [r[1] for r in group]},
+                    "debug": False,
+                }, group))
+            else:
+                calls.append(("ZK_bindSingleESL", {
+                    "uniqueId": esl_record.unique_id,
+                    "StoreId": esl_record.StoreId,
+                    "product": group[0][1],
+                    "esl": esl_code,
+                }, group))
+        return calls, errors, products
+
+    def action_import(self):
+        """
+        Lit le fichier et met l'import en file comme tâche de fond (esl.job) :
+        les appels API, limités par le budget de débit 'bulk', peuvent durer
+        bien plus longtemps qu'une requête HTTP.
+
+        Retour:
+            dict: action d'ouverture de la tâche, qui affiche sa progression et le rapport
+        """
+        self.ensure_one()
+        esl_record = self.esl_config_id
+        if not esl_record:
+            raise UserError("Aucune instance ESL trouvée.")
+        rows = self._read_rows()
+        job = self.env['esl.job']._enqueue(esl_record, 'bind_import', {
+            "data_json": json.dumps({"mode": self.mode, "workers": self.workers, "rows": rows}),
+            "result_filename": f"rapport_{self.mode}_esl.csv",
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'esl.job',
+            'view_mode': 'form',
+            'res_id': job.id,
+            'target': 'current',
+        }
+
+    @api.model
+    def _run_import(self, esl_record, job):
+        """
+        Exécute un import mis en file par action_import (appelé par esl.job) :
+        envoie les liaisons / déliaisons en parallèle (au plus `workers`
+        appels en cours), enregistre chaque résultat au fil de l'eau et joint
+        le rapport ligne par ligne à la tâche.
+
+        Sur annulation, plus aucun appel n'est lancé ; ceux déjà en cours
+        sont attendus et leur résultat enregistré, comme les autres.
+
+        Paramètres:
+            esl_record (recordset): configuration ESL (esl.esl)
+            job (recordset): tâche en cours (esl.job)
+
+        Retour:
+            dict: notification Odoo avec le résumé de l'import
+        """
+        data = json.loads(job.data_json or "{}")
+        mode = data.get("mode", 'bind')
+        rows = [tuple(row) for row in data.get("rows", [])]
+        calls, errors, products = self._prepare_calls(esl_record, rows, mode)
+
+        results = {line_no: ("erreur", message) for line_no, message in errors.items()}
+        stats = {"batches": 0, "sent": 0, "failed": len(errors)}
+        job.batches_total = len(calls)
+        if calls:
+            esl_record._check_api_available("bind")
+            params = esl_record._esl_api_params('bulk')
+            workers = max(1, min(data.get("workers") or 1, MAX_BIND_WORKERS))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="esl_bind") as executor:
+                in_flight = deque()
+                for endpoint, payload, group in calls:
+                    if esl_record._job_cancel_requested():
+                        # Les appels non lancés restent « Non traitée »
+                        _logger.info("[Hpharma ESL] Import annulé à la demande de l'utilisateur.")
+                        break
+                    attempts_log = []
+                    future = executor.submit(
+                        esl_api.call_with_retry, params, endpoint, payload, attempts_log=attempts_log)
+                    in_flight.append((endpoint, payload, group, attempts_log, future))
+                    while len(in_flight) >= workers:
+                        self._collect_call(esl_record, *in_flight.popleft(), products, results, stats)
+                while in_flight:
+                    self._collect_call(esl_record, *in_flight.popleft(), products, results, stats)
+            esl_record._update_api_health()
+
+        ok_count = sum(1 for status, _msg in results.values() if status == "ok")
+        summary = f"{len(rows)} lignes — réussies : {ok_count}, en erreur : {len(rows) - ok_count}"
+        job.result_file = base64.b64encode(self._build_report(rows, results))
+        _logger.info("[Hpharma ESL] Import %s : %s", mode, summary)
+        return esl_record._notify(summary)
+
+    def _collect_call(self, esl_record, endpoint, payload, group, attempts_log, future, products, results, stats):
+        """
+        Enregistre le résultat d'un appel terminé (dans l'ordre d'envoi) :
+        rapport des lignes, liaison locale si l'appel a réussi, checkpoint.
+
+        Paramètres:
+            group (list): lignes du fichier couvertes par l'appel
+            attempts_log (list): tentatives de l'appel (code HTTP, durée), complétées par le thread
+            future (Future): appel API en cours
+            products (dict): produits par code-barres, résolus par _prepare_calls
+            results (dict): {n° de ligne: (statut, message)}, complété
+            stats (dict): compteurs de l'import, complétés
+        """
+        outcome = self._call_outcome(esl_record, endpoint, payload, group, attempts_log, future)
+        for row in group:
+            results[row[0]] = outcome
+        stats["batches"] += 1
+        if outcome[0] == "ok":
+            self._register_binding(esl_record, endpoint, payload, group, products)
+            stats["sent"] += len(group)
+        else:
+            stats["failed"] += len(group)
+        # Chaque résultat est validé : un arrêt du worker ne perd que les appels en cours
+        esl_record._checkpoint(stats)
+
+    def _call_outcome(self, esl_record, endpoint, payload, rows, attempts_log, future):
+        """
+        Retourne (statut, message) pour un appel API terminé et enregistre
+        chacune de ses tentatives dans les métriques (esl.api.metric).
+        """
+        Metric = self.env['esl.api.metric']
+        payload_bytes = len(json.dumps(payload))
+        try:
+            res, _attempts = future.result()
+        except Exception as e:
+            Metric._record_attempts(esl_record, endpoint, attempts_log, payload_bytes, len(rows))
+            return ("erreur", str(e))
+        Metric._record_attempts(esl_record, endpoint, attempts_log, payload_bytes, len(rows))
+        if res.status_code != 200:
+            return ("erreur", f"HTTP {res.status_code} : {res.text}")
+        return ("ok", "")
+
+    def _register_binding(self, esl_record, endpoint, payload, rows, products):
+        """
+        Reporte une liaison / déliaison réussie dans esl.binding.
+
+        Paramètres:
+            products (dict): produits par code-barres, résolus par _prepare_calls
+        """
+        Binding = self.env['esl.binding'].sudo()
+        if endpoint == "ZK_unbindESL":
+            Binding._register_unbind(esl_record, [payload["esl"]])
+            return
+        Binding._register_bind(
+            esl_record,
+            payload["esl"],
+            self.env['product.product'].union(*(products[r[1]] for r in rows)),
+            template=payload.get("templateId", False),
+        )
+
+    @staticmethod
+    def _build_report(rows, results):
+        """Construit le rapport CSV (une ligne par ligne du fichier importé)."""
+        output = io.StringIO()
+        writer = csv.writer(output, delimiter=";")
+        writer.writerow(["ligne", "produit", "esl", "template", "statut", "message"])
+        for line_no, barcode, esl_code, template in rows:
+            status, message = results.get(line_no, ("erreur", "Non traitée"))
+            writer.writerow([line_no, barcode, esl_code, template, status, message])
+        return output.getvalue().encode("utf-8-sig")
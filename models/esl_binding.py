@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+import logging
+_logger = logging.getLogger(__name__)
+
+
+class EslBinding(models.Model):
+    """
+    Liaisons connues entre produits et étiquettes (ESL).
+
+    Tenues à jour par tous les chemins de liaison / déliaison (assistants,
+    template multi-produits, import en masse) ; permettent de n'envoyer
+    que les produits réellement présents sur une étiquette.
+    """
+    _name = "esl.binding"
+    _description = "Liaison produit / étiquette ESL"
+    _order = "esl_code, id"
+    _rec_name = "esl_code"
+
+    esl_id = fields.Many2one("esl.esl", string="Connexion ESL", required=True, ondelete="cascade", index=True)
+    product_id = fields.Many2one("product.product", string="Produit", required=True, ondelete="cascade", index=True)
+    esl_code = fields.Char("Code ESL", required=True, index=True)
+    template_id = fields.Char("Template")
+    bind_date = fields.Datetime("Date de liaison", default=lambda self: fields.Datetime.now(), readonly=True)
+
+    @api.model
+    def _register_bind(self, esl, esl_code, products, template=False):
+        """
+        Enregistre la liaison d'une étiquette : elle remplace les produits
+        précédemment liés à ce code ESL.
+
+        Paramètres:
+            esl (recordset): connexion ESL
+            esl_code (str): code de l'étiquette
+            products (recordset): produits affichés sur l'étiquette
+            template (str): identifiant du template (liaison multi-produits)
+        """
+        self.search([("esl_id", "=", esl.id), ("esl_code", "=", esl_code)]).unlink()
+        self.create([{
+            "esl_id": esl.id,
+            "product_id": product.id,
+            "esl_code": esl_code,
+            "template_id": template,
+        } for product in products])
+        # Les produits nouvellement étiquetés partent avec le prochain passage de la file d'attente
+        self.env['esl.outbox']._enqueue(products.ids, esl)
+
+    @api.model
+    def _register_unbind(self, esl, esl_codes):
+        """
+        Supprime les liaisons des étiquettes détachées.
+
+        Paramètres:
+            esl (recordset): connexion ESL
+            esl_codes (list): codes des étiquettes
+        """
+        self.search([("esl_id", "=", esl.id), ("esl_code", "in", list(esl_codes))]).unlink()
+
+    @api.model
+    def _bound_product_ids(self, esl):
+        """Retourne les ids des produits liés à au moins une étiquette de la connexion."""
+        self.flush_model(["esl_id", "product_id"])
+        self.env.cr.execute("SELECT DISTINCT product_id FROM esl_binding WHERE esl_id = %s", [esl.id])
+        return [row[0] for row in self.env.cr.fetchall()]
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from datetime import timedelta
+import threading
+import logging
+_logger = logging.getLogger(__name__)
+
+# Une tâche "en cours" sans signe de vie depuis ce délai est vérifiée : elle est
+# considérée comme interrompue si plus aucun worker ne tient le verrou de sa configuration
+JOB_STALE_MINUTES = 60
+# Durée de conservation des tâches terminées
+JOB_RETENTION_DAYS = 30
+# Paramètres système : nombre de tâches exécutées en parallèle, durée d'une tranche d'envoi
+JOB_WORKERS_PARAM = "hpharma_esl.job_workers"
+JOB_SLICE_PARAM = "hpharma_esl.job_slice_seconds"
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_JOB_SLICE_SECONDS = 600
+# Plafond des tâches simultanées (chacune occupe une connexion à la base)
+MAX_JOB_WORKERS = 8
+# Espace des verrous consultatifs PostgreSQL "une tâche à la fois par configuration" (clé : esl_id)
+JOB_LOCK_NAMESPACE = 0x45534C
+
+
+class EslJob(models.Model):
+    """
+    Tâche ESL exécutée en arrière-plan par le cron ir_cron_esl_jobs.
+
+    Les boutons (import, synchronisation des templates, connexion) et le
+    cron d'envoi automatique mettent une tâche en file au lieu de bloquer
+    le worker HTTP. La tâche expose sa progression et peut être annulée.
+
+    Les tâches de plusieurs configurations (pharmacies / stores) sont
+    exécutées en parallèle, une seule à la fois par configuration. Un envoi
+    qui dépasse sa tranche de temps alors que d'autres configurations
+    attendent est remis en fin de file et reprendra là où il s'est arrêté :
+    un gros catalogue ne bloque pas les petits.
+    """
+    _name = "esl.job"
+    _description = "Tâche ESL en arrière-plan"
+    _order = "id desc"
+
+    esl_id = fields.Many2one("esl.esl", string="Connexion ESL", required=True, ondelete="cascade", index=True)
+    job_type = fields.Selection([
+        ('import', 'Envoi des produits'),
+        ('full_resync', 'Resynchronisation complète'),
+        ('sync_templates', 'Synchronisation des templates'),
+        ('connect', 'Connexion'),
+        ('bind_import', 'Import bind/unbind'),
+    ], string="Type", required=True, readonly=True)
+    state = fields.Selection([
+        ('queued', 'En file'),
+        ('running', 'En cours'),
+        ('done', 'Terminée'),
+        ('failed', 'Échec'),
+        ('cancelled', 'Annulée'),
+    ], string="Statut", default='queued', required=True, readonly=True, index=True)
+    cancel_requested = fields.Boolean("Annulation demandée", readonly=True)
+    queued_at = fields.Datetime("En file depuis", default=fields.Datetime.now, readonly=True, index=True)
+    slice_start = fields.Datetime("Début de la tranche", readonly=True)
+    slices = fields.Integer("Tranches exécutées", readonly=True)
+    requeue = fields.Boolean("À remettre en file", readonly=True)
+    sync_run_id = fields.Many2one("esl.sync.run", string="Envoi", readonly=True, ondelete="set null")
+    user_id = fields.Many2one("res.users", string="Demandée par", default=lambda self: self.env.user, readonly=True)
+    date_start = fields.Datetime("Début", readonly=True)
+    date_end = fields.Datetime("Fin", readonly=True)
+    heartbeat = fields.Datetime("Dernier signe de vie", readonly=True)
+    batches_done = fields.Integer("Batches envoyés", readonly=True)
+    batches_total = fields.Integer("Batches prévus", readonly=True)
+    items_done = fields.Integer("Produits traités", readonly=True)
+    items_per_sec = fields.Float("Produits / s", readonly=True, digits=(16, 1))
+    progress = fields.Float("Progression (%)", compute="_compute_progress")
+    message = fields.Text("Résultat", readonly=True)
+    data_json = fields.Text("Données de la tâche", readonly=True)
+    result_file = fields.Binary("Rapport", readonly=True, attachment=True)
+    result_filename = fields.Char("Nom du rapport", readonly=True)
+
+    @api.depends("batches_done", "batches_total", "state")
+    def _compute_progress(self):
+        for job in self:
+            if job.state == 'done':
+                job.progress = 100.0
+            elif job.batches_total:
+                job.progress = min(100.0, 100.0 * job.batches_done / job.batches_total)
+            else:
+                job.progress = 0.0
+
+    # -------------------------------------------------------------
+    #                  MISE EN FILE
+    # -------------------------------------------------------------
+    @api.model
+    def _enqueue(self, esl, job_type, vals=None):
+        """
+        Met une tâche en file, sauf si une tâche identique est déjà en attente
+        ou en cours pour cette connexion, puis réveille le cron des tâches.
+
+        Paramètres:
+            esl (recordset): connexion ESL (esl.esl)
+            job_type (str): type de la tâche
+            vals (dict): données propres à la tâche (ex. lignes d'un import) ;
+                la tâche est alors toujours créée
+
+        Retour:
+            recordset: tâche créée ou tâche existante (esl.job)
+        """
+        job = self.browse()
+        if vals is None:
+            job = self.search([
+                ("esl_id", "=", esl.id),
+                ("job_type", "=", job_type),
+                ("state", "in", ("queued", "running")),
+            ], limit=1)
+        if not job:
+            job = self.create(dict(vals or {}, esl_id=esl.id, job_type=job_type))
+        cron = self.env.ref('module_HpharmaESLSystem.ir_cron_esl_jobs', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+        return job
+
+    def action_cancel(self):
+        """Annule une tâche en file, ou demande l'arrêt d'une tâche en cours."""
+        self.filtered(lambda j: j.state == 'queued').write({"state": 'cancelled', "date_end": fields.Datetime.now()})
+        self.filtered(lambda j: j.state == 'running').write({"cancel_requested": True})
+
+    # -------------------------------------------------------------
+    #                  PROGRESSION
+    # -------------------------------------------------------------
+    def _update_progress(self, stats):
+        """
+        Enregistre l'avancement d'un envoi de produits.
+
+        Paramètres:
+            stats (dict): compteurs de Esl._upload_batches
+        """
+        self.ensure_one()
+        # Avancement des tranches précédentes d'une tâche remise en file
+        base_batches, base_items = self.env.context.get("esl_job_base", (0, 0))
+        items = base_items + stats.get("sent", 0) + stats.get("failed", 0)
+        elapsed = (fields.Datetime.now() - (self.date_start or fields.Datetime.now())).total_seconds()
+        self.write({
+            "heartbeat": fields.Datetime.now(),
+            "batches_done": base_batches + stats.get("batches", 0),
+            "items_done": items,
+            "items_per_sec": items / elapsed if elapsed > 0 else 0.0,
+        })
+
+    def _is_cancel_requested(self):
+        """Relit le drapeau d'annulation (valeur validée par une autre transaction)."""
+        self.ensure_one()
+        self.invalidate_recordset(["cancel_requested"])
+        return self.cancel_requested
+
+    def _should_yield(self):
+        """
+        Vrai si la tranche de temps de la tâche est écoulée et qu'une tâche
+        d'une autre configuration attend dans la file.
+        """
+        self.ensure_one()
+        slice_seconds = int(self.env['ir.config_parameter'].sudo().get_param(
+            JOB_SLICE_PARAM, DEFAULT_JOB_SLICE_SECONDS))
+        if slice_seconds <= 0 or not self.slice_start:
+            return False
+        if (fields.Datetime.now() - self.slice_start).total_seconds() < slice_seconds:
+            return False
+        return bool(self.search_count([
+            ("state", "=", 'queued'),
+            ("esl_id", "!=", self.esl_id.id),
+        ], limit=1))
+
+    # -------------------------------------------------------------
+    #                  EXÉCUTION
+    # -------------------------------------------------------------
+    @api.model
+    def _cron_run_jobs(self, job_types=None):
+        """
+        Exécute les tâches en file jusqu'à ce que la file soit vide, avec
+        jusqu'à hpharma_esl.job_workers tâches en parallèle.
+
+        Chaque tâche est réservée avec FOR UPDATE SKIP LOCKED : plusieurs
+        workers peuvent traiter la file sans exécuter deux fois la même tâche.
+        Les threads supplémentaires ont chacun leur propre curseur.
+
+        Paramètres:
+            job_types (list): types de tâches à traiter (par défaut tous)
+        """
+        self._recover_stale_jobs()
+        workers = int(self.env['ir.config_parameter'].sudo().get_param(JOB_WORKERS_PARAM, DEFAULT_JOB_WORKERS))
+        workers = max(1, min(workers, MAX_JOB_WORKERS))
+        threads = [
+            threading.Thread(
+                target=self._run_jobs_thread,
+                args=(self.env.cr.dbname, self.env.uid, dict(self.env.context), job_types),
+                name=f"esl_job_{i}",
+                daemon=True,
+            )
+            for i in range(1, workers)
+        ]
+        for thread in threads:
+            thread.start()
+        self._run_jobs_loop(job_types)
+        for thread in threads:
+            thread.join()
+
+    @api.model
+    def _run_jobs_thread(self, dbname, uid, context, job_types):
+        """Boucle d'exécution d'un thread supplémentaire, dans sa propre transaction."""
+        threading.current_thread().dbname = dbname
+        try:
+            with self.env.registry.cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                env['esl.job']._run_jobs_loop(job_types)
+        except Exception:
+            _logger.exception("[Hpharma ESL] Arrêt inattendu d'un thread des tâches de fond.")
+
+    @api.model
+    def _run_jobs_loop(self, job_types=None):
+        """Réserve et exécute les tâches une à une jusqu'à ce qu'aucune ne soit disponible."""
+        while True:
+            job = self._claim_next(job_types)
+            if not job:
+                return
+            try:
+                job._run()
+            finally:
+                job._release_config_lock()
+
+    @api.model
+    def _claim_next(self, job_types=None):
+        """
+        Réserve la prochaine tâche en file et la passe à l'état en cours (validé).
+
+        Les tâches sont servies par ancienneté dans la file (une tâche remise
+        en file repasse derrière les autres), en ignorant les configurations
+        qui ont déjà une tâche en cours.
+
+        Le test NOT EXISTS ne voit pas une réservation concurrente non encore
+        validée : l'exclusivité par configuration est garantie par un verrou
+        consultatif de session sur esl_id, pris ici et gardé pendant toute
+        l'exécution (libéré par _release_config_lock, ou par PostgreSQL si le
+        worker disparaît).
+        """
+        busy = []
+        while True:
+            query = """
+                SELECT id, esl_id FROM esl_job j
+                 WHERE state = 'queued'
+                   AND NOT EXISTS (SELECT 1 FROM esl_job r WHERE r.esl_id = j.esl_id AND r.state = 'running')
+            """
+            params = []
+            if job_types:
+                query += " AND job_type = ANY(%s)"
+                params.append(list(job_types))
+            if busy:
+                query += " AND esl_id != ALL(%s)"
+                params.append(busy)
+            query += " ORDER BY queued_at, id LIMIT 1 FOR UPDATE SKIP LOCKED"
+            self.env.cr.execute(query, params)
+            row = self.env.cr.fetchone()
+            if not row:
+                return self
+            job_id, esl_id = row
+            self.env.cr.execute("SELECT pg_try_advisory_lock(%s, %s)", [JOB_LOCK_NAMESPACE, esl_id])
+            if self.env.cr.fetchone()[0]:
+                break
+            # Une tâche de cette configuration vient d'être réservée par un autre worker
+            self.env.cr.rollback()
+            busy.append(esl_id)
+        job = self.browse(job_id)
+        now = fields.Datetime.now()
+        job.write({"state": 'running', "date_start": job.date_start or now, "slice_start": now, "heartbeat": now})
+        self.env.cr.commit()
+        return job
+
+    def _release_config_lock(self):
+        """Libère le verrou consultatif de la configuration pris par _claim_next."""
+        self.ensure_one()
+        self.env.cr.execute("SELECT pg_advisory_unlock(%s, %s)", [JOB_LOCK_NAMESPACE, self.esl_id.id])
+
+    def _run(self):
+        """Exécute la tâche puis enregistre son résultat (transaction validée)."""
+        self.ensure_one()
+        _logger.info("[Hpharma ESL] Début de la tâche %s (%s).", self.id, self.job_type)
+        esl = self.esl_id.with_context(
+            lang=self.esl_id.user_lang or 'fr_BE',
+            esl_commit_checkpoints=True,
+            esl_job_id=self.id,
+            esl_job_base=(self.batches_done, self.items_done),
+        )
+        try:
+            result = esl._execute_job(self.job_type)
+            message = (result or {}).get("params", {}).get("message", "") if isinstance(result, dict) else ""
+            vals = {"slices": self.slices + 1, "message": message}
+            if self._is_cancel_requested():
+                vals.update(state='cancelled', date_end=fields.Datetime.now())
+            elif self.requeue:
+                # Tranche écoulée : la tâche repasse en fin de file pour laisser place aux autres stores
+                vals.update(state='queued', requeue=False, queued_at=fields.Datetime.now(),
+                            message="Remise en file après une tranche de temps, envoi à reprendre.")
+            else:
+                vals.update(state='done', date_end=fields.Datetime.now())
+            self.write(vals)
+            self.env.cr.commit()
+        except Exception as e:
+            self.env.cr.rollback()
+            _logger.exception("[Hpharma ESL] Échec de la tâche %s (%s).", self.id, self.job_type)
+            self.write({"state": 'failed', "date_end": fields.Datetime.now(), "message": str(e)})
+            self.esl_id.state = "error"
+            self.env.cr.commit()
+
+    def _worker_alive(self):
+        """
+        Vrai si un worker tient encore le verrou de la configuration de la
+        tâche : une tâche silencieuse (premier batch très lent) n'est pas
+        déclarée interrompue tant que son worker est en vie.
+        """
+        self.ensure_one()
+        self.env.cr.execute("SELECT pg_try_advisory_lock(%s, %s)", [JOB_LOCK_NAMESPACE, self.esl_id.id])
+        if not self.env.cr.fetchone()[0]:
+            return True
+        self._release_config_lock()
+        return False
+
+    @api.model
+    def _recover_stale_jobs(self):
+        """
+        Marque en échec les tâches en cours dont le worker a disparu, et clôture
+        leur envoi (esl.sync.run) pour qu'il puisse être repris ou purgé.
+        """
+        limit = fields.Datetime.now() - timedelta(minutes=JOB_STALE_MINUTES)
+        silent = self.search([
+            ("state", "=", 'running'),
+            '|', ("heartbeat", "<", limit), '&', ("heartbeat", "=", False), ("write_date", "<", limit),
+        ])
+        stale = silent.filtered(lambda job: not job._worker_alive())
+        if not stale:
+            return
+        message = "Tâche interrompue (worker disparu)."
+        stale.write({"state": 'failed', "date_end": fields.Datetime.now(), "message": message})
+        for run in stale.sync_run_id.filtered(lambda r: r.state == 'running'):
+            run._finish({"message": f"{message} Envoi à reprendre."})
+        self.env.cr.commit()
+
+    @api.autovacuum
+    def _gc_jobs(self):
+        """Supprime les tâches terminées plus anciennes que JOB_RETENTION_DAYS."""
+        limit = fields.Datetime.now() - timedelta(days=JOB_RETENTION_DAYS)
+        self.search([("create_date", "<", limit), ("state", "not in", ("queued", "running"))]).unlink()
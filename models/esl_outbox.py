@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields
+from odoo.tools import split_every
+import logging
+_logger = logging.getLogger(__name__)
+
+
+class EslOutbox(models.Model):
+    """
+    File d'attente des produits modifiés à envoyer à l'ESL, par connexion.
+
+    Alimentée par les modifications de produits, vidée par le cron
+    ir_cron_esl_outbox. Une seule ligne par connexion et par produit : les
+    modifications successives d'un même produit sont regroupées, et chaque
+    connexion est servie indépendamment (une API indisponible ne retient
+    pas les produits des autres connexions).
+    """
+    _name = "esl.outbox"
+    _description = "File d'attente des produits ESL"
+    _order = "write_date, id"
+
+    esl_id = fields.Many2one("esl.esl", string="Connexion ESL", required=True, ondelete="cascade", index=True)
+    product_id = fields.Many2one("product.product", string="Produit", required=True, ondelete="cascade")
+
+    _esl_product_uniq = models.Constraint(
+        "UNIQUE(esl_id, product_id)",
+        "Un produit n'apparaît qu'une fois par connexion dans la file d'attente ESL.",
+    )
+
+    def _enqueue(self, product_ids, esl=None):
+        """
+        Ajoute des produits à la file d'attente (sans doublon), pour chaque
+        connexion active dont l'envoi automatique est activé.
+
+        Paramètres:
+            product_ids (list): ids des produits modifiés
+            esl (recordset): limite la mise en file à ces connexions
+        """
+        if not product_ids or (esl is not None and not esl):
+            return
+        self.env['esl.esl'].flush_model(["active", "cron_active"])
+        now = fields.Datetime.now()
+        uid = self.env.uid
+        for chunk in split_every(1000, set(product_ids)):
+            self.env.cr.execute(
+                """
+                INSERT INTO esl_outbox (esl_id, product_id, create_uid, create_date, write_uid, write_date)
+                SELECT e.id, p.product_id, %s, %s, %s, %s
+                  FROM esl_esl e, unnest(%s::int[]) AS p(product_id)
+                 WHERE e.active AND e.cron_active AND (%s OR e.id = ANY(%s))
+                ON CONFLICT (esl_id, product_id) DO UPDATE
+                   SET write_uid = EXCLUDED.write_uid,
+                       write_date = EXCLUDED.write_date
+                """,
+                [uid, now, uid, now, list(chunk), esl is None, esl.ids if esl else []],
+            )
+        self.invalidate_model()
+
+    def _claim(self, esl, limit):
+        """
+        Retire de la file les plus anciens produits d'une connexion et les retourne.
+
+        Les lignes sont supprimées (DELETE ... RETURNING) : une fois la
+        transaction validée par l'appelant, l'envoi ne garde aucun verrou sur
+        la file et les modifications de produits concurrentes y créent de
+        nouvelles lignes sans attendre. En cas d'échec de l'envoi, l'appelant
+        remet les produits en file (_enqueue).
+
+        Paramètres:
+            esl (recordset): connexion ESL
+            limit (int): nombre maximal de produits retirés
+
+        Retour:
+            list: ids des produits retirés de la file
+        """
+        self.env.cr.execute(
+            """
+            DELETE FROM esl_outbox
+             WHERE id IN (SELECT id FROM esl_outbox
+                           WHERE esl_id = %s
+                           ORDER BY write_date, id
+                           LIMIT %s FOR UPDATE SKIP LOCKED)
+            RETURNING product_id
+            """,
+            [esl.id, limit],
+        )
+        product_ids = [row[0] for row in self.env.cr.fetchall()]
+        self.invalidate_model()
+        return product_ids
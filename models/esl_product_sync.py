@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields
+from odoo.tools import split_every
+import logging
+_logger = logging.getLogger(__name__)
+
+
+class EslProductSync(models.Model):
+    """
+    Empreinte du dernier article envoyé avec succès à l'ESL, par produit.
+
+    Sert au mode d'envoi différentiel : un produit n'est renvoyé que si
+    l'empreinte de son article diffère de celle enregistrée ici.
+    """
+    _name = "esl.product.sync"
+    _description = "Empreinte des produits envoyés à l'ESL"
+
+    esl_id = fields.Many2one("esl.esl", string="Connexion ESL", required=True, ondelete="cascade", index=True)
+    product_id = fields.Many2one("product.product", string="Produit", required=True, ondelete="cascade", index=True)
+    payload_hash = fields.Char("Empreinte", required=True)
+    last_sent = fields.Datetime("Dernier envoi")
+
+    _esl_product_uniq = models.Constraint(
+        "UNIQUE(esl_id, product_id)",
+        "Une seule empreinte par produit et par connexion ESL.",
+    )
+
+    def _get_hashes(self, esl, product_ids):
+        """
+        Retourne les empreintes connues pour les produits donnés.
+
+        Paramètres:
+            esl (recordset): connexion ESL
+            product_ids (list): ids des produits
+
+        Retour:
+            dict: {product_id: payload_hash}
+        """
+        if not product_ids:
+            return {}
+        self.flush_model(["esl_id", "product_id", "payload_hash"])
+        self.env.cr.execute(
+            "SELECT product_id, payload_hash FROM esl_product_sync WHERE esl_id = %s AND product_id = ANY(%s)",
+            [esl.id, list(product_ids)],
+        )
+        return dict(self.env.cr.fetchall())
+
+    def _record_hashes(self, esl, hashes):
+        """
+        Enregistre (upsert) les empreintes des produits envoyés avec succès.
+
+        Paramètres:
+            esl (recordset): connexion ESL
+            hashes (dict): {product_id: payload_hash}
+        """
+        if not hashes:
+            return
+        now = fields.Datetime.now()
+        uid = self.env.uid
+        rows = [(esl.id, pid, h, now, uid, now, uid, now) for pid, h in hashes.items()]
+        for chunk in split_every(1000, rows):
+            self.env.cr.execute(
+                """
+                INSERT INTO esl_product_sync
+                    (esl_id, product_id, payload_hash, last_sent, create_uid, create_date, write_uid, write_date)
+                VALUES %s
+                ON CONFLICT (esl_id, product_id) DO UPDATE
+                   SET payload_hash = EXCLUDED.payload_hash,
+                       last_sent = EXCLUDED.last_sent,
+                       write_uid = EXCLUDED.write_uid,
+                       write_date = EXCLUDED.write_date
+                """ % ", ".join(["%s"] * len(chunk)),
+                list(chunk),
+            )
+        self.invalidate_model(["payload_hash", "last_sent"])
+
+    def _reset(self, esl):
+        """Oublie toutes les empreintes d'une connexion (resynchronisation complète)."""
+        self.flush_model()
+        self.env.cr.execute("DELETE FROM esl_product_sync WHERE esl_id = %s", [esl.id])
+        self.invalidate_model()
+        _logger.info("[Hpharma ESL] Empreintes produits réinitialisées pour la connexion %s.", esl.id)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Limitation du débit des appels à l'API ESL, partagée par tous les workers d'un serveur.
+
+Chaque budget (envois en masse, appels interactifs) est un seau à jetons
+dont l'état (jetons, horodatage) tient dans un petit fichier verrouillé
+avec flock : les threads et les processus Odoo d'une même machine puisent
+dans le même seau. Un appel réserve son jeton puis attend, hors verrou, le
+temps nécessaire : les appelants sont servis dans l'ordre d'arrivée.
+
+Sans fcntl (Windows), le seau est limité au processus courant.
+"""
+import os
+import struct
+import threading
+import time
+import logging
+_logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Format du fichier d'état : jetons disponibles, horodatage du dernier calcul
+STATE_FORMAT = "dd"
+STATE_SIZE = struct.calcsize(STATE_FORMAT)
+
+_local_states = {}
+_local_lock = threading.Lock()
+
+
+class RateLimitTimeout(Exception):
+    """Levée quand l'attente d'un jeton dépasserait l'attente maximale autorisée."""
+
+
+class TokenBucket:
+    """
+    Seau à jetons partagé.
+
+    Paramètres:
+        path (str): fichier d'état du seau
+        rate (float): jetons ajoutés par seconde (requêtes / s)
+        burst (float): nombre maximal de jetons accumulés
+    """
+
+    def __init__(self, path, rate, burst=None):
+        self.path = path
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst or rate))
+
+    def acquire(self, max_wait=None):
+        """
+        Prend un jeton, en attendant si nécessaire.
+
+        Paramètres:
+            max_wait (float): attente maximale en secondes (None = illimitée)
+
+        Retour:
+            float: temps attendu, en secondes
+
+        Lève:
+            RateLimitTimeout: l'attente dépasserait max_wait (aucun jeton n'est pris)
+        """
+        wait = self._update(lambda tokens: self._reserve(tokens, max_wait))
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def penalize(self, delay):
+        """Vide le seau pour `delay` secondes (API saturée, 429) : tous les workers ralentissent."""
+        self._update(lambda tokens: (min(tokens, -delay * self.rate), None))
+
+    def _reserve(self, tokens, max_wait):
+        wait = max(0.0, (1.0 - tokens) / self.rate)
+        if max_wait is not None and wait > max_wait:
+            raise RateLimitTimeout(f"Débit de l'API ESL dépassé (attente estimée {wait:.1f} s).")
+        return tokens - 1.0, wait
+
+    def _refill(self, tokens, stamp, now):
+        if stamp is None:
+            return self.burst
+        return min(self.burst, tokens + max(0.0, now - stamp) * self.rate)
+
+    def _update(self, operation):
+        """Applique operation(jetons) -> (jetons, résultat) sous verrou et retourne le résultat."""
+        now = time.time()
+        if fcntl is None:
+            with _local_lock:
+                tokens, stamp = _local_states.get(self.path, (0.0, None))
+                tokens, result = operation(self._refill(tokens, stamp, now))
+                _local_states[self.path] = (tokens, now)
+            return result or 0.0
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            raw = os.pread(fd, STATE_SIZE, 0)
+            tokens, stamp = struct.unpack(STATE_FORMAT, raw) if len(raw) == STATE_SIZE else (0.0, None)
+            tokens, result = operation(self._refill(tokens, stamp, now))
+            os.pwrite(fd, struct.pack(STATE_FORMAT, tokens, now), 0)
+        finally:
+            os.close(fd)  # libère aussi le verrou
+        return result or 0.0
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from odoo.tools import ormcache
+import logging
+_logger = logging.getLogger(__name__)
+
+
+class EslStore(models.Model):
+    """
+    Stores ESL récupérés via ZK_getStoreId, partagés par tous les workers.
+
+    Les options du champ esl.esl.StoreId sont lues ici, au travers d'un
+    cache ORM par configuration. La clé du cache comprend la version des
+    stores de la configuration (esl.esl.stores_version), incrémentée dès
+    qu'un de ses stores est créé, modifié ou supprimé : seule l'entrée de
+    cette configuration est renouvelée, dans tous les workers.
+    """
+    _name = "esl.store"
+    _description = "Store ESL"
+    _order = "name, store_id"
+
+    esl_id = fields.Many2one("esl.esl", string="Connexion ESL", required=True, ondelete="cascade", index=True)
+    store_id = fields.Char("Store ID", required=True)
+    name = fields.Char("Nom du store")
+    # Stock affiché sur les étiquettes du store (stock1) ; vide = tous les emplacements internes
+    location_id = fields.Many2one(
+        "stock.location", string="Emplacement de stock",
+        domain=[("usage", "=", "internal")], ondelete="set null",
+    )
+
+    _esl_store_uniq = models.Constraint(
+        "UNIQUE(esl_id, store_id)",
+        "Ce store existe déjà pour cette connexion ESL.",
+    )
+
+    @api.model
+    @ormcache('esl_config_id', 'version')
+    def _get_selection(self, esl_config_id, version):
+        """
+        Retourne les stores d'une configuration sous forme de sélection (store_id, nom).
+
+        Paramètres:
+            esl_config_id (int): configuration ESL (esl.esl)
+            version (int): version de ses stores (clé de cache uniquement)
+        """
+        self.flush_model(["esl_id", "store_id", "name"])
+        self.env.cr.execute(
+            "SELECT store_id, name FROM esl_store WHERE esl_id = %s ORDER BY store_id, id", [esl_config_id])
+        return tuple((store_id, name or store_id) for store_id, name in self.env.cr.fetchall())
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records.esl_id._bump_stores_version()
+        return records
+
+    def write(self, vals):
+        configs = self.esl_id
+        res = super().write(vals)
+        if "store_id" in vals or "name" in vals or "esl_id" in vals:
+            (configs | self.esl_id)._bump_stores_version()
+        return res
+
+    def unlink(self):
+        configs = self.esl_id
+        res = super().unlink()
+        configs._bump_stores_version()
+        return res
+
+    @api.model
+    def _sync_stores(self, esl, stores):
+        """
+        Remplace les stores d'une connexion par ceux renvoyés par l'API.
+
+        Paramètres:
+            esl (recordset): connexion ESL
+            stores (list): tuples (store_id, nom)
+        """
+        existing = {s.store_id: s for s in self.search([("esl_id", "=", esl.id)])}
+        to_create = []
+        for store_id, name in stores:
+            store = existing.pop(store_id, None)
+            if store is None:
+                to_create.append({"esl_id": esl.id, "store_id": store_id, "name": name})
+            elif store.name != name:
+                store.name = name
+        if existing:
+            self.browse([s.id for s in existing.values()]).unlink()
+        if to_create:
+            self.create(to_create)
@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+from odoo.tools import split_every
+from datetime import timedelta
+import json
+import logging
+_logger = logging.getLogger(__name__)
+
+# Durée de conservation de l'historique des envois
+SYNC_RUN_RETENTION_DAYS = 30
+# Une partition "en cours" sans nouveau batch depuis ce délai est considérée comme interrompue
+PARTITION_STALE_MINUTES = 60
+# Nombre d'essais d'une partition interrompue ou en erreur avant de l'abandonner
+PARTITION_MAX_ATTEMPTS = 3
+
+
+class EslSyncRun(models.Model):
+    """
+    Exécution d'un envoi de produits vers l'ESL, avec l'état de chacun de ses batches.
+
+    Permet de reprendre un envoi interrompu ou partiellement en échec sans
+    renvoyer les batches déjà acceptés par l'API.
+
+    Un envoi partitionné (partitioned) découpe le catalogue en plages d'ids
+    (esl.sync.partition) envoyées en parallèle par plusieurs workers ; il
+    est clôturé par le worker qui termine la dernière partition.
+    """
+    _name = "esl.sync.run"
+    _description = "Envoi de produits ESL"
+    _order = "date_start desc, id desc"
+
+    esl_id = fields.Many2one("esl.esl", string="Connexion ESL", required=True, ondelete="cascade", index=True)
+    date_start = fields.Datetime("Début", default=lambda self: fields.Datetime.now(), readonly=True)
+    date_end = fields.Datetime("Fin", readonly=True)
+    state = fields.Selection([
+        ('running', 'En cours'),
+        ('done', 'Terminé'),
+        ('partial', 'Partiel'),
+        ('failed', 'Échec'),
+    ], string="Statut", default='running', required=True, readonly=True)
+    full = fields.Boolean("Envoi complet", readonly=True)
+    scope = fields.Selection([
+        ('catalog', 'Catalogue'),
+        ('selection', 'Sélection de produits'),
+    ], string="Périmètre", default='catalog', required=True, readonly=True)
+    # Le catalogue est parcouru par id croissant : dernier produit mis en batch
+    last_product_id = fields.Integer("Dernier produit traité", readonly=True)
+    catalog_done = fields.Boolean("Catalogue entièrement parcouru", readonly=True)
+    partitioned = fields.Boolean("Envoi partitionné", readonly=True)
+    partition_ids = fields.One2many("esl.sync.partition", "run_id", string="Partitions", readonly=True)
+    partition_count = fields.Integer("Partitions", readonly=True)
+    partitions_done = fields.Integer("Partitions terminées", compute="_compute_partitions_done")
+    batch_ids = fields.One2many("esl.sync.batch", "run_id", string="Batches", readonly=True)
+    batch_count = fields.Integer("Batches", readonly=True)
+    items_sent = fields.Integer("Produits envoyés", readonly=True)
+    items_failed = fields.Integer("Produits en échec", readonly=True)
+    message = fields.Text("Dernière réponse", readonly=True)
+
+    @api.depends("esl_id", "date_start")
+    def _compute_display_name(self):
+        for run in self:
+            run.display_name = f"Envoi ESL du {fields.Datetime.to_string(run.date_start)}"
+
+    @api.depends("partition_ids.state")
+    def _compute_partitions_done(self):
+        for run in self:
+            run.partitions_done = len(run.partition_ids.filtered(lambda p: p.state in ('done', 'failed')))
+
+    def _add_batch(self, entries):
+        """
+        Enregistre un nouveau batch (en attente) pour cette exécution.
+
+        Paramètres:
+            entries (list): tuples (product_id, fragment JSON, empreinte)
+
+        Retour:
+            recordset: batch créé (esl.sync.batch)
+        """
+        self.ensure_one()
+        product_ids = [pid for pid, _fragment, _h in entries]
+        self.batch_count += 1
+        if self.scope == 'catalog':
+            self.last_product_id = max(self.last_product_id, *product_ids)
+        return self.env['esl.sync.batch'].create({
+            "run_id": self.id,
+            "sequence": self.batch_count,
+            "product_ids_json": json.dumps(product_ids),
+            "item_count": len(product_ids),
+        })
+
+    def _create_partitions(self, product_ids, size):
+        """
+        Découpe les produits (triés par id) en partitions de `size` produits
+        et réveille les workers du cron des partitions.
+
+        Paramètres:
+            product_ids (list): ids des produits à envoyer, par id croissant
+            size (int): nombre de produits par partition
+
+        Retour:
+            recordset: partitions créées (esl.sync.partition)
+        """
+        self.ensure_one()
+        partitions = self.env['esl.sync.partition'].create([{
+            "run_id": self.id,
+            "sequence": sequence,
+            "id_from": chunk[0],
+            "id_to": chunk[-1],
+            "product_count": len(chunk),
+        } for sequence, chunk in enumerate(split_every(max(size, 1), product_ids, list), start=1)])
+        self.partition_count = len(partitions)
+        self.env['esl.sync.partition']._trigger_workers()
+        return partitions
+
+    def _finish_partitioned(self):
+        """
+        Clôture un envoi partitionné dont toutes les partitions sont terminées,
+        et met à jour l'état et la date du dernier envoi de la connexion.
+        """
+        self.ensure_one()
+        partitions = self.partition_ids
+        if all(p.state == 'done' for p in partitions):
+            state = 'done'
+        elif any(p.items_sent for p in partitions):
+            state = 'partial'
+        else:
+            state = 'failed'
+        items_sent = sum(partitions.mapped("items_sent"))
+        self.write({
+            "state": state,
+            "date_end": fields.Datetime.now(),
+            "catalog_done": True,
+            "batch_count": len(self.batch_ids),
+            "items_sent": items_sent,
+            "items_failed": sum(partitions.mapped("items_failed")),
+            "message": next((p.error for p in partitions if p.error), False),
+        })
+        vals = {"state": "connected" if state == 'done' else "error"}
+        if items_sent:
+            vals["doi"] = fields.Datetime.now()
+        self.esl_id.write(vals)
+        _logger.info(
+            "[Hpharma ESL] Envoi partitionné %s terminé (%s) : %d produits envoyés.", self.id, state, items_sent,
+        )
+
+    def _finish(self, stats):
+        """
+        Clôture l'exécution à partir des compteurs de l'envoi.
+
+        Paramètres:
+            stats (dict): compteurs retournés par Esl._upload_batches
+        """
+        self.ensure_one()
+        batches = self.batch_ids
+        if not batches:
+            state = 'done'
+        elif all(b.state == 'done' for b in batches):
+            state = 'done' if self.scope != 'catalog' or self.catalog_done else 'partial'
+        elif any(b.state == 'done' for b in batches):
+            state = 'partial'
+        else:
+            state = 'failed'
+        self.write({
+            "state": state,
+            "date_end": fields.Datetime.now(),
+            "items_sent": sum(b.item_count for b in batches if b.state == 'done'),
+            "items_failed": sum(b.item_count for b in batches if b.state == 'failed'),
+            "message": stats.get("message") or False,
+        })
+
+    def action_resume(self):
+        """
+        Renvoie uniquement les batches en échec ou non envoyés, puis
+        poursuit le parcours du catalogue s'il avait été interrompu.
+
+        Retour:
+            dict: notification Odoo du résultat
+        """
+        self.ensure_one()
+        if self.state == 'done':
+            return self.esl_id._notify("✅ Cet envoi est déjà terminé.")
+        if self.partitioned:
+            partitions = self.partition_ids.filtered(lambda p: p.state == 'failed')
+            partitions.write({"state": 'queued', "attempts": 0, "error": False})
+            self.state = 'running'
+            self.env['esl.sync.partition']._trigger_workers()
+            return self.esl_id._notify(f"⏳ {len(partitions)} partitions remises en file.")
+        esl = self.esl_id.with_context(lang=self.esl_id.user_lang or 'fr_BE')
+        esl.check_and_refresh_token()
+        stats = esl._resume_run(self)
+        return esl._notify(
+            f"Reprise terminée — produits envoyés : {stats['sent']}, en échec : {stats['failed']}"
+        )
+
+    @api.autovacuum
+    def _gc_sync_runs(self):
+        """
+        Supprime l'historique des envois plus ancien que SYNC_RUN_RETENTION_DAYS,
+        y compris les envois restés "en cours" après la disparition de leur worker.
+        """
+        limit = fields.Datetime.now() - timedelta(days=SYNC_RUN_RETENTION_DAYS)
+        self.search([('date_start', '<', limit)]).unlink()
+
+
+class EslSyncPartition(models.Model):
+    """
+    Plage d'ids produits d'un envoi partitionné.
+
+    Chaque worker du cron des partitions réserve une partition en file
+    (FOR UPDATE SKIP LOCKED), construit et envoie ses batches, puis vérifie
+    si l'envoi est entièrement terminé. Ajouter des crons de partitions
+    (et des workers cron à Odoo) augmente le nombre de partitions traitées
+    simultanément.
+    """
+    _name = "esl.sync.partition"
+    _description = "Partition d'un envoi de produits ESL"
+    _order = "run_id, sequence"
+
+    run_id = fields.Many2one("esl.sync.run", string="Envoi", required=True, ondelete="cascade", index=True)
+    sequence = fields.Integer("N°", readonly=True)
+    id_from = fields.Integer("Du produit (id)", readonly=True)
+    id_to = fields.Integer("Au produit (id)", readonly=True)
+    product_count = fields.Integer("Produits", readonly=True)
+    state = fields.Selection([
+        ('queued', 'En file'),
+        ('running', 'En cours'),
+        ('done', 'Terminée'),
+        ('failed', 'Échec'),
+    ], string="Statut", default='queued', required=True, readonly=True, index=True)
+    attempts = fields.Integer("Essais", readonly=True)
+    batch_count = fields.Integer("Batches", readonly=True)
+    items_sent = fields.Integer("Produits envoyés", readonly=True)
+    items_failed = fields.Integer("Produits en échec", readonly=True)
+    date_start = fields.Datetime("Début", readonly=True)
+    date_end = fields.Datetime("Fin", readonly=True)
+    error = fields.Text("Erreur", readonly=True)
+    batch_ids = fields.One2many("esl.sync.batch", "partition_id", string="Batches", readonly=True)
+
+    @api.model
+    def _trigger_workers(self):
+        """Réveille tous les crons de partitions (y compris ceux ajoutés par l'administrateur)."""
+        crons = self.env['ir.cron'].sudo().search([
+            ("model_id.model", "=", self._name),
+            ("code", "like", "_cron_run_partitions"),
+        ])
+        for cron in crons:
+            cron._trigger()
+
+    # -------------------------------------------------------------
+    #                  EXÉCUTION
+    # -------------------------------------------------------------
+    @api.model
+    def _cron_run_partitions(self):
+        """
+        Traite les partitions en file jusqu'à ce qu'il n'y en ait plus, puis
+        clôture les envois partitionnés terminés.
+
+        Plusieurs crons peuvent appeler cette méthode simultanément : chaque
+        partition n'est réservée que par un seul d'entre eux.
+        """
+        self._recover_stale_partitions()
+        while True:
+            partition = self._claim_next()
+            if not partition:
+                break
+            partition._run()
+        self._finish_completed_runs()
+
+    @api.model
+    def _claim_next(self):
+        """
+        Réserve la prochaine partition en file et la passe à l'état en cours (validé).
+
+        Les partitions sont servies par numéro : quand plusieurs envois sont
+        en cours (plusieurs stores), ils avancent à tour de rôle. Les
+        partitions des connexions dont l'API est indisponible attendent.
+        """
+        self.env.cr.execute("""
+            SELECT p.id FROM esl_sync_partition p
+              JOIN esl_sync_run r ON r.id = p.run_id
+              JOIN esl_esl e ON e.id = r.esl_id
+             WHERE p.state = 'queued'
+               AND (e.api_health IS DISTINCT FROM 'down' OR e.api_retry_at <= (now() AT TIME ZONE 'UTC'))
+             ORDER BY p.sequence, p.id
+             LIMIT 1 FOR UPDATE OF p SKIP LOCKED
+        """)
+        row = self.env.cr.fetchone()
+        if not row:
+            return self
+        partition = self.browse(row[0])
+        partition.write({
+            "state": 'running',
+            "date_start": fields.Datetime.now(),
+            "attempts": partition.attempts + 1,
+        })
+        self.env.cr.commit()
+        return partition
+
+    def _run(self):
+        """Construit et envoie la partition puis enregistre son résultat (transaction validée)."""
+        self.ensure_one()
+        esl = self.run_id.esl_id.with_context(
+            lang=self.run_id.esl_id.user_lang or 'fr_BE',
+            esl_commit_checkpoints=True,
+        )
+        try:
+            if not esl._api_available():
+                # Aucun essai consommé : la partition attend le retour de l'API
+                self.write({"state": 'queued', "attempts": self.attempts - 1})
+                self.env.cr.commit()
+                return
+            if not esl.check_and_refresh_token():
+                raise UserError("Connexion ESL impossible : vérifiez les identifiants.")
+            # Publie le token (et libère le verrou de la connexion) pour les autres workers
+            self.env.cr.commit()
+            stats = self._send(esl)
+            self.invalidate_recordset(["batch_ids"])
+            done = self.batch_ids.filtered(lambda b: b.state == 'done')
+            if stats["errors"] and not esl._api_available():
+                # API coupée pendant l'envoi : la partition reprendra à son retour, sans consommer d'essai
+                state, attempts = 'queued', self.attempts - 1
+            else:
+                state, attempts = ('failed' if stats["errors"] else 'done'), self.attempts
+            self.write({
+                "state": state,
+                "attempts": attempts,
+                "date_end": fields.Datetime.now() if state != 'queued' else False,
+                "items_sent": sum(done.mapped("item_count")),
+                "items_failed": sum((self.batch_ids - done).mapped("item_count")),
+                "error": stats["message"] if stats["errors"] else False,
+            })
+            self.env.cr.commit()
+        except Exception as e:
+            self.env.cr.rollback()
+            _logger.exception("[Hpharma ESL] Échec de la partition %s de l'envoi %s.", self.sequence, self.run_id.id)
+            retry = self.attempts < PARTITION_MAX_ATTEMPTS
+            self.write({
+                "state": 'queued' if retry else 'failed',
+                "date_end": False if retry else fields.Datetime.now(),
+                "error": str(e),
+            })
+            self.env.cr.commit()
+
+    def _send(self, esl):
+        """
+        Construit et envoie les batches de la partition.
+
+        Les produits déjà acceptés lors d'un essai précédent ne sont pas
+        renvoyés ; les batches en échec sont remplacés.
+
+        Paramètres:
+            esl (recordset): connexion ESL (esl.esl)
+
+        Retour:
+            dict: compteurs de l'envoi (Esl._upload_batches)
+        """
+        self.ensure_one()
+        done = self.batch_ids.filtered(lambda b: b.state == 'done')
+        (self.batch_ids - done).unlink()
+        sent_ids = {pid for batch in done for pid in batch._product_ids()}
+        domain = [("id", ">=", self.id_from), ("id", "<=", self.id_to)] + esl._product_scope_domain()
+        product_ids = [pid for pid in self.env['product.product'].search(domain, order="id").ids
+                       if pid not in sent_ids]
+        sizer = esl._batch_sizer()
+
+        def iter_batches():
+            for entries in esl._iter_batches(sizer, full=self.run_id.full, product_ids=product_ids):
+                yield self._add_batch(entries), entries
+
+        return esl._upload_batches(iter_batches(), sizer, update_connection=False)
+
+    def _add_batch(self, entries):
+        """
+        Enregistre un nouveau batch (en attente) pour cette partition.
+
+        Le compteur est tenu sur la partition et non sur l'envoi, dont la
+        ligne est partagée par tous les workers.
+
+        Paramètres:
+            entries (list): tuples (product_id, fragment JSON, empreinte)
+
+        Retour:
+            recordset: batch créé (esl.sync.batch)
+        """
+        self.ensure_one()
+        product_ids = [pid for pid, _fragment, _h in entries]
+        self.batch_count += 1
+        return self.env['esl.sync.batch'].create({
+            "run_id": self.run_id.id,
+            "partition_id": self.id,
+            "sequence": self.batch_count,
+            "product_ids_json": json.dumps(product_ids),
+            "item_count": len(product_ids),
+        })
+
+    # -------------------------------------------------------------
+    #                  COORDINATION
+    # -------------------------------------------------------------
+    @api.model
+    def _finish_completed_runs(self):
+        """
+        Clôture les envois partitionnés dont plus aucune partition n'est en
+        file ou en cours. Chaque envoi est verrouillé (SKIP LOCKED) : si
+        plusieurs workers terminent en même temps, un seul le clôture.
+        """
+        self.env.cr.execute("""
+            SELECT r.id FROM esl_sync_run r
+             WHERE r.partitioned AND r.state = 'running'
+               AND NOT EXISTS (SELECT 1 FROM esl_sync_partition p
+                                WHERE p.run_id = r.id AND p.state IN ('queued', 'running'))
+               FOR UPDATE SKIP LOCKED
+        """)
+        for run in self.env['esl.sync.run'].browse([row[0] for row in self.env.cr.fetchall()]):
+            try:
+                run._finish_partitioned()
+                self.env.cr.commit()
+            except Exception:
+                self.env.cr.rollback()
+                _logger.exception("[Hpharma ESL] Clôture de l'envoi partitionné %s impossible.", run.id)
+
+    @api.model
+    def _recover_stale_partitions(self):
+        """Remet en file (ou abandonne) les partitions en cours dont le worker a disparu."""
+        limit = fields.Datetime.now() - timedelta(minutes=PARTITION_STALE_MINUTES)
+        stale = self.search([("state", "=", 'running'), ("write_date", "<", limit)])
+        if not stale:
+            return
+        retry = stale.filtered(lambda p: p.attempts < PARTITION_MAX_ATTEMPTS)
+        retry.write({"state": 'queued', "error": "Partition interrompue (aucune progression)."})
+        (stale - retry).write({
+            "state": 'failed',
+            "date_end": fields.Datetime.now(),
+            "error": "Partition interrompue (aucune progression).",
+        })
+        self.env.cr.commit()
+
+
+class EslSyncBatch(models.Model):
+    _name = "esl.sync.batch"
+    _description = "Batch d'un envoi de produits ESL"
+    _order = "run_id, partition_id, sequence"
+
+    run_id = fields.Many2one("esl.sync.run", string="Envoi", required=True, ondelete="cascade", index=True)
+    partition_id = fields.Many2one("esl.sync.partition", string="Partition", ondelete="cascade", index=True)
+    sequence = fields.Integer("N°", readonly=True)
+    state = fields.Selection([
+        ('pending', 'En attente'),
+        ('done', 'Envoyé'),
+        ('failed', 'Échec'),
+    ], string="Statut", default='pending', required=True, readonly=True, index=True)
+    product_ids_json = fields.Text("Produits (ids JSON)", readonly=True)
+    item_count = fields.Integer("Produits", readonly=True)
+    attempts = fields.Integer("Tentatives", readonly=True)
+    http_status = fields.Integer("Code HTTP", readonly=True)
+    payload_bytes = fields.Integer("Taille (octets)", readonly=True)
+    duration = fields.Float("Temps de réponse (s)", readonly=True)
+    error = fields.Text("Erreur", readonly=True)
+    date_sent = fields.Datetime("Date d'envoi", readonly=True)
+
+    def _product_ids(self):
+        """Retourne la liste des ids produits du batch."""
+        self.ensure_one()
+        return json.loads(self.product_ids_json or "[]")
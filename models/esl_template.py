@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api
 import json
-import http.client
 import logging
 _logger = logging.getLogger(__name__)
 
@@ -10,6 +9,7 @@ class EslTemplate(models.Model):
     _description = "Template ESL"
 
     esl_id = fields.Char("ID ESL", required=True, index=True)
+    esl_config_id = fields.Many2one("esl.esl", string="Configuration ESL", ondelete="cascade", index=True)
     template_number = fields.Char("Template Number")
     name = fields.Char("Template Name")
     size = fields.Char("Taille")
@@ -19,6 +19,7 @@ class EslTemplate(models.Model):
     temp_pic_url = fields.Char("URL image (partielle)")
     is_enable = fields.Boolean("Actif", default=True)
     json_raw = fields.Text("JSON brut")
+    raw_hash = fields.Char("Empreinte du JSON brut", readonly=True)
 
     esl_id_scan = fields.Char("Code ESL")
     json_product_codes = fields.Text("json Codes-barres produits")
@@ -34,7 +35,8 @@ class EslTemplate(models.Model):
             return
 
         # 1. Recherche du produit
-        product = self.env['product.product'].search([('barcode', '=', self.scan_input)], limit=1)
+        Product = self.env['product.product']
+        product = Product._esl_resolve_barcodes([self.scan_input]).get(self.scan_input, Product)
         
         # Reset immédiat du champ scan pour le prochain scan
         scan_val = self.scan_input
@@ -83,9 +85,10 @@ class EslTemplate(models.Model):
         
         # Mise à jour visuelle de la liste des noms
         names = []
+        products_by_code = Product._esl_resolve_barcodes(codes_list)
         for code in codes_list:
             if code:
-                p = self.env['product.product'].search([('barcode', '=', code)], limit=1)
+                p = products_by_code.get(code)
                 names.append(f"{code} - {p.display_name}" if p else f"{code}")
         self.product_names_scanned = '\n'.join(names)
 
@@ -110,7 +113,7 @@ class EslTemplate(models.Model):
         self.action_multibind()
 
     def action_multibind(self):
-        esl_record = self.env['esl.esl'].search([], limit=1)
+        esl_record = self.esl_config_id or self.env['esl.esl']._default_config()
         if not esl_record:
             return self._notify("❌ Aucune instance ESL trouvée.", notif_type="warning")
         esl_record.check_and_refresh_token()
@@ -130,26 +133,26 @@ class EslTemplate(models.Model):
             "debug": False
         }
 
-        headers = {
-            'Authorization': esl_record.token or "",
-            'Content-Type': 'application/json'
-        }
-
         try:
-            conn = http.client.HTTPSConnection("blev29.kalanda.info")
-            conn.request("POST", "/api-esl/ZK_bindMultiESL", json.dumps(payload), headers)
             _logger.info("[Hpharma ESL] Envoi liaison multiple ESL: %s", payload)
-            res = conn.getresponse()
-            _logger.info("[Hpharma ESL] Réponse liaison multiple ESL status: %s", res.status)
-            response_data = res.read().decode("utf-8")
+            res = esl_record._esl_request("ZK_bindMultiESL", payload)
+            _logger.info("[Hpharma ESL] Réponse liaison multiple ESL status: %s", res.status_code)
+            response_data = res.text
             self.json_product_codes = json.dumps([""] * len(products))  # ["", "", ...]
             self.product_names_scanned = ""
             self.esl_id_scan = ""
-            if res.status != 200:
+            if res.status_code != 200:
                 _logger.error("[Hpharma ESL] Erreur liaison multiple ESL : %s", response_data)
-                raise Exception(f"Erreur API ({res.status}) : {response_data}")
+                raise Exception(f"Erreur API ({res.status_code}) : {response_data}")
             else:
                 _logger.info("[Hpharma ESL] Liaison multiple ESL réussie : %s", response_data)
+                products_by_code = self.env['product.product']._esl_resolve_barcodes(products)
+                self.env['esl.binding'].sudo()._register_bind(
+                    esl_record,
+                    payload["esl"],
+                    self.env['product.product'].union(*products_by_code.values()),
+                    template=payload["templateId"],
+                )
                 
 
             #  Reset des champs après succès
@@ -188,14 +191,12 @@ class EslTemplate(models.Model):
         for record in self:
             record.full_pic_url = f"{base_url}{record.temp_pic_url}" if record.temp_pic_url else False
 
-    @api.model
-    def create(self, vals):
-        record = super().create(vals)
-        if record.item_num < 1:
-            record.json_product_codes = json.dumps([])
-        else:
-            record.json_product_codes = json.dumps([""] * record.item_num)  # Initialise avec des chaînes vides
-        return record
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            # Initialise avec des chaînes vides
+            vals["json_product_codes"] = json.dumps([""] * max(vals.get("item_num") or 0, 0))
+        return super().create(vals_list)
 
     def _notify(self, message, notif_type="info"):
         """
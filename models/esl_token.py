@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+import logging
+_logger = logging.getLogger(__name__)
+
+
+class EslToken(models.Model):
+    """
+    Token d'API renouvelé en arrière-plan, une ligne par connexion ESL.
+
+    Tenu à part de esl.esl : le renouvellement est validé dans sa propre
+    transaction sans jamais écrire la ligne de la connexion, que les
+    transactions en cours (état, date du dernier envoi, checkpoints)
+    peuvent écrire sans conflit de sérialisation.
+    """
+    _name = "esl.token"
+    _description = "Token de l'API ESL"
+    _rec_name = "esl_id"
+
+    esl_id = fields.Many2one("esl.esl", string="Connexion ESL", required=True, ondelete="cascade")
+    token = fields.Char("Token")
+    expiration = fields.Datetime("Expiration")
+
+    _esl_uniq = models.Constraint(
+        "UNIQUE(esl_id)",
+        "Un seul token par connexion ESL.",
+    )
+
+    @api.model
+    def _lock(self, esl):
+        """
+        Verrouille la ligne du token de la connexion (créée si besoin) jusqu'à
+        la fin de la transaction : un seul worker renouvelle le token à la fois.
+
+        Paramètres:
+            esl (recordset): connexion ESL
+
+        Retour:
+            tuple: (token, expiration) enregistrés
+        """
+        now = fields.Datetime.now()
+        self.env.cr.execute(
+            """
+            INSERT INTO esl_token (esl_id, create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (esl_id) DO NOTHING
+            """,
+            [esl.id, self.env.uid, now, self.env.uid, now],
+        )
+        self.env.cr.execute("SELECT token, expiration FROM esl_token WHERE esl_id = %s FOR UPDATE", [esl.id])
+        return self.env.cr.fetchone()
+
+    @api.model
+    def _store(self, esl, token, expiration):
+        """Enregistre le token renouvelé d'une connexion (ligne verrouillée par _lock)."""
+        self.env.cr.execute(
+            """
+            UPDATE esl_token SET token = %s, expiration = %s, write_uid = %s, write_date = %s
+             WHERE esl_id = %s
+            """,
+            [token, expiration, self.env.uid, fields.Datetime.now(), esl.id],
+        )
+        self.invalidate_model()
@@ -1,14 +1,15 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api
-import json, http
 import logging
 _logger = logging.getLogger(__name__)
-_cached_stores_global = []
 
 class EslBind(models.TransientModel):
     _name = 'esl.bind'
     _description = 'Bind ESL'
     name = fields.Char(default="Bind ESL")
+    esl_config_id = fields.Many2one(
+        "esl.esl", string="Configuration ESL", required=True,
+        default=lambda self: self.env['esl.esl']._default_config())
     code_1 = fields.Char(string="Produit")
     code_2 = fields.Char(string="ESL")
     product_name = fields.Char(string="Nom du produit", readonly=True)
@@ -20,7 +21,8 @@ class EslBind(models.TransientModel):
             self.product_name = ''
             self.product_image = False
             return
-        product = self.env['product.product'].search([('barcode', '=', self.code_1)], limit=1)
+        Product = self.env['product.product']
+        product = Product._esl_resolve_barcodes([self.code_1]).get(self.code_1, Product)
         if product:
             self.product_name = product.name
             self.product_image = product.image_128
@@ -34,33 +36,30 @@ class EslBind(models.TransientModel):
                 self.action_bind()
 
     def action_bind(self):
-        esl_record = self.env['esl.esl'].search([], limit=1)
+        esl_record = self.esl_config_id
         if not esl_record:
             { 'type': 'ir.actions.client', 'tag': 'reload',} # reload pour rafraîchir l'interface
             return self._notify("Aucune instance ESL trouvée.")
         esl_record.check_and_refresh_token()
-        payload = json.dumps({
+        payload = {
             "uniqueId": esl_record.unique_id,
             "StoreId": esl_record.StoreId,
             "product": self.code_1,
             "esl": self.code_2,
-        })
-        headers = {
-            'Authorization': esl_record.token,
-            'Content-Type': 'application/json'
         }
 
         try:
-            import http.client
-            conn = http.client.HTTPSConnection("blev29.kalanda.info")
-            conn.request("POST", "/api-esl/ZK_bindSingleESL", payload, headers)
-            res = conn.getresponse()
-            response_data = res.read().decode("utf-8")
+            res = esl_record._esl_request("ZK_bindSingleESL", payload)
+            response_data = res.text
             _logger.info(f"Response Bind: {response_data}")
-            if res.status != 200:
+            if res.status_code != 200:
                 { 'type': 'ir.actions.client', 'tag': 'reload',}
                 raise Exception(f"Erreur API : {response_data}")
 
+            Product = self.env['product.product']
+            product = Product._esl_resolve_barcodes([self.code_1]).get(self.code_1, Product)
+            if product:
+                self.env['esl.binding'].sudo()._register_bind(esl_record, self.code_2, product)
             new_wizard = self.env['esl.bind'].create({})
             # Vider les champs après succès
             self.code_1 = False
@@ -100,31 +99,29 @@ class EslUnbind(models.TransientModel):
     _name = 'esl.unbind'
     _description = 'Unbind ESL'
     name = fields.Char(default="Unbind ESL")
+    esl_config_id = fields.Many2one(
+        "esl.esl", string="Configuration ESL", required=True,
+        default=lambda self: self.env['esl.esl']._default_config())
     code_1 = fields.Char(string="ESL")
 
     def action_unbind(self):
-        esl_record = self.env['esl.esl'].search([], limit=1)
+        esl_record = self.esl_config_id
         esl_record.check_and_refresh_token()
-        payload = json.dumps({
+        payload = {
             "uniqueId": esl_record.unique_id,
             "StoreId": esl_record.StoreId,
             "esl": self.code_1,
-        })
-        headers = {
-            'Authorization': esl_record.token,
-            'Content-Type': 'application/json'
         }
 
         try:
-            conn = http.client.HTTPSConnection("blev29.kalanda.info")
-            conn.request("POST", "/api-esl/ZK_unbindESL", payload, headers)
-            res = conn.getresponse()
-            response_data = res.read().decode("utf-8")
+            res = esl_record._esl_request("ZK_unbindESL", payload)
+            response_data = res.text
             _logger.info(f"Response Unbind: {response_data}")
-            if res.status != 200:
+            if res.status_code != 200:
                 _logger.error(f"Erreur API Unbind: {response_data}")
                 raise Exception(f"Erreur API : {response_data}")
 
+            self.env['esl.binding'].sudo()._register_unbind(esl_record, [self.code_1])
             self.code_1 = False
             new_wizard = self.env['esl.unbind'].create({})
             { 'type': 'ir.actions.client', 'tag': 'reload',}
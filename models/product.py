@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+from odoo import models, api
+from odoo.tools.lru import LRU
+import time
+
+# Champs produit affichés sur les étiquettes : leur modification alimente esl.outbox
+# (ainsi que les règles de listes de prix et les quantités en stock, voir plus bas)
+ESL_TRACKED_FIELDS = {"barcode", "name", "list_price", "default_code"}
+# Champs dont la modification rend obsolète le cache code-barres → produit
+ESL_BARCODE_FIELDS = {"barcode", "active"}
+ESL_BARCODE_CACHE_SIZE = 4096
+# Durée de validité d'une entrée du cache : borne le retard des autres workers après une modification
+ESL_BARCODE_CACHE_TTL = 60
+
+# Cache du processus : (base, code-barres) → (id produit, expiration)
+_barcode_cache = LRU(ESL_BARCODE_CACHE_SIZE)
+
+
+class ProductProduct(models.Model):
+    _inherit = "product.product"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        products = super().create(vals_list)
+        self.env['esl.outbox'].sudo()._enqueue(products.ids)
+        return products
+
+    def write(self, vals):
+        barcode_change = ESL_BARCODE_FIELDS.intersection(vals)
+        old_codes = self.mapped("barcode") if barcode_change else []
+        res = super().write(vals)
+        if ESL_TRACKED_FIELDS.intersection(vals):
+            self.env['esl.outbox'].sudo()._enqueue(self.ids)
+        if barcode_change:
+            self._esl_invalidate_barcodes(old_codes + self.mapped("barcode"))
+        return res
+
+    def unlink(self):
+        codes = self.mapped("barcode")
+        res = super().unlink()
+        self._esl_invalidate_barcodes(codes)
+        return res
+
+    # -------------------------------------------------------------
+    #              RÉSOLUTION CODE-BARRES → PRODUIT
+    # -------------------------------------------------------------
+    @api.model
+    def _esl_invalidate_barcodes(self, codes):
+        """
+        Retire des codes-barres du cache du processus courant.
+
+        Les autres workers ne sont pas prévenus (aucune écriture partagée sur
+        le chemin des modifications produit) : leurs entrées expirent au plus
+        tard après ESL_BARCODE_CACHE_TTL secondes.
+
+        Paramètres:
+            codes (list): codes-barres modifiés, anciens et nouveaux
+        """
+        dbname = self.env.cr.dbname
+        for code in codes:
+            if code:
+                try:
+                    del _barcode_cache[(dbname, code)]
+                except KeyError:
+                    pass
+
+    @api.model
+    def _esl_resolve_barcodes(self, codes):
+        """
+        Résout plusieurs codes-barres en produits, en une seule requête au plus.
+
+        Les correspondances trouvées sont gardées dans un cache LRU borné du
+        processus, pendant ESL_BARCODE_CACHE_TTL secondes. Les autres workers
+        n'invalident pas ce cache : chaque correspondance en cache est donc
+        vérifiée par clé primaire (produit actif portant toujours ce code)
+        avant d'être retournée ; les codes absents, expirés ou dont le
+        produit a changé sont cherchés par code-barres.
+
+        Paramètres:
+            codes (list): codes-barres scannés
+
+        Retour:
+            dict: {code-barres: product.product} pour les codes trouvés
+        """
+        dbname = self.env.cr.dbname
+        now = time.monotonic()
+        result = {}
+        cached = {}
+        missing = []
+        for code in dict.fromkeys(c for c in codes if c):
+            product_id, expires = _barcode_cache.get((dbname, code)) or (None, 0.0)
+            if product_id and expires > now:
+                cached[code] = product_id
+            else:
+                missing.append(code)
+        if cached:
+            valid = {
+                (product.id, product.barcode)
+                for product in self.search_fetch([('id', 'in', list(cached.values()))], ['barcode'])
+            }
+            for code, product_id in cached.items():
+                if (product_id, code) in valid:
+                    result[code] = product_id
+                else:
+                    # Code déplacé ou produit archivé/supprimé depuis un autre worker
+                    missing.append(code)
+        if missing:
+            for product in self.search_fetch([('barcode', 'in', missing)], ['barcode']):
+                result[product.barcode] = product.id
+                _barcode_cache[(dbname, product.barcode)] = (product.id, now + ESL_BARCODE_CACHE_TTL)
+        products = self.browse(list(result.values()))
+        return {code: products.browse(pid) for code, pid in result.items()}
+
+
+class ProductTemplate(models.Model):
+    _inherit = "product.template"
+
+    def write(self, vals):
+        res = super().write(vals)
+        if ESL_TRACKED_FIELDS.intersection(vals):
+            self.env['esl.outbox'].sudo()._enqueue(self.with_context(active_test=False).product_variant_ids.ids)
+        return res
+
+
+class ProductPricelistItem(models.Model):
+    """Les règles des listes de prix utilisées par une configuration ESL alimentent esl.outbox (ou esl.job)."""
+    _inherit = "product.pricelist.item"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        items = super().create(vals_list)
+        items._esl_enqueue_products()
+        return items
+
+    def write(self, vals):
+        # Produits visés avant et après la modification (la règle peut changer de périmètre)
+        self._esl_enqueue_products()
+        res = super().write(vals)
+        self._esl_enqueue_products()
+        return res
+
+    def unlink(self):
+        self._esl_enqueue_products()
+        return super().unlink()
+
+    def _esl_enqueue_products(self):
+        """
+        Met en file les produits concernés par les règles des listes de prix affichées sur les étiquettes.
+
+        Une règle globale ou par catégorie peut toucher tout le catalogue :
+        plutôt que de mettre chaque produit en file dans la transaction de
+        l'utilisateur, un envoi différentiel (tâche esl.job, dédoublonnée)
+        est planifié pour la configuration ; seuls les articles dont
+        l'empreinte a changé seront envoyés.
+        """
+        items = self.sudo()
+        configs = self.env['esl.esl'].sudo().search([('cron_active', '=', True)])
+        Product = self.env['product.product'].sudo()
+        for config in configs:
+            config_items = items.filtered(lambda item: item.pricelist_id in config._esl_pricelists())
+            if not config_items:
+                continue
+            if any(item.applied_on in ('3_global', '2_product_category') for item in config_items):
+                self.env['esl.job'].sudo()._enqueue(config, 'import')
+                continue
+            product_ids = set(config_items.product_id.ids)
+            templates = config_items.filtered(lambda item: item.applied_on == '1_product').product_tmpl_id
+            if templates:
+                product_ids.update(Product.search([('product_tmpl_id', 'in', templates.ids)]).ids)
+            self.env['esl.outbox'].sudo()._enqueue(list(product_ids), config)
+
+
+class StockQuant(models.Model):
+    """Les quantités en stock sont affichées sur les étiquettes : leurs variations alimentent esl.outbox."""
+    _inherit = "stock.quant"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        quants = super().create(vals_list)
+        self.env['esl.outbox'].sudo()._enqueue(quants.product_id.ids)
+        return quants
+
+    def write(self, vals):
+        res = super().write(vals)
+        if "quantity" in vals:
+            self.env['esl.outbox'].sudo()._enqueue(self.product_id.ids)
+        return res
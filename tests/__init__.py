@@ -0,0 +1,11 @@
+from . import test_benchmark
+from . import test_esl_retry
+from . import test_esl_batching
+from . import test_esl_circuit_breaker
+from . import test_esl_rate_limit
+from . import test_esl_delta_sync
+from . import test_esl_outbox
+from . import test_esl_sync_partition
+from . import test_esl_barcode
+from . import test_esl_standin
+from . import test_esl_config
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de la construction et de l'envoi des articles ESL sur des catalogues synthétiques.
+
+Exclu des tests standards ; à lancer explicitement :
+
+    odoo-bin -d <base> -i module_HpharmaESLSystem --test-tags esl_benchmark --stop-after-init
+
+Variables d'environnement :
+    ESL_BENCHMARK_SIZES   tailles de catalogue (défaut "1000" ; p. ex. "1000,10000,100000,500000"
+                          pour mesurer la montée en charge)
+    ESL_BENCHMARK_OUTPUT  fichier JSON des résultats (défaut <tmp>/esl_benchmark.json)
+
+Les envois sont faits vers le serveur local tools/esl_standin.py :
+aucun appel ne part vers l'API de production.
+"""
+from odoo import release
+from odoo.tests import TransactionCase, tagged
+from odoo.tools import split_every
+from datetime import timedelta
+import json
+import os
+import tempfile
+import time
+import timeit
+import tracemalloc
+from ..tools import esl_standin
+import logging
+_logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = "1000"
+# Nombre de produits créés par appel à create()
+CREATE_CHUNK = 5000
+
+
+@tagged('-standard', '-at_install', 'post_install', 'esl_benchmark')
+class TestEslBenchmark(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = esl_standin.start_server(config=esl_standin.StandinConfig(check_token=False))
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+        cls.esl = cls.env.ref('module_HpharmaESLSystem.default_esl_config')
+        cls.esl.write({
+            "login": "benchmark",
+            "password": "benchmark",
+            "unique_id": "benchmark",
+            "token": "benchmark",
+            "token_expiration": cls.env.cr.now() + timedelta(days=1),
+            "api_base_url": cls.server.base_url,
+            "api_max_retries": 0,
+            "product_batch": 1000,
+            "batch_mode": 'count',
+            "upload_workers": 4,
+            "rate_limit_bulk": 0,
+        })
+        cls.sizes = sorted(int(s) for s in os.environ.get("ESL_BENCHMARK_SIZES", DEFAULT_SIZES).split(",") if s.strip())
+        cls.output = os.environ.get("ESL_BENCHMARK_OUTPUT") or os.path.join(tempfile.gettempdir(), "esl_benchmark.json")
+        cls.product_ids = []
+
+    def _grow_catalog(self, size):
+        """Complète le catalogue synthétique jusqu'à `size` produits."""
+        Product = self.env['product.product'].with_context(tracking_disable=True, mail_create_nolog=True)
+        start = len(self.product_ids)
+        for chunk in split_every(CREATE_CHUNK, range(start, size)):
+            products = Product.create([{
+                "name": f"Produit benchmark ESL {i}",
+                "default_code": f"ESLBENCH{i:07d}",
+                "barcode": f"99{i:011d}",
+                "list_price": 1 + (i % 5000) / 100.0,
+            } for i in chunk])
+            self.product_ids.extend(products.ids)
+            self.env.invalidate_all()
+
+    def _measure(self, func):
+        """Exécute func() et retourne (résultat, secondes, pic mémoire en Mo, requêtes SQL)."""
+        self.env.invalidate_all()
+        queries = self.env.cr.sql_log_count
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            result = func()
+        finally:
+            elapsed = time.perf_counter() - start
+            _current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return result, elapsed, peak / 1024 / 1024, self.env.cr.sql_log_count - queries
+
+    def _build(self, size):
+        """Construit tous les batches du catalogue, sans les envoyer."""
+        sizer = self.esl._batch_sizer()
+        batches = items = payload_bytes = 0
+        for entries in self.esl._iter_batches(sizer, full=True, product_ids=self.product_ids[:size]):
+            batches += 1
+            items += len(entries)
+            payload_bytes += len(self.esl._batch_payload({"uniqueId": self.esl.unique_id}, entries))
+        return {"batches": batches, "items": items, "payload_bytes": payload_bytes}
+
+    def test_benchmark(self):
+        format_price = self.esl.format_price
+        prices = [i / 7.0 for i in range(10000)]
+        results = {
+            "odoo": release.version,
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "format_price_us": timeit.timeit(lambda: [format_price(p) for p in prices], number=10) / 100000 * 1e6,
+            "catalogs": [],
+        }
+
+        for size in self.sizes:
+            self._grow_catalog(size)
+            built, build_s, build_mb, build_queries = self._measure(lambda: self._build(size))
+            self.assertEqual(built["items"], size)
+
+            received = self.server.stats["bytes_received"]
+            stats, send_s, send_mb, send_queries = self._measure(
+                lambda: self.esl._send_products(product_ids=self.product_ids[:size], full=True))
+            self.assertEqual(stats["sent"], size, stats["message"])
+
+            row = {
+                "products": size,
+                "batches": built["batches"],
+                "build_seconds": round(build_s, 3),
+                "build_items_per_second": round(size / build_s) if build_s else None,
+                "build_peak_mb": round(build_mb, 1),
+                "build_queries": build_queries,
+                "payload_bytes": built["payload_bytes"],
+                "send_seconds": round(send_s, 3),
+                "send_items_per_second": round(size / send_s) if send_s else None,
+                "send_peak_mb": round(send_mb, 1),
+                "send_queries": send_queries,
+                "received_bytes": self.server.stats["bytes_received"] - received,
+            }
+            results["catalogs"].append(row)
+            _logger.info("[Hpharma ESL] Benchmark : %s", json.dumps(row))
+
+        with open(self.output, "w") as f:
+            json.dump(results, f, indent=2)
+        _logger.info("[Hpharma ESL] Résultats du benchmark écrits dans %s", self.output)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Résolution code-barres → produit et son cache de processus."""
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestEslBarcode(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Product = cls.env['product.product']
+        cls.product_a, cls.product_b = cls.Product.create([
+            {"name": "Produit code A", "barcode": "5400000000097"},
+            {"name": "Produit code B"},
+        ])
+
+    def _move_barcode_elsewhere(self):
+        """Déplace le code-barres comme le ferait un autre worker : sans invalider le cache local."""
+        self.env.flush_all()
+        self.env.cr.execute("UPDATE product_product SET barcode = NULL WHERE id = %s", [self.product_a.id])
+        self.env.cr.execute(
+            "UPDATE product_product SET barcode = %s WHERE id = %s", ["5400000000097", self.product_b.id])
+        self.Product.invalidate_model(["barcode"])
+
+    def test_resolve(self):
+        resolved = self.Product._esl_resolve_barcodes(["5400000000097", "0000000000000", False])
+        self.assertEqual(resolved, {"5400000000097": self.product_a})
+
+    def test_write_invalidates(self):
+        self.Product._esl_resolve_barcodes(["5400000000097"])
+        self.product_a.barcode = False
+        self.product_b.barcode = "5400000000097"
+        self.assertEqual(self.Product._esl_resolve_barcodes(["5400000000097"])["5400000000097"], self.product_b)
+
+    def test_stale_entry_from_other_worker(self):
+        self.Product._esl_resolve_barcodes(["5400000000097"])
+        self._move_barcode_elsewhere()
+        self.assertEqual(self.Product._esl_resolve_barcodes(["5400000000097"])["5400000000097"], self.product_b)
+
+    def test_archived_product_not_returned(self):
+        self.Product._esl_resolve_barcodes(["5400000000097"])
+        self.env.flush_all()
+        self.env.cr.execute("UPDATE product_product SET active = FALSE WHERE id = %s", [self.product_a.id])
+        self.Product.invalidate_model(["active"])
+        self.assertFalse(self.Product._esl_resolve_barcodes(["5400000000097"]))
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Taille des batches d'envoi (FixedBatchSizer, AdaptiveBatchSizer)."""
+from odoo.tests import tagged
+from odoo.tests.common import BaseCase
+from ..models.esl_batching import AdaptiveBatchSizer, FixedBatchSizer
+
+
+@tagged('post_install', '-at_install')
+class TestEslBatching(BaseCase):
+
+    def test_fixed_size(self):
+        sizer = FixedBatchSizer(0)
+        self.assertEqual(sizer.size, 1)
+        self.assertIsNone(sizer.max_bytes)
+        sizer = FixedBatchSizer(500)
+        sizer.feedback(500, 30.0, 503)
+        self.assertEqual(sizer.size, 500)
+
+    def test_initial_size_bounded(self):
+        self.assertEqual(AdaptiveBatchSizer(1000, max_size=200).size, 200)
+        self.assertEqual(AdaptiveBatchSizer(0, max_size=200).size, 1)
+
+    def test_grows_on_fast_responses(self):
+        sizer = AdaptiveBatchSizer(100, max_size=130, target_latency=5.0)
+        sizer.feedback(100, 1.0, 200)
+        self.assertEqual(sizer.size, 125)
+        sizer.feedback(125, 1.0, 200)
+        self.assertEqual(sizer.size, 130)
+
+    def test_no_growth_on_partial_batch(self):
+        sizer = AdaptiveBatchSizer(100, max_size=1000, target_latency=5.0)
+        sizer.feedback(40, 1.0, 200)
+        self.assertEqual(sizer.size, 100)
+
+    def test_stable_near_target(self):
+        sizer = AdaptiveBatchSizer(100, max_size=1000, target_latency=5.0)
+        sizer.feedback(100, 4.0, 200)
+        self.assertEqual(sizer.size, 100)
+
+    def test_shrinks_proportionally_when_slow(self):
+        sizer = AdaptiveBatchSizer(100, max_size=1000, target_latency=5.0)
+        sizer.feedback(100, 20.0, 200)
+        self.assertEqual(sizer.size, 25)
+
+    def test_halves_on_error(self):
+        sizer = AdaptiveBatchSizer(100, max_size=1000)
+        sizer.feedback(100, 0.5, 413)
+        self.assertEqual(sizer.size, 50)
+        sizer.feedback(50, None, None)
+        self.assertEqual(sizer.size, 25)
+        for _i in range(10):
+            sizer.feedback(sizer.size, None, None)
+        self.assertEqual(sizer.size, 1)
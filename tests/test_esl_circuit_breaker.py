@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Disjoncteur des appels à l'API ESL (CircuitBreaker, call)."""
+from odoo.tests import tagged
+from odoo.tests.common import BaseCase
+from unittest.mock import patch
+import time
+import requests
+from ..models import esl_api
+
+
+class FakeResponse:
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+
+
+@tagged('post_install', '-at_install')
+class TestEslCircuitBreaker(BaseCase):
+
+    def test_opens_after_threshold(self):
+        breaker = esl_api.CircuitBreaker(threshold=2, cooldown=60)
+        breaker.record_failure()
+        self.assertFalse(breaker.is_open)
+        breaker.before_call("ZK_sendItem")
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(breaker.allows_call())
+        with self.assertRaises(esl_api.CircuitOpenError):
+            breaker.before_call("ZK_sendItem")
+
+    def test_success_resets_failures(self):
+        breaker = esl_api.CircuitBreaker(threshold=2, cooldown=60)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertFalse(breaker.is_open)
+
+    def test_half_open_single_probe(self):
+        breaker = esl_api.CircuitBreaker(threshold=1, cooldown=60)
+        breaker.record_failure()
+        breaker.open_until = time.time() - 1
+        self.assertTrue(breaker.allows_call())
+        breaker.before_call("ZK_sendItem")
+        # Un seul appel de test à la fois
+        with self.assertRaises(esl_api.CircuitOpenError):
+            breaker.before_call("ZK_sendItem")
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        breaker.before_call("ZK_sendItem")
+
+    def test_failed_probe_reopens(self):
+        breaker = esl_api.CircuitBreaker(threshold=1, cooldown=60)
+        breaker.record_failure()
+        breaker.open_until = time.time() - 1
+        breaker.before_call("ZK_sendItem")
+        breaker.record_failure()
+        self.assertGreater(breaker.open_until, time.time())
+        with self.assertRaises(esl_api.CircuitOpenError):
+            breaker.before_call("ZK_sendItem")
+
+    def test_trip_and_reset(self):
+        breaker = esl_api.CircuitBreaker(threshold=3, cooldown=60)
+        breaker.trip(time.time() + 30)
+        self.assertTrue(breaker.is_open)
+        self.assertFalse(breaker.allows_call())
+        breaker.reset()
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allows_call())
+
+    def test_call_skips_network_when_open(self):
+        params = {
+            "base_url": "http://breaker.test",
+            "token": "token",
+            "timeout": (1, 1),
+            "breaker_threshold": 2,
+            "breaker_cooldown": 60,
+        }
+        esl_api.get_breaker(params["base_url"]).reset()
+        self.addCleanup(esl_api.get_breaker(params["base_url"]).reset)
+        with patch.object(esl_api, "request", side_effect=requests.ConnectionError()) as request:
+            for _i in range(2):
+                with self.assertRaises(requests.ConnectionError):
+                    esl_api.call(params, "ZK_sendItem", {})
+            with self.assertRaises(esl_api.CircuitOpenError):
+                esl_api.call(params, "ZK_sendItem", {})
+        self.assertEqual(request.call_count, 2)
+
+    def test_call_counts_server_errors_only(self):
+        params = {
+            "base_url": "http://breaker-status.test",
+            "token": "token",
+            "timeout": (1, 1),
+            "breaker_threshold": 1,
+            "breaker_cooldown": 60,
+        }
+        breaker = esl_api.get_breaker(params["base_url"])
+        breaker.reset()
+        self.addCleanup(breaker.reset)
+        with patch.object(esl_api, "request", return_value=FakeResponse(400)):
+            esl_api.call(params, "ZK_sendItem", {})
+        self.assertFalse(breaker.is_open)
+        with patch.object(esl_api, "request", return_value=FakeResponse(503)):
+            esl_api.call(params, "ZK_sendItem", {})
+        self.assertTrue(breaker.is_open)
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""Filtre des produits (product_domain) d'une configuration ESL."""
+from odoo.exceptions import ValidationError
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestEslConfig(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.esl = cls.env.ref('module_HpharmaESLSystem.default_esl_config')
+
+    def test_literal_domain(self):
+        self.esl.product_domain = "[('sale_ok', '=', True)]"
+        self.assertIn(('sale_ok', '=', True), self.esl._product_scope_domain())
+
+    def test_relative_domain(self):
+        self.esl.product_domain = (
+            "[('create_uid', '=', uid), "
+            "('create_date', '>=', (context_today() - relativedelta(days=7)).strftime('%Y-%m-%d'))]"
+        )
+        domain = self.esl._product_scope_domain()
+        self.assertIn(('create_uid', '=', self.env.uid), domain)
+        self.env['product.product'].search(domain)
+
+    def test_invalid_domain_rejected(self):
+        with self.assertRaises(ValidationError):
+            self.esl.product_domain = "[('no_such_field', '=', 1)]"
+        with self.assertRaises(ValidationError):
+            self.esl.product_domain = "[('name', '=', undefined_name)]"
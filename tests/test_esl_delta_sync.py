@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Envoi différentiel : les articles dont l'empreinte n'a pas changé ne sont pas renvoyés."""
+from odoo.tests import TransactionCase, tagged
+from ..models.esl_batching import FixedBatchSizer
+
+
+@tagged('post_install', '-at_install')
+class TestEslDeltaSync(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.esl = cls.env.ref('module_HpharmaESLSystem.default_esl_config')
+        cls.products = cls.env['product.product'].create([
+            {"name": "Produit ESL A", "barcode": "5400000000011", "list_price": 1.5},
+            {"name": "Produit ESL B", "barcode": "5400000000028", "list_price": 2.5},
+        ])
+
+    def _pending(self, full=False):
+        """Entrées (product_id, fragment, empreinte) qu'un envoi enverrait."""
+        return [
+            entry
+            for batch in self.esl._iter_batches(FixedBatchSizer(100), full=full, product_ids=self.products.ids)
+            for entry in batch
+        ]
+
+    def _mark_sent(self, entries):
+        self.env['esl.product.sync']._record_hashes(self.esl, {pid: h for pid, _f, h in entries})
+
+    def test_unchanged_items_skipped(self):
+        entries = self._pending()
+        self.assertEqual({pid for pid, _f, _h in entries}, set(self.products.ids))
+        self._mark_sent(entries)
+        self.assertFalse(self._pending())
+
+    def test_changed_item_resent(self):
+        self._mark_sent(self._pending())
+        self.products[0].list_price = 3.0
+        self.assertEqual([pid for pid, _f, _h in self._pending()], self.products[0].ids)
+
+    def test_hash_stable(self):
+        first = {pid: h for pid, _f, h in self._pending()}
+        second = {pid: h for pid, _f, h in self._pending()}
+        self.assertEqual(first, second)
+
+    def test_payload_settings_resend(self):
+        self._mark_sent(self._pending())
+        self.esl.payload_mode = 'compact'
+        self.assertEqual(len(self._pending()), 2)
+        self._mark_sent(self._pending())
+        self.esl.payload_attributes = "itemTitle,price"
+        self.assertEqual(len(self._pending()), 2)
+
+    def test_full_ignores_hashes(self):
+        self._mark_sent(self._pending())
+        self.assertEqual(len(self._pending(full=True)), 2)
+
+    def test_reset_forgets_hashes(self):
+        self._mark_sent(self._pending())
+        self.env['esl.product.sync']._reset(self.esl)
+        self.assertEqual(len(self._pending()), 2)
+
+    def test_batches_split_by_size(self):
+        batches = list(self.esl._iter_batches(FixedBatchSizer(1), product_ids=self.products.ids))
+        self.assertEqual([len(batch) for batch in batches], [1, 1])
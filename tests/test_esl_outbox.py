@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""File d'attente esl.outbox : une seule ligne par connexion et par produit modifié."""
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestEslOutbox(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Outbox = cls.env['esl.outbox']
+        cls.esl = cls.env.ref('module_HpharmaESLSystem.default_esl_config')
+        cls.esl.cron_active = True
+        cls.other_esl = cls.esl.copy({"name": "Autre pharmacie", "cron_active": True})
+        cls.products = cls.env['product.product'].create([
+            {"name": "Produit outbox A", "list_price": 1.0},
+            {"name": "Produit outbox B", "list_price": 2.0},
+        ])
+
+    def _queued(self, products, esl=None):
+        domain = [("product_id", "in", products.ids)]
+        if esl:
+            domain.append(("esl_id", "=", esl.id))
+        return self.Outbox.search(domain)
+
+    def test_enqueue_dedupes(self):
+        self._queued(self.products).unlink()
+        self.Outbox._enqueue(self.products.ids + self.products.ids)
+        self.Outbox._enqueue(self.products[:1].ids)
+        queued = self._queued(self.products, self.esl)
+        self.assertEqual(len(queued), 2)
+        self.assertEqual(queued.product_id, self.products)
+
+    def test_one_row_per_config(self):
+        self._queued(self.products).unlink()
+        self.Outbox._enqueue(self.products[:1].ids)
+        self.assertEqual(self._queued(self.products).esl_id, self.esl | self.other_esl)
+
+    def test_enqueue_for_config(self):
+        self._queued(self.products).unlink()
+        self.Outbox._enqueue(self.products.ids, self.other_esl)
+        self.assertEqual(self._queued(self.products).esl_id, self.other_esl)
+
+    def test_inactive_schedule_not_queued(self):
+        self._queued(self.products).unlink()
+        self.other_esl.cron_active = False
+        self.Outbox._enqueue(self.products.ids)
+        self.assertEqual(self._queued(self.products).esl_id, self.esl)
+
+    def test_claim_removes_rows(self):
+        self._queued(self.products).unlink()
+        self.Outbox._enqueue(self.products.ids)
+        claimed = self.Outbox._claim(self.esl, 10)
+        self.assertEqual(set(claimed), set(self.products.ids))
+        self.assertFalse(self._queued(self.products, self.esl))
+        self.assertEqual(len(self._queued(self.products, self.other_esl)), 2)
+
+    def test_created_products_queued(self):
+        self.assertEqual(self._queued(self.products, self.esl).product_id, self.products)
+
+    def test_tracked_write_queued_once(self):
+        product = self.products[0]
+        self._queued(product).unlink()
+        product.name = "Produit outbox A2"
+        product.list_price = 3.0
+        self.assertEqual(len(self._queued(product, self.esl)), 1)
+
+    def test_untracked_write_not_queued(self):
+        product = self.products[0]
+        self._queued(product).unlink()
+        product.weight = 2.0
+        self.assertFalse(self._queued(product))
+
+    def test_pricelist_rules(self):
+        pricelist = self.env['product.pricelist'].create({"name": "Liste ESL"})
+        self.esl.pricelist_id = pricelist
+        self._queued(self.products).unlink()
+        Job = self.env['esl.job']
+        Job.search([("esl_id", "=", self.esl.id)]).unlink()
+        # Règle sur un produit : seul ce produit est mis en file, pour cette configuration
+        self.env['product.pricelist.item'].create({
+            "pricelist_id": pricelist.id,
+            "applied_on": '0_product_variant',
+            "product_id": self.products[0].id,
+            "fixed_price": 9.0,
+        })
+        self.assertEqual(self._queued(self.products).mapped(lambda q: (q.esl_id, q.product_id)),
+                         [(self.esl, self.products[0])])
+        self.assertFalse(Job.search([("esl_id", "=", self.esl.id)]))
+        # Règle globale : un envoi différentiel est planifié au lieu de mettre tout le catalogue en file
+        self._queued(self.products).unlink()
+        self.env['product.pricelist.item'].create({
+            "pricelist_id": pricelist.id,
+            "applied_on": '3_global',
+            "compute_price": 'percentage',
+            "percent_price": 10.0,
+        })
+        self.assertFalse(self._queued(self.products))
+        self.assertEqual(Job.search([("esl_id", "=", self.esl.id)]).job_type, 'import')
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Seau à jetons partagé des appels à l'API ESL (TokenBucket)."""
+from odoo.tests import tagged
+from odoo.tests.common import BaseCase
+from unittest.mock import patch
+import os
+import shutil
+import tempfile
+from ..models import esl_api, esl_rate_limit
+from ..models.esl_rate_limit import RateLimitTimeout, TokenBucket
+
+
+@tagged('post_install', '-at_install')
+class TestEslRateLimit(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.rate_dir = tempfile.mkdtemp(prefix="esl_bucket_")
+        self.addCleanup(shutil.rmtree, self.rate_dir, True)
+        self.path = os.path.join(self.rate_dir, "test.bucket")
+        sleep_patcher = patch.object(esl_rate_limit.time, "sleep")
+        self.sleep = sleep_patcher.start()
+        self.addCleanup(sleep_patcher.stop)
+
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(self.path, rate=10, burst=2)
+        self.assertEqual(bucket.acquire(), 0.0)
+        self.assertEqual(bucket.acquire(), 0.0)
+        self.assertAlmostEqual(bucket.acquire(), 0.1, delta=0.02)
+        self.assertEqual(self.sleep.call_count, 1)
+
+    def test_shared_between_instances(self):
+        TokenBucket(self.path, rate=10, burst=1).acquire()
+        self.assertGreater(TokenBucket(self.path, rate=10, burst=1).acquire(), 0.05)
+
+    def test_max_wait_timeout_takes_no_token(self):
+        bucket = TokenBucket(self.path, rate=10, burst=1)
+        bucket.acquire()
+        with self.assertRaises(RateLimitTimeout):
+            bucket.acquire(max_wait=0.01)
+        # Le jeton refusé n'a pas été réservé : l'attente suivante reste d'environ 1 / rate
+        self.assertAlmostEqual(bucket.acquire(), 0.1, delta=0.02)
+
+    def test_penalize(self):
+        bucket = TokenBucket(self.path, rate=10, burst=5)
+        bucket.penalize(2)
+        with self.assertRaises(RateLimitTimeout):
+            bucket.acquire(max_wait=1)
+        self.assertAlmostEqual(bucket.acquire(), 2.1, delta=0.05)
+
+    def test_without_fcntl(self):
+        with patch.object(esl_rate_limit, "fcntl", None):
+            bucket = TokenBucket(self.path, rate=10, burst=1)
+            self.assertEqual(bucket.acquire(), 0.0)
+            self.assertAlmostEqual(bucket.acquire(), 0.1, delta=0.02)
+        self.assertFalse(os.path.exists(self.path))
+        esl_rate_limit._local_states.pop(self.path, None)
+
+    def test_call_raises_without_request(self):
+        params = {
+            "base_url": "http://rate-limit.test",
+            "token": "token",
+            "timeout": (1, 1),
+            "rate_limit": 1,
+            "rate_dir": self.rate_dir,
+            "rate_budget": "bulk",
+            "rate_max_wait": 0.1,
+        }
+        with patch.object(esl_api, "request") as request:
+            request.return_value.status_code = 200
+            esl_api.call(params, "ZK_sendItem", {})
+            with self.assertRaises(RateLimitTimeout):
+                esl_api.call(params, "ZK_sendItem", {})
+        self.assertEqual(request.call_count, 1)
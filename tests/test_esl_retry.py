@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Nouvelles tentatives et backoff des appels à l'API ESL (call_with_retry, retry_delay)."""
+from odoo.tests import tagged
+from odoo.tests.common import BaseCase
+from datetime import timedelta
+from unittest.mock import patch
+import requests
+from ..models import esl_api
+
+
+class FakeResponse:
+
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.elapsed = timedelta(seconds=0.5)
+
+
+PARAMS = {"max_retries": 2, "retry_backoff": 1.0}
+
+
+@tagged('post_install', '-at_install')
+class TestEslRetry(BaseCase):
+
+    def _call_with_retry(self, outcomes, attempts_log=None):
+        """Lance call_with_retry avec des réponses (ou exceptions) successives, sans attendre."""
+        outcomes = iter(outcomes)
+
+        def fake_call(*args, **kwargs):
+            outcome = next(outcomes)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        with patch.object(esl_api, "call", side_effect=fake_call) as call, \
+                patch.object(esl_api.time, "sleep") as sleep:
+            result = esl_api.call_with_retry(PARAMS, "ZK_sendItem", {}, attempts_log=attempts_log)
+        return result, call, sleep
+
+    def test_success_first_attempt(self):
+        (response, attempts), call, sleep = self._call_with_retry([FakeResponse(200)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(attempts, 1)
+        sleep.assert_not_called()
+
+    def test_transient_status_retried(self):
+        (response, attempts), call, sleep = self._call_with_retry([FakeResponse(503), FakeResponse(200)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(attempts, 2)
+        self.assertEqual(sleep.call_count, 1)
+
+    def test_exception_retried(self):
+        (response, attempts), call, sleep = self._call_with_retry([requests.Timeout(), FakeResponse(200)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(attempts, 2)
+
+    def test_non_transient_status_not_retried(self):
+        (response, attempts), call, sleep = self._call_with_retry([FakeResponse(400)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(attempts, 1)
+        sleep.assert_not_called()
+
+    def test_retries_exhausted_returns_last_response(self):
+        (response, attempts), call, sleep = self._call_with_retry([FakeResponse(502)] * 3)
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(attempts, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_retries_exhausted_reraises(self):
+        with self.assertRaises(requests.ConnectionError):
+            self._call_with_retry([requests.ConnectionError()] * 3)
+
+    def test_circuit_open_not_retried(self):
+        with self.assertRaises(esl_api.CircuitOpenError):
+            self._call_with_retry([esl_api.CircuitOpenError("ouvert"), FakeResponse(200)])
+
+    def test_attempts_log(self):
+        attempts_log = []
+        self._call_with_retry([FakeResponse(429), requests.Timeout(), FakeResponse(200)], attempts_log)
+        self.assertEqual([status for status, _duration in attempts_log], [429, None, 200])
+        self.assertEqual(attempts_log[0][1], 0.5)
+        self.assertGreaterEqual(attempts_log[1][1], 0.0)
+
+    def test_retry_delay_exponential(self):
+        for attempt in range(4):
+            delay = esl_api.retry_delay(attempt, 1.0)
+            self.assertGreaterEqual(delay, 2 ** attempt)
+            self.assertLessEqual(delay, 1.5 * 2 ** attempt)
+        self.assertEqual(esl_api.retry_delay(20, 1.0), esl_api.MAX_RETRY_DELAY)
+
+    def test_retry_delay_retry_after(self):
+        self.assertEqual(esl_api.retry_delay(0, 1.0, FakeResponse(429, {"Retry-After": "7"})), 7)
+        self.assertEqual(
+            esl_api.retry_delay(0, 1.0, FakeResponse(429, {"Retry-After": "3600"})), esl_api.MAX_RETRY_DELAY)
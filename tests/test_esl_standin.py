@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Injection d'erreurs du serveur local tools/esl_standin.py."""
+from odoo.tests import tagged
+from odoo.tests.common import BaseCase
+import requests
+from ..tools import esl_standin
+
+
+@tagged('post_install', '-at_install')
+class TestEslStandin(BaseCase):
+
+    def _start(self, **config):
+        server = esl_standin.start_server(config=esl_standin.StandinConfig(check_token=False, **config))
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_first_request_succeeds(self):
+        server = self._start(burst_every=10, burst_length=3, burst_status=503)
+        response = requests.get(server.base_url + esl_standin.API_PREFIX + "getPublicKey", timeout=5)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("-----BEGIN", response.text)
+
+    def test_burst_positions(self):
+        server = self._start(burst_every=10, burst_length=3, burst_status=503)
+        faults = [server.next_fault() for _i in range(20)]
+        failing = [position for position, status in enumerate(faults, start=1) if status]
+        self.assertEqual(failing, [7, 8, 9, 17, 18, 19])
+        self.assertEqual({faults[p - 1] for p in failing}, {503})
+        self.assertEqual(server.stats["injected_errors"], 6)
+
+    def test_no_fault_by_default(self):
+        server = self._start()
+        self.assertFalse(any(server.next_fault() for _i in range(50)))
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Découpage d'un envoi en partitions et réservation des partitions par les workers."""
+from odoo.tests import TransactionCase, tagged
+from datetime import timedelta
+from unittest.mock import patch
+
+
+@tagged('post_install', '-at_install')
+class TestEslSyncPartition(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.esl = cls.env.ref('module_HpharmaESLSystem.default_esl_config')
+        cls.Partition = cls.env['esl.sync.partition']
+        cls.Partition.search([("state", "=", 'queued')]).write({"state": 'done'})
+
+    def setUp(self):
+        super().setUp()
+        # _claim_next valide sa réservation : la transaction de test ne doit pas l'être
+        commit_patcher = patch.object(type(self.env.cr), "commit")
+        commit_patcher.start()
+        self.addCleanup(commit_patcher.stop)
+
+    def _new_run(self, product_ids, size):
+        run = self.env['esl.sync.run'].create({"esl_id": self.esl.id, "partitioned": True})
+        run._create_partitions(product_ids, size)
+        return run
+
+    def _claim(self):
+        self.env.flush_all()
+        return self.Partition._claim_next()
+
+    def test_create_partitions(self):
+        run = self._new_run([3, 5, 8, 13, 21], 2)
+        partitions = run.partition_ids.sorted("sequence")
+        self.assertEqual(run.partition_count, 3)
+        self.assertEqual(partitions.mapped("sequence"), [1, 2, 3])
+        self.assertEqual([(p.id_from, p.id_to) for p in partitions], [(3, 5), (8, 13), (21, 21)])
+        self.assertEqual(partitions.mapped("product_count"), [2, 2, 1])
+        self.assertTrue(all(p.state == 'queued' for p in partitions))
+
+    def test_claim_in_sequence(self):
+        run = self._new_run([1, 2, 3, 4], 2)
+        first = self._claim()
+        self.assertEqual(first.sequence, 1)
+        self.assertEqual(first.state, 'running')
+        self.assertEqual(first.attempts, 1)
+        self.assertTrue(first.date_start)
+        second = self._claim()
+        self.assertEqual(second.sequence, 2)
+        self.assertNotEqual(first, second)
+        self.assertFalse(self._claim())
+        self.assertEqual(run.partition_ids, first | second)
+
+    def test_runs_take_turns(self):
+        run_a = self._new_run([1, 2, 3, 4], 2)
+        run_b = self._new_run([1, 2, 3, 4], 2)
+        claimed = [self._claim() for _i in range(4)]
+        self.assertEqual([p.run_id for p in claimed], [run_a, run_b, run_a, run_b])
+        self.assertEqual([p.sequence for p in claimed], [1, 1, 2, 2])
+
+    def test_api_down_waits(self):
+        self._new_run([1, 2], 2)
+        self.esl.write({
+            "api_health": 'down',
+            "api_retry_at": self.env.cr.now() + timedelta(minutes=5),
+        })
+        self.assertFalse(self._claim())
+        self.esl.api_retry_at = self.env.cr.now() - timedelta(minutes=1)
+        self.assertTrue(self._claim())
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""
+Serveur local imitant l'API ESL Hpharma, pour les tests de charge et le développement.
+
+Implémente getPublicKey, getToken, ZK_sendItem, ZK_getStoreId, ZK_getTemplate,
+ZK_bindSingleESL, ZK_bindMultiESL et ZK_unbindESL sous /api-esl/, avec une
+latence, des erreurs et des limites de taille configurables.
+
+Utilisation :
+
+    python3 tools/esl_standin.py --port 8099 --latency 50 --item-latency 0.2 \\
+        --error-rate 0.01 --burst-every 200 --burst-length 20 --burst-status 429
+
+puis, sur la connexion ESL, renseigner « URL de l'API ESL » : http://127.0.0.1:8099
+
+GET /stats renvoie les compteurs du serveur (requêtes, erreurs injectées, articles reçus).
+"""
+import argparse
+import base64
+import gzip
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+_logger = logging.getLogger(__name__)
+
+API_PREFIX = "/api-esl/"
+# Endpoints appelés sans token (Authorization)
+PUBLIC_ENDPOINTS = {"getPublicKey", "getToken"}
+
+
+class StandinConfig:
+    """
+    Comportement du serveur.
+
+    Paramètres:
+        latency (float): latence de base de chaque réponse, en ms
+        jitter (float): variation aléatoire de la latence (+/-), en ms
+        item_latency (float): latence ajoutée par article reçu par ZK_sendItem, en ms
+        error_rate (float): probabilité (0-1) de répondre error_status
+        error_status (int): code HTTP des erreurs aléatoires
+        burst_every (int): une rafale d'erreurs toutes les N requêtes (0 = jamais) ; la
+            rafale occupe la fin de chaque tranche de N, jamais les premières requêtes
+            d'un envoi (connexion)
+        burst_length (int): nombre de requêtes en erreur par rafale
+        burst_status (int): code HTTP des rafales (429, 503...)
+        retry_after (int): en-tête Retry-After des réponses 429/503, en secondes (0 = absent)
+        max_bytes (int): taille maximale d'un corps de requête, sinon 413 (0 = illimitée)
+        max_items (int): nombre maximal d'articles par ZK_sendItem, sinon 413 (0 = illimité)
+        stores (int): nombre de stores renvoyés par ZK_getStoreId
+        templates (int): nombre de templates renvoyés par ZK_getTemplate
+        check_token (bool): refuse (401) les appels sans le token délivré par getToken
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, item_latency=0.0, error_rate=0.0, error_status=500,
+                 burst_every=0, burst_length=0, burst_status=429, retry_after=0, max_bytes=0, max_items=0,
+                 stores=1, templates=3, check_token=True):
+        self.latency = latency
+        self.jitter = jitter
+        self.item_latency = item_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.burst_status = burst_status
+        self.retry_after = retry_after
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.stores = stores
+        self.templates = templates
+        self.check_token = check_token
+
+
+class StandinServer(ThreadingHTTPServer):
+    """Serveur HTTP multi-thread portant la configuration, la clé RSA et les compteurs."""
+
+    daemon_threads = True
+
+    def __init__(self, address, config=None):
+        super().__init__(address, StandinHandler)
+        self.config = config or StandinConfig()
+        self.lock = threading.Lock()
+        self.tokens = set()
+        self.stats = {
+            "requests": 0, "injected_errors": 0, "rejected": 0,
+            "items_received": 0, "bytes_received": 0, "by_endpoint": {},
+        }
+        self._private_key = None
+        self._public_pem = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def public_pem(self):
+        """Clé publique RSA (PEM), générée au premier appel (nécessite cryptography)."""
+        with self.lock:
+            if self._public_pem is None:
+                from cryptography.hazmat.primitives import serialization
+                from cryptography.hazmat.primitives.asymmetric import rsa
+                self._private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+                self._public_pem = self._private_key.public_key().public_bytes(
+                    serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+                )
+            return self._public_pem
+
+    def decrypt_password(self, encrypted_b64):
+        from cryptography.hazmat.primitives.asymmetric import padding
+        self.public_pem()
+        return self._private_key.decrypt(base64.b64decode(encrypted_b64), padding.PKCS1v15()).decode("utf-8")
+
+    def next_fault(self):
+        """
+        Compte la requête et retourne le code d'erreur à injecter (None si aucune).
+        """
+        config = self.config
+        with self.lock:
+            self.stats["requests"] += 1
+            position = self.stats["requests"]
+        status = None
+        if (config.burst_every and config.burst_length
+                and position % config.burst_every >= config.burst_every - config.burst_length):
+            status = config.burst_status
+        elif config.error_rate and random.random() < config.error_rate:
+            status = config.error_status
+        if status:
+            with self.lock:
+                self.stats["injected_errors"] += 1
+        return status
+
+    def count(self, endpoint, items=0, size=0):
+        with self.lock:
+            self.stats["by_endpoint"][endpoint] = self.stats["by_endpoint"].get(endpoint, 0) + 1
+            self.stats["items_received"] += items
+            self.stats["bytes_received"] += size
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        _logger.debug("esl_standin: " + format, *args)
+
+    # -------------------------------------------------------------
+    #                  RÉPONSES
+    # -------------------------------------------------------------
+    def _reply(self, status, data=None, text=None, headers=None):
+        body = text.encode("utf-8") if text is not None else json.dumps(data or {}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain" if text is not None else "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _fail(self, status, message):
+        headers = {}
+        if status in (429, 503) and self.server.config.retry_after:
+            headers["Retry-After"] = str(self.server.config.retry_after)
+        with self.server.lock:
+            self.server.stats["rejected"] += 1
+        self._reply(status, {"code": status, "message": message}, headers=headers)
+
+    def _sleep(self, items=0):
+        config = self.server.config
+        delay = config.latency + random.uniform(-config.jitter, config.jitter) + items * config.item_latency
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if self.headers.get("Content-Encoding") == "gzip":
+            raw = gzip.decompress(raw)
+        return raw
+
+    # -------------------------------------------------------------
+    #                  ROUTAGE
+    # -------------------------------------------------------------
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.server.lock:
+                return self._reply(200, self.server.stats)
+        self._dispatch(b"")
+
+    def do_POST(self):
+        try:
+            raw = self._read_body()
+        except (OSError, ValueError):
+            return self._fail(400, "Corps de requête illisible")
+        self._dispatch(raw)
+
+    def _dispatch(self, raw):
+        config = self.server.config
+        if not self.path.startswith(API_PREFIX):
+            return self._fail(404, "Endpoint inconnu")
+        endpoint = self.path[len(API_PREFIX):].split("?")[0]
+        handler = getattr(self, f"_ep_{endpoint}", None)
+        if handler is None:
+            return self._fail(404, f"Endpoint inconnu : {endpoint}")
+        if config.max_bytes and len(raw) > config.max_bytes:
+            self._sleep()
+            return self._fail(413, f"Requête trop volumineuse ({len(raw)} octets)")
+        if (config.check_token and endpoint not in PUBLIC_ENDPOINTS
+                and self.headers.get("Authorization") not in self.server.tokens):
+            return self._fail(401, "Token invalide")
+        try:
+            data = json.loads(raw) if raw else {}
+        except ValueError:
+            return self._fail(400, "JSON invalide")
+        fault = self.server.next_fault()
+        if fault:
+            self._sleep()
+            return self._fail(fault, "Erreur injectée par le serveur de test")
+        handler(data, len(raw))
+
+    # -------------------------------------------------------------
+    #                  ENDPOINTS
+    # -------------------------------------------------------------
+    def _ep_getPublicKey(self, data, size):
+        self.server.count("getPublicKey")
+        self._sleep()
+        self._reply(200, text=self.server.public_pem().decode("ascii"))
+
+    def _ep_getToken(self, data, size):
+        self.server.count("getToken", size=size)
+        try:
+            self.server.decrypt_password(data.get("password", ""))
+        except Exception:
+            self._sleep()
+            return self._fail(403, "Mot de passe non déchiffrable")
+        token = uuid.uuid4().hex
+        with self.server.lock:
+            self.server.tokens.add(token)
+        self._sleep()
+        self._reply(200, {"code": 200, "data": {"token": token, "agencyId": "standin", "merchantId": "standin"}})
+
+    def _ep_ZK_sendItem(self, data, size):
+        items = len(data.get("itemList") or [])
+        config = self.server.config
+        if config.max_items and items > config.max_items:
+            self._sleep()
+            return self._fail(413, f"Trop d'articles ({items})")
+        self.server.count("ZK_sendItem", items=items, size=size)
+        self._sleep(items)
+        self._reply(200, {"code": 200, "message": f"{items} articles reçus"})
+
+    def _ep_ZK_getStoreId(self, data, size):
+        self.server.count("ZK_getStoreId", size=size)
+        self._sleep()
+        stores = [{"storeId": 1000 + i, "storeName": f"Store test {i + 1}"} for i in range(self.server.config.stores)]
+        self._reply(200, {"code": 200, "data": stores})
+
+    def _ep_ZK_getTemplate(self, data, size):
+        self.server.count("ZK_getTemplate", size=size)
+        self._sleep()
+        content = [{
+            "id": 5000 + i,
+            "templateNumber": f"T{i + 1:03d}",
+            "templateName": f"Template test {i + 1}",
+            "size": "2.9",
+            "resolution": "296x128",
+            "hardwareStr": "3",
+            "itemNum": 1 + i % 3,
+            "tempPicUrl": "",
+            "isEnable": True,
+        } for i in range(self.server.config.templates)]
+        self._reply(200, {"code": 200, "data": {"content": content}})
+
+    def _ep_bind(self, endpoint, size):
+        self.server.count(endpoint, items=1, size=size)
+        self._sleep()
+        self._reply(200, {"code": 200, "message": "ok"})
+
+    def _ep_ZK_bindSingleESL(self, data, size):
+        self._ep_bind("ZK_bindSingleESL", size)
+
+    def _ep_ZK_bindMultiESL(self, data, size):
+        self._ep_bind("ZK_bindMultiESL", size)
+
+    def _ep_ZK_unbindESL(self, data, size):
+        self._ep_bind("ZK_unbindESL", size)
+
+
+def start_server(host="127.0.0.1", port=0, config=None):
+    """
+    Démarre le serveur dans un thread (utilisé par les tests et benchmarks).
+
+    Retour:
+        StandinServer: serveur démarré (arrêt : server.shutdown())
+    """
+    server = StandinServer((host, port), config)
+    threading.Thread(target=server.serve_forever, daemon=True, name="esl_standin").start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur local imitant l'API ESL Hpharma.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.0, help="latence de base (ms)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="variation de latence (ms)")
+    parser.add_argument("--item-latency", type=float, default=0.0, help="latence par article ZK_sendItem (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probabilité d'erreur (0-1)")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--burst-every", type=int, default=0, help="rafale d'erreurs toutes les N requêtes")
+    parser.add_argument("--burst-length", type=int, default=0, help="requêtes en erreur par rafale")
+    parser.add_argument("--burst-status", type=int, default=429)
+    parser.add_argument("--retry-after", type=int, default=0, help="en-tête Retry-After (s) des 429/503")
+    parser.add_argument("--max-bytes", type=int, default=0, help="taille maximale d'une requête (octets)")
+    parser.add_argument("--max-items", type=int, default=0, help="articles maximum par ZK_sendItem")
+    parser.add_argument("--stores", type=int, default=1)
+    parser.add_argument("--templates", type=int, default=3)
+    parser.add_argument("--no-token-check", action="store_true", help="accepte les appels sans token valide")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    config = StandinConfig(
+        latency=args.latency, jitter=args.jitter, item_latency=args.item_latency,
+        error_rate=args.error_rate, error_status=args.error_status,
+        burst_every=args.burst_every, burst_length=args.burst_length, burst_status=args.burst_status,
+        retry_after=args.retry_after, max_bytes=args.max_bytes, max_items=args.max_items,
+        stores=args.stores, templates=args.templates, check_token=not args.no_token_check,
+    )
+    server = StandinServer((args.host, args.port), config)
+    _logger.info("Serveur ESL de test sur %s (URL de l'API ESL à configurer dans Odoo).", server.base_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        _logger.info("Statistiques : %s", json.dumps(server.stats))
+
+
+if __name__ == "__main__":
+    main()